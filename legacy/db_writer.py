@@ -1,12 +1,31 @@
 # db_writer.py
 from __future__ import annotations
 
+import io
 import os
+import threading
+import weakref
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-import psycopg2
-from psycopg2.extras import Json
+from psycopg2.extras import Json as _PgJson, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _orjson_dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode("utf-8")
+
+
+def Json(obj: Any) -> _PgJson:
+    """psycopg2 Json adapter; serializuje przez orjson, jeśli jest zainstalowany."""
+    if orjson is not None:
+        return _PgJson(obj, dumps=_orjson_dumps)
+    return _PgJson(obj)
 
 
 @dataclass
@@ -17,6 +36,7 @@ class DbConfig:
     user: str
     password: Optional[str] = None
     schema: str = "genealogy"
+    max_conn: int = 4
 
 
 def db_config_from_env() -> DbConfig:
@@ -27,9 +47,52 @@ def db_config_from_env() -> DbConfig:
         user=os.environ.get("PGUSER", "tomaasz"),
         password=os.environ.get("PGPASSWORD") or None,
         schema=os.environ.get("PGSCHEMA", "genealogy"),
+        max_conn=int(os.environ.get("OCR_DB_POOL_MAX", "4")),
     )
 
 
+# Jedna pula połączeń na proces: kolejne MinimalDbWriter (np. per plik)
+# pożyczają gotowe połączenie zamiast robić nowy TCP/auth handshake.
+_POOL: Optional[ThreadedConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+# Połączenia z puli, na których wykonano już PREPARE (prepared statements są per sesja).
+_PREPARED_CONNS: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_field(v: Optional[str]) -> str:
+    """Pole w formacie tekstowym COPY (NULL = \\N)."""
+    return "\\N" if v is None else v.translate(_COPY_ESCAPES)
+
+
+def _get_pool(cfg: DbConfig) -> ThreadedConnectionPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None or _POOL.closed:
+            _POOL = ThreadedConnectionPool(
+                minconn=1,
+                maxconn=cfg.max_conn,
+                host=cfg.host,
+                port=cfg.port,
+                dbname=cfg.dbname,
+                user=cfg.user,
+                password=cfg.password,
+            )
+        return _POOL
+
+
+def close_pool() -> None:
+    """Zamyka wszystkie połączenia puli (na koniec runu)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None and not _POOL.closed:
+            _POOL.closeall()
+        _POOL = None
+
+
 class MinimalDbWriter:
     """
     Minimalny zapis end-to-end:
@@ -40,22 +103,66 @@ class MinimalDbWriter:
     def __init__(self, cfg: DbConfig):
         self.cfg = cfg
         self.conn = None
+        self._pool: Optional[ThreadedConnectionPool] = None
 
     def connect(self):
+        """Pożycza połączenie z puli na czas życia writera (do close())."""
         if self.conn and self.conn.closed == 0:
             return
-        self.conn = psycopg2.connect(
-            host=self.cfg.host,
-            port=self.cfg.port,
-            dbname=self.cfg.dbname,
-            user=self.cfg.user,
-            password=self.cfg.password,
-        )
+        if self.conn is not None and self._pool is not None and not self._pool.closed:
+            # zerwane połączenie wraca do puli (zamknięte), inaczej zajmuje slot do końca runu
+            self._pool.putconn(self.conn, close=True)
+            self.conn = None
+        self._pool = _get_pool(self.cfg)
+        self.conn = self._pool.getconn()
         self.conn.autocommit = False
+        self._prepare_statements()
+
+    def _prepare_statements(self):
+        """
+        PREPARE upsertu dokumentu raz na połączenie: kolejne upsert_document
+        robią tylko EXECUTE (bez ponownego parsowania/planowania SQL).
+        Prepared statements żyją w sesji, więc rollback ich nie usuwa.
+        """
+        if self.conn in _PREPARED_CONNS:
+            return
+        s = self.cfg.schema
+
+        sql = f"""
+        PREPARE ocr_doc_upsert
+          (text, text, text, text, float8, text, text, text, text, text, timestamptz, timestamptz) AS
+        INSERT INTO {s}.ocr_document
+          (source_path, file_name, source_sha256, doc_type, confidence, issues, pipeline, run_tag,
+           status, processing_by, processing_started_at, processing_finished_at, updated_at)
+        VALUES
+          ($1, $2, $3, $4, $5, $6, $7, $8,
+           $9, $10, $11, $12, now())
+        ON CONFLICT (source_path)
+        DO UPDATE SET
+          file_name              = EXCLUDED.file_name,
+          source_sha256          = EXCLUDED.source_sha256,
+          doc_type               = EXCLUDED.doc_type,
+          confidence             = EXCLUDED.confidence,
+          issues                 = EXCLUDED.issues,
+          pipeline               = EXCLUDED.pipeline,
+          run_tag                = EXCLUDED.run_tag,
+          status                 = EXCLUDED.status,
+          processing_by          = EXCLUDED.processing_by,
+          processing_started_at  = EXCLUDED.processing_started_at,
+          processing_finished_at = EXCLUDED.processing_finished_at,
+          updated_at             = now()
+        RETURNING doc_id
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(sql)
+        self.conn.commit()
+        _PREPARED_CONNS.add(self.conn)
 
     def close(self):
-        if self.conn and self.conn.closed == 0:
-            self.conn.close()
+        """Oddaje połączenie do puli (niezacommitowana transakcja jest wycofywana)."""
+        if self.conn is not None and self._pool is not None and not self._pool.closed:
+            self._pool.putconn(self.conn, close=bool(self.conn.closed))
+        self.conn = None
 
     def commit(self):
         if self.conn:
@@ -82,31 +189,8 @@ class MinimalDbWriter:
         processing_finished_at=None,
     ) -> int:
         self.connect()
-        s = self.cfg.schema
 
-        sql = f"""
-        INSERT INTO {s}.ocr_document
-          (source_path, file_name, source_sha256, doc_type, confidence, issues, pipeline, run_tag,
-           status, processing_by, processing_started_at, processing_finished_at, updated_at)
-        VALUES
-          (%s, %s, %s, %s, %s, %s, %s, %s,
-           %s, %s, %s, %s, now())
-        ON CONFLICT (source_path)
-        DO UPDATE SET
-          file_name              = EXCLUDED.file_name,
-          source_sha256          = EXCLUDED.source_sha256,
-          doc_type               = EXCLUDED.doc_type,
-          confidence             = EXCLUDED.confidence,
-          issues                 = EXCLUDED.issues,
-          pipeline               = EXCLUDED.pipeline,
-          run_tag                = EXCLUDED.run_tag,
-          status                 = EXCLUDED.status,
-          processing_by          = EXCLUDED.processing_by,
-          processing_started_at  = EXCLUDED.processing_started_at,
-          processing_finished_at = EXCLUDED.processing_finished_at,
-          updated_at             = now()
-        RETURNING doc_id
-        """
+        sql = "EXECUTE ocr_doc_upsert (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
         with self.conn.cursor() as cur:
             cur.execute(
                 sql,
@@ -161,3 +245,209 @@ class MinimalDbWriter:
                 (doc_id, entry_no, entry_type, entry_date, location, entry_text, Json(entry_json)),
             )
             return int(cur.fetchone()[0])
+
+    def upsert_entries(
+        self,
+        *,
+        doc_id: int,
+        entries: List[Dict[str, Any]],
+        page_size: int = 500,
+    ) -> List[int]:
+        """
+        Bulk wariant upsert_entry: wszystkie wpisy dokumentu w jednym INSERT
+        (execute_values, max page_size wierszy na round trip).
+        Każdy wpis: entry_no, entry_json, opcjonalnie entry_text/entry_type/entry_date/location.
+        entry_no muszą być unikalne w obrębie jednego wywołania.
+        Zwraca entry_id w kolejności `entries`.
+        """
+        if not entries:
+            return []
+
+        self.connect()
+        s = self.cfg.schema
+
+        sql = f"""
+        INSERT INTO {s}.ocr_entry
+          (doc_id, entry_no, entry_type, entry_date, location, entry_text, entry_json)
+        VALUES %s
+        ON CONFLICT (doc_id, entry_no)
+        DO UPDATE SET
+          entry_type = EXCLUDED.entry_type,
+          entry_date = EXCLUDED.entry_date,
+          location   = EXCLUDED.location,
+          entry_text = EXCLUDED.entry_text,
+          entry_json = EXCLUDED.entry_json
+        RETURNING entry_id
+        """
+        rows = [
+            (
+                doc_id,
+                e["entry_no"],
+                e.get("entry_type"),
+                e.get("entry_date"),
+                e.get("location"),
+                e.get("entry_text"),
+                Json(e["entry_json"]),
+            )
+            for e in entries
+        ]
+        with self.conn.cursor() as cur:
+            result = execute_values(
+                cur,
+                sql,
+                rows,
+                template="(%s, %s, %s, %s, %s, %s, %s)",
+                page_size=page_size,
+                fetch=True,
+            )
+            return [int(r[0]) for r in result]
+
+    def _document_with_entries_sql(self, cur, doc: Dict[str, Any], entries: List[Dict[str, Any]]) -> str:
+        """
+        SQL (już zmogryfikowany) dla jednego dokumentu i jego wpisów: EXECUTE ocr_doc_upsert
+        i INSERT wpisów jako dwa polecenia; doc_id wpisów brany z upsertowanego wiersza (source_path).
+        """
+        s = self.cfg.schema
+
+        doc_params = (
+            doc["source_path"],
+            doc["file_name"],
+            doc.get("source_sha256"),
+            doc.get("doc_type", "unknown"),
+            doc.get("confidence"),
+            doc.get("issues"),
+            doc.get("pipeline", "two-step"),
+            doc.get("run_tag"),
+            doc.get("status"),
+            doc.get("processing_by"),
+            doc.get("processing_started_at"),
+            doc.get("processing_finished_at"),
+        )
+
+        doc_sql = cur.mogrify(
+            "EXECUTE ocr_doc_upsert (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            doc_params,
+        ).decode()
+        doc_id_sql = cur.mogrify(
+            f"(SELECT doc_id FROM {s}.ocr_document WHERE source_path = %s)",
+            (doc["source_path"],),
+        ).decode().replace("%", "%%")  # reused below as a mogrify template
+        values_sql = ",\n".join(
+            cur.mogrify(
+                f"({doc_id_sql}, %s, %s, %s, %s, %s, %s)",
+                (
+                    e["entry_no"],
+                    e.get("entry_type"),
+                    e.get("entry_date"),
+                    e.get("location"),
+                    e.get("entry_text"),
+                    Json(e["entry_json"]),
+                ),
+            ).decode()
+            for e in entries
+        )
+
+        return f"""
+            {doc_sql};
+            INSERT INTO {s}.ocr_entry
+              (doc_id, entry_no, entry_type, entry_date, location, entry_text, entry_json)
+            VALUES
+              {values_sql}
+            ON CONFLICT (doc_id, entry_no)
+            DO UPDATE SET
+              entry_type = EXCLUDED.entry_type,
+              entry_date = EXCLUDED.entry_date,
+              location   = EXCLUDED.location,
+              entry_text = EXCLUDED.entry_text,
+              entry_json = EXCLUDED.entry_json
+            RETURNING doc_id, entry_id
+            """
+
+    def write_document_with_entries(
+        self,
+        *,
+        doc: Dict[str, Any],
+        entries: List[Dict[str, Any]],
+    ) -> Tuple[int, List[int]]:
+        """
+        Dokument + jego wpisy w jednym round tripie: EXECUTE ocr_doc_upsert
+        i INSERT wpisów idą jednym execute() (dwa polecenia SQL), a doc_id
+        dla wpisów jest brany z właśnie upsertowanego wiersza (source_path).
+        `doc` ma klucze jak argumenty upsert_document; `entries` jak w upsert_entries.
+        Zwraca (doc_id, [entry_id...]) w kolejności `entries`.
+        """
+        if not entries:
+            return self.upsert_document(**doc), []
+
+        self.connect()
+        with self.conn.cursor() as cur:
+            cur.execute(self._document_with_entries_sql(cur, doc, entries))
+            rows = cur.fetchall()
+
+        return int(rows[0][0]), [int(r[1]) for r in rows]
+
+    def write_documents_with_entries(
+        self,
+        items: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]],
+    ) -> None:
+        """
+        Wiele par (doc, entries) jednym execute() – do zapisu paczkami.
+        Nie zwraca id (psycopg2 oddaje wynik tylko ostatniego polecenia).
+        Każda para musi mieć co najmniej jeden wpis.
+        """
+        if not items:
+            return
+
+        self.connect()
+        with self.conn.cursor() as cur:
+            cur.execute(";\n".join(self._document_with_entries_sql(cur, doc, entries) for doc, entries in items))
+
+    def register_documents(
+        self,
+        rows: Iterable[Tuple[str, str, Optional[str]]],
+        *,
+        doc_type: str = "unknown",
+        pipeline: str = "two-step",
+        run_tag: Optional[str] = None,
+        chunk_rows: int = 5000,
+    ) -> int:
+        """
+        Masowa rejestracja plików (source_path, file_name, source_sha256) bez OCR:
+        COPY do tabeli tymczasowej, potem jeden INSERT ... ON CONFLICT (source_path) DO NOTHING,
+        więc istniejące dokumenty (także już przetworzone) zostają nietknięte.
+        Strumieniowo, po chunk_rows wierszy na COPY. Zwraca liczbę nowych dokumentów; commit na końcu.
+        """
+        self.connect()
+        s = self.cfg.schema
+
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS ocr_document_import "
+                "(source_path text, file_name text, source_sha256 text) ON COMMIT DROP"
+            )
+            buf = io.StringIO()
+            n = 0
+            for source_path, file_name, sha in rows:
+                buf.write(f"{_copy_field(source_path)}\t{_copy_field(file_name)}\t{_copy_field(sha)}\n")
+                n += 1
+                if n % chunk_rows == 0:
+                    buf.seek(0)
+                    cur.copy_expert("COPY ocr_document_import FROM STDIN", buf)
+                    buf = io.StringIO()
+            if buf.tell():
+                buf.seek(0)
+                cur.copy_expert("COPY ocr_document_import FROM STDIN", buf)
+
+            cur.execute(
+                f"""
+                INSERT INTO {s}.ocr_document
+                  (source_path, file_name, source_sha256, doc_type, pipeline, run_tag, updated_at)
+                SELECT DISTINCT ON (source_path) source_path, file_name, source_sha256, %s, %s, %s, now()
+                FROM ocr_document_import
+                ON CONFLICT (source_path) DO NOTHING
+                """,
+                (doc_type, pipeline, run_tag),
+            )
+            inserted = cur.rowcount
+        self.conn.commit()
+        return inserted
@@ -1,32 +1,55 @@
 import os
+import sys
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional
 
-def _get_int(env_var: str, default: int) -> int:
+
+def _get_int(env_var: str, default: int, env: Optional[Mapping[str, str]] = None) -> int:
+    val = (os.environ if env is None else env).get(env_var)
+    if not val:
+        return default
     try:
-        val = os.getenv(env_var)
-        if val:
-            return int(val)
+        return int(val)
     except ValueError:
-        pass
-    return default
-
-# Centralized timeouts (in milliseconds)
-UI_TIMEOUTS = {
-    # Page load / navigation
-    "PAGE_LOAD": _get_int("GEMINI_TIMEOUT_PAGE_LOAD", 180_000),
-    "FIND_COMPOSER": _get_int("GEMINI_TIMEOUT_FIND_COMPOSER", 60_000),
-
-    # Upload & Attachment
-    "UPLOAD_OVERLAY": _get_int("GEMINI_TIMEOUT_UPLOAD_OVERLAY", 20_000),
-    "ATTACH_CONFIRM": _get_int("GEMINI_TIMEOUT_ATTACH_CONFIRM", 8_000),
-
-    # Prompt & Send
-    "PROMPT_PASTE": _get_int("GEMINI_TIMEOUT_PROMPT_PASTE", 10_000),
-    "SEND_CONFIRM": _get_int("GEMINI_TIMEOUT_SEND_CONFIRM", 30_000),
-
-    # Generation cycle
-    "GEN_APPEAR": _get_int("GEMINI_TIMEOUT_GEN_APPEAR", 20_000),
-    "GEN_DONE": _get_int("GEMINI_TIMEOUT_GEN_DONE", 240_000),
-
-    # Cleanup / Recovery
-    "CLEANUP_WAIT": _get_int("GEMINI_TIMEOUT_CLEANUP_WAIT", 5_000),
-}
+        print(f"WARN: nieprawidłowa wartość {env_var}={val!r}, używam domyślnej {default}", file=sys.stderr)
+        return default
+
+
+def build_ui_timeouts(env: Optional[Mapping[str, str]] = None) -> Dict[str, int]:
+    """Centralized timeouts (in milliseconds), z nadpisaniem przez GEMINI_TIMEOUT_* z `env`."""
+    return {
+        # Page load / navigation
+        "PAGE_LOAD": _get_int("GEMINI_TIMEOUT_PAGE_LOAD", 180_000, env),
+        "FIND_COMPOSER": _get_int("GEMINI_TIMEOUT_FIND_COMPOSER", 60_000, env),
+
+        # Upload & Attachment
+        "UPLOAD_OVERLAY": _get_int("GEMINI_TIMEOUT_UPLOAD_OVERLAY", 20_000, env),
+        "ATTACH_CONFIRM": _get_int("GEMINI_TIMEOUT_ATTACH_CONFIRM", 8_000, env),
+
+        # Prompt & Send
+        "PROMPT_PASTE": _get_int("GEMINI_TIMEOUT_PROMPT_PASTE", 10_000, env),
+        "SEND_CONFIRM": _get_int("GEMINI_TIMEOUT_SEND_CONFIRM", 30_000, env),
+
+        # Generation cycle
+        "GEN_APPEAR": _get_int("GEMINI_TIMEOUT_GEN_APPEAR", 20_000, env),
+        "GEN_DONE": _get_int("GEMINI_TIMEOUT_GEN_DONE", 240_000, env),
+
+        # Cleanup / Recovery
+        "CLEANUP_WAIT": _get_int("GEMINI_TIMEOUT_CLEANUP_WAIT", 5_000, env),
+    }
+
+
+def build_debug_dump(env: Optional[Mapping[str, str]] = None) -> Dict[str, int]:
+    """Debug dumps (dump_debug), z nadpisaniem przez GEMINI_DEBUG_* z `env`."""
+    return {
+        # 1 = zrzut całej strony (PNG, jak dawniej); 0 = tylko viewport jako JPEG
+        "FULL_PAGE": _get_int("GEMINI_DEBUG_FULL_PAGE", 0, env),
+        "JPEG_QUALITY": _get_int("GEMINI_DEBUG_JPEG_QUALITY", 70, env),
+        # 0 = bez zapisu page.content() (pełna serializacja DOM)
+        "HTML": _get_int("GEMINI_DEBUG_HTML", 1, env),
+    }
+
+
+# Wartości procesu – liczone raz przy imporcie, tylko do odczytu
+UI_TIMEOUTS: Mapping[str, int] = MappingProxyType(build_ui_timeouts())
+DEBUG_DUMP: Mapping[str, int] = MappingProxyType(build_debug_dump())
@@ -1,9 +1,18 @@
+import queue
+import sys
+import threading
 import time
 import json
-from dataclasses import dataclass, asdict
-from typing import Optional
+from dataclasses import dataclass
+from typing import Optional, TextIO
 
-@dataclass
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+@dataclass(slots=True)
 class DocumentMetrics:
     file_name: str
     start_ts: float
@@ -20,9 +29,85 @@ class DocumentMetrics:
         self.error_reason = error_reason
 
     def to_json(self) -> str:
-        return json.dumps(asdict(self))
+        # Płaski dict budowany wprost (bez rekurencyjnego asdict); orjson jeśli dostępny.
+        data = {
+            "file_name": self.file_name,
+            "start_ts": self.start_ts,
+            "end_ts": self.end_ts,
+            "duration_s": self.duration_s,
+            "attempts": self.attempts,
+            "outcome": self.outcome,
+            "error_reason": self.error_reason,
+        }
+        if HAS_ORJSON:
+            return orjson.dumps(data).decode("utf-8")
+        return json.dumps(data)
 
     def __str__(self) -> str:
-        err_str = f" | reason={self.error_reason}" if self.error_reason else ""
-        return (f"METRICS: file={self.file_name} | status={self.outcome} | "
-                f"attempts={self.attempts} | duration={self.duration_s}s{err_str}")
+        s = "".join((
+            "METRICS: file=", self.file_name,
+            " | status=", self.outcome,
+            " | attempts=", str(self.attempts),
+            " | duration=", str(self.duration_s), "s",
+        ))
+        if self.error_reason:
+            return s + " | reason=" + self.error_reason
+        return s
+
+
+class MetricsSink:
+    """
+    Zapis linii METRICS poza głównym wątkiem OCR: emit() tylko wrzuca do kolejki,
+    a wątek-daemon pisze do strumienia i robi flush co `flush_every` linii
+    albo gdy przez `flush_interval_s` nic nie przyszło.
+    """
+
+    _STOP = object()
+
+    def __init__(self, fh: Optional[TextIO] = None, flush_every: int = 64, flush_interval_s: float = 1.0):
+        self._fh = fh if fh is not None else sys.stdout
+        self._flush_every = flush_every
+        self._flush_interval_s = flush_interval_s
+        self._q: "queue.SimpleQueue[object]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._drain, name="metrics-sink", daemon=True)
+        self._thread.start()
+
+    def emit(self, metrics) -> None:
+        self._q.put_nowait(str(metrics))
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Dopisuje wszystko z kolejki i zatrzymuje wątek."""
+        if self._thread.is_alive():
+            self._q.put_nowait(self._STOP)
+            self._thread.join(timeout)
+
+    def _flush(self) -> None:
+        try:
+            self._fh.flush()
+        except Exception:
+            pass
+
+    def _drain(self) -> None:
+        pending = 0
+        while True:
+            try:
+                item = self._q.get(timeout=self._flush_interval_s)
+            except queue.Empty:
+                if pending:
+                    self._flush()
+                    pending = 0
+                continue
+
+            if item is self._STOP:
+                break
+
+            try:
+                self._fh.write(f"{item}\n")
+            except Exception:
+                continue
+            pending += 1
+            if pending >= self._flush_every:
+                self._flush()
+                pending = 0
+
+        self._flush()
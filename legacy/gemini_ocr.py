@@ -4,25 +4,33 @@
 from __future__ import annotations
 
 import argparse
+import atexit
 import hashlib
 import json
+import mmap
 import os
 import re
 import socket
+import stat
+import string
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Iterable, Optional, Tuple, Dict, Any
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Dict, Any
 from enum import Enum, auto
+from functools import lru_cache, partial
+from operator import attrgetter
 
 from playwright.sync_api import sync_playwright, Page, Locator, TimeoutError as PlaywrightTimeoutError
 
-from gemini_config import UI_TIMEOUTS
-from gemini_metrics import DocumentMetrics
+from gemini_config import DEBUG_DUMP, UI_TIMEOUTS
+from gemini_metrics import DocumentMetrics, MetricsSink
 
 # NEW: DB writer
 try:
-    from db_writer import MinimalDbWriter, db_config_from_env
+    from db_writer import MinimalDbWriter, close_pool, db_config_from_env
     HAS_DB = True
 except Exception:
     HAS_DB = False
@@ -62,31 +70,112 @@ def log(msg: str) -> None:
     print(f"[{ts()}] {msg}", flush=True)
 
 
+_METRICS_SINK: Optional[MetricsSink] = None
+
+
+def emit_metrics(metrics: DocumentMetrics) -> None:
+    """Linia METRICS (format jak log()) zapisywana w tle przez MetricsSink."""
+    global _METRICS_SINK
+    if _METRICS_SINK is None:
+        _METRICS_SINK = MetricsSink()
+    _METRICS_SINK.emit(f"[{ts()}] {metrics}")
+
+
+def close_metrics() -> None:
+    global _METRICS_SINK
+    if _METRICS_SINK is not None:
+        _METRICS_SINK.close()
+        _METRICS_SINK = None
+
+
 def ensure_dir(p: Optional[Path]) -> None:
     if p:
         p.mkdir(parents=True, exist_ok=True)
 
 
+# Zapis dumpów na dysk w tle: zrzut i HTML pobieramy synchronicznie (stan strony
+# w chwili błędu), ale pętla retry nie czeka na I/O.
+_DUMP_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def _dump_pool() -> ThreadPoolExecutor:
+    global _DUMP_POOL
+    if _DUMP_POOL is None:
+        _DUMP_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dump-debug")
+        atexit.register(close_dump_pool)
+    return _DUMP_POOL
+
+
+def close_dump_pool() -> None:
+    """Czeka na zaległe zapisy dumpów."""
+    global _DUMP_POOL
+    if _DUMP_POOL is not None:
+        _DUMP_POOL.shutdown(wait=True)
+        _DUMP_POOL = None
+
+
+def _write_dump_files(base: Path, shot: Optional[bytes], shot_ext: str, html: Optional[str]) -> None:
+    if shot is not None:
+        try:
+            base.with_name(base.name + shot_ext).write_bytes(shot)
+        except Exception:
+            pass
+    if html is not None:
+        try:
+            base.with_name(base.name + ".html").write_text(html, encoding="utf-8")
+        except Exception:
+            pass
+
+
+_TAG_SANITIZE_RX = re.compile(r"[^a-zA-Z0-9_.-]+")
+
+
 def dump_debug(page: Page, debug_dir: Optional[Path], tag: str) -> None:
     if not debug_dir:
         return
     ensure_dir(debug_dir)
     stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe = re.sub(r"[^a-zA-Z0-9_.-]+", "_", tag)[:120]
-    try:
-        page.screenshot(path=str(debug_dir / f"{stamp}_{safe}.png"), full_page=True)
-    except Exception:
-        pass
+    safe = _TAG_SANITIZE_RX.sub("_", tag)[:120]
+    shot = html = None
+    # Domyślnie viewport w JPEG: composer i ostatnia odpowiedź są widoczne, a zrzut
+    # jest wielokrotnie mniejszy i szybszy niż PNG całej (długiej) rozmowy.
+    full_page = bool(DEBUG_DUMP["FULL_PAGE"])
+    shot_ext = ".png" if full_page else ".jpg"
     try:
-        (debug_dir / f"{stamp}_{safe}.html").write_text(page.content(), encoding="utf-8")
+        if full_page:
+            shot = page.screenshot(full_page=True)
+        else:
+            shot = page.screenshot(type="jpeg", quality=DEBUG_DUMP["JPEG_QUALITY"])
     except Exception:
         pass
+    if DEBUG_DUMP["HTML"]:
+        try:
+            html = page.content()
+        except Exception:
+            pass
+    _dump_pool().submit(_write_dump_files, debug_dir / f"{stamp}_{safe}", shot, shot_ext, html)
+
+
+_HASH_CHUNK = 4 * 1024 * 1024
 
 
 def sha256_file(p: Path) -> str:
-    h = hashlib.sha256()
+    # source_sha256 w bazie musi pozostać SHA-256 (porównania między runami).
+    # hashlib.file_digest (3.11+) czyta do własnego bufora i liczy skrót bez GIL.
+    # Starsze Pythony: duże pliki mapujemy (mmap) i podajemy hasherowi w całości,
+    # bez kopiowania kolejnych kawałków do obiektów bytes.
     with p.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        h = hashlib.sha256()
+        if os.fstat(f.fileno()).st_size >= _HASH_CHUNK:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    h.update(mm)
+                return h.hexdigest()
+            except (ValueError, OSError):
+                h = hashlib.sha256()
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
             h.update(chunk)
     return h.hexdigest()
 
@@ -124,32 +213,105 @@ def get_prompt_text(prompts_json: dict, prompt_id: Optional[str]) -> str:
 # Files discovery
 # ----------------------------
 
-IMG_EXT = {".jpg", ".jpeg", ".png", ".webp"}
+IMG_EXT = frozenset({".jpg", ".jpeg", ".png", ".webp"})
+
+# Krotka do str.endswith na surowych nazwach DirEntry (bez tworzenia Path).
+_IMG_EXT_TUPLE = tuple(sorted(IMG_EXT))
+
+
+def _is_image_name(name: str) -> bool:
+    # sama ".jpg" nie ma sufiksu w sensie Path.suffix – pomijamy jak wcześniej
+    lname = name.lower()
+    return lname.endswith(_IMG_EXT_TUPLE) and lname not in IMG_EXT
+
+_entry_name = attrgetter("name")
 
 
 def iter_images(root: Path, recursive: bool) -> Iterable[Path]:
     if root.is_file():
-        if root.suffix.lower() in IMG_EXT:
+        if _is_image_name(root.name):
             yield root
         return
 
     if not root.exists():
         raise RuntimeError(f"Root nie istnieje: {root}")
 
-    def _scan(p: Path):
+    def _sorted_entries(p: str) -> Iterator[os.DirEntry]:
         try:
             with os.scandir(p) as it:
-                entries = sorted(list(it), key=lambda e: e.name)
-                for entry in entries:
-                    if entry.is_file():
-                        if Path(entry.name).suffix.lower() in IMG_EXT:
-                            yield Path(entry.path)
-                    elif entry.is_dir() and recursive:
-                        yield from _scan(Path(entry.path))
+                entries = list(it)
+            entries.sort(key=_entry_name)
+            return iter(entries)
         except OSError as e:
             log(f"Error scanning {p}: {e}")
+            return iter(())
+
+    # Jawny stos iteratorów zamiast rekurencji: ta sama kolejność (pre-order DFS),
+    # podkatalog jest skanowany dopiero gdy do niego dojdziemy, a przerwanie
+    # generatora po prostu porzuca stos.
+    stack = [_sorted_entries(str(root))]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+            continue
+        try:
+            if entry.is_file():
+                if _is_image_name(entry.name):
+                    yield Path(entry.path)
+            elif recursive and entry.is_dir():
+                stack.append(_sorted_entries(entry.path))
+        except OSError as e:
+            log(f"Error scanning {entry.path}: {e}")
 
-    yield from _scan(root)
+
+def _path_lines(src: str) -> Iterator[str]:
+    """
+    Linie z pliku albo stdin ('-'). FIFO jest otwierane ponownie po EOF: EOF przychodzi,
+    gdy zamknie się ostatni pisarz (np. `echo ścieżka > fifo`), a sesja ma czekać na kolejnych.
+    """
+    if src == "-":
+        yield from sys.stdin
+        return
+    path = os.path.expanduser(src)
+    is_fifo = stat.S_ISFIFO(os.stat(path).st_mode)
+    while True:
+        # open() na FIFO blokuje, dopóki nie pojawi się pisarz
+        with open(path, encoding="utf-8") as f:
+            yield from f
+        if not is_fifo:
+            return
+
+
+def iter_paths_from(src: str) -> Iterator[Path]:
+    """
+    Ścieżki obrazów po jednej w linii z pliku, FIFO albo stdin ('-'), czytane na bieżąco.
+    Pozwala trzymać jeden rozgrzany proces (przeglądarka + zalogowana sesja Gemini)
+    i dosyłać mu kolejne pliki zamiast uruchamiać skrypt od nowa dla każdej paczki.
+    Z FIFO czyta bez końca (kolejni pisarze), do przerwania procesu (Ctrl+C / SIGTERM).
+    """
+    for line in _path_lines(src):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        p = Path(os.path.expanduser(line)).resolve()
+        if not p.is_file():
+            log(f"WARN: pomijam (nie ma pliku): {p}")
+            continue
+        yield p
+
+
+def iter_shard(items: Iterable[Path], index: int, count: int) -> Iterator[Path]:
+    """
+    Co `count`-ty element począwszy od `index`. Kilka procesów (każdy z własnym
+    profilem przeglądarki) dostaje rozłączne części tego samego, posortowanego skanu.
+    """
+    if count <= 1:
+        yield from items
+        return
+    for i, item in enumerate(items):
+        if i % count == index:
+            yield item
 
 
 # ----------------------------
@@ -158,29 +320,79 @@ def iter_images(root: Path, recursive: bool) -> Iterable[Path]:
 
 GEMINI_URL = "https://gemini.google.com/app"
 
+# Wspólne selektory – te same napisy trafiają do lokatorów i do predykatów JS poniżej.
+SEL_COMPOSER = "div[contenteditable='true']"
+SEL_BUTTONS = "button, [role='button']"
+STOP_TEXT_RX_SRC = "Stop|Zatrzymaj|Anuluj|Cancel|Stop generating"
+SEL_STOP_TEXT = f"text=/{STOP_TEXT_RX_SRC}/i"
+SEL_STOP_ARIA = (
+    "button[aria-label*='Stop' i], button[aria-label*='Zatrzymaj' i], "
+    "button[aria-label*='Anuluj' i], button[aria-label*='Cancel' i]"
+)
+SEL_SPINNER = "mat-spinner, [role='progressbar'], .spinner, .loading-indicator"
+SEL_MIC = (
+    "button[aria-label='Mikrofon'], button[aria-label='Microphone'], "
+    "[role='button'][aria-label='Mikrofon'], [role='button'][aria-label='Microphone']"
+)
+SEL_ANSWER = "[data-test-id*='response' i], [data-testid*='response' i], .response-container, .markdown, message-content"
+SEL_ATTACH = (
+    "img[src^='blob:'], img[src^='data:'], "
+    "[data-testid*='attach' i], [data-test-id*='attach' i], "
+    "[data-testid*='upload' i], [data-test-id*='upload' i], "
+    "[class*='attachment' i], [class*='upload' i]"
+)
+SEL_REMOVE = (
+    "button[aria-label='Usuń plik'], button[aria-label='Remove file'], "
+    "button:has-text('Usuń'), button:has-text('Remove'), .remove-attachment"
+)
+SEL_NEW_CHAT = (
+    "[data-test-id='new-chat-button'] button, [data-testid='new-chat'], "
+    "button[aria-label*='New chat' i], a[aria-label*='New chat' i], "
+    "button[aria-label*='Nowy czat' i], a[aria-label*='Nowy czat' i]"
+)
+
+
+def _js_str(sel: str) -> str:
+    return json.dumps(sel, ensure_ascii=False)
+
 
 def goto_gemini(page: Page, timeout_ms: int, debug_dir: Optional[Path]) -> None:
     log(f"Otwieram: {GEMINI_URL}")
     page.goto(GEMINI_URL, wait_until="domcontentloaded", timeout=timeout_ms)
-    page.wait_for_timeout(600)
     try:
         _ = find_composer(page, timeout_ms=UI_TIMEOUTS["FIND_COMPOSER"])
     except Exception:
         dump_debug(page, debug_dir, "after_open_no_composer")
 
 
-def find_composer(page: Page, timeout_ms: int = UI_TIMEOUTS["FIND_COMPOSER"]) -> Locator:
-    t0 = time.time()
-    last_err = None
-    while (time.time() - t0) * 1000 < timeout_ms:
+def reload_gemini(
+    page: Page,
+    timeout_ms: int,
+    debug_dir: Optional[Path],
+    attempts: int = 3,
+    base_delay_s: float = 1.0,
+) -> None:
+    """goto_gemini z wykładniczym backoffem (1s, 2s, ...) przy błędach nawigacji."""
+    for attempt in range(1, attempts + 1):
         try:
-            loc = page.locator("div[contenteditable='true']").first
-            if loc.count() and loc.is_visible():
-                return loc
+            goto_gemini(page, timeout_ms=timeout_ms, debug_dir=debug_dir)
+            return
         except Exception as e:
-            last_err = e
-        page.wait_for_timeout(200)
-    raise RuntimeError(f"Nie znalazłem pola wpisywania (composer). last_err={last_err!r}")
+            if attempt >= attempts:
+                raise
+            delay = base_delay_s * (2 ** (attempt - 1))
+            log(f"reload: błąd nawigacji ({e}), ponawiam za {delay:.0f}s ({attempt}/{attempts})")
+            time.sleep(delay)
+
+
+def find_composer(page: Page, timeout_ms: int = UI_TIMEOUTS["FIND_COMPOSER"]) -> Locator:
+    # locator.wait_for czeka po stronie przeglądarki – wraca od razu, gdy composer się pokaże.
+    loc = page.locator(SEL_COMPOSER).first
+    try:
+        loc.wait_for(state="visible", timeout=timeout_ms)
+    except Exception as e:
+        raise RuntimeError(f"Nie znalazłem pola wpisywania (composer). last_err={e!r}")
+    return loc
 
 
 def _composer_root(page: Page) -> Locator:
@@ -200,16 +412,150 @@ def _composer_root(page: Page) -> Locator:
     return page.locator("body")
 
 
-def _tooltip_visible(page: Page, text_regex: str) -> bool:
+def _tooltip_visible(page: Page, text_rx: re.Pattern) -> bool:
     loc = page.locator(
         "div[role='tooltip'], .mat-mdc-tooltip, .mdc-tooltip__surface, .cdk-overlay-container"
-    ).filter(has_text=re.compile(text_regex, re.I))
+    ).filter(has_text=text_rx)
     try:
         return loc.first.is_visible()
     except Exception:
         return False
 
 
+# ----------------------------
+# In-page predicates (jeden page.evaluate zamiast wielu count()/is_visible())
+# ----------------------------
+
+_JS_HELPERS = r"""
+    const visible = (el) => {
+        if (!el) return false;
+        const r = el.getBoundingClientRect();
+        return r.width > 0 && r.height > 0 && getComputedStyle(el).visibility !== 'hidden';
+    };
+    // Tekst w <script>/<style>/... nie jest treścią strony (lokatory text= go nie widzą).
+    const SKIP_TEXT_PARENTS = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE']);
+    const textMatch = (rx, accept) => {
+        const w = document.createTreeWalker(document.body || document.documentElement, NodeFilter.SHOW_TEXT);
+        for (let n = w.nextNode(); n; n = w.nextNode()) {
+            const p = n.parentElement;
+            if (!p || SKIP_TEXT_PARENTS.has(p.tagName)) continue;
+            if (rx.test(n.nodeValue) && accept(p)) return p;
+        }
+        return null;
+    };
+    // Pierwsze WIDOCZNE dopasowanie: ukryty węzeł wcześniej w DOM nie zasłania właściwego.
+    const firstVisibleTextMatch = (rx) => textMatch(rx, visible);
+    const anyButtonText = (words) => {
+        for (const el of document.querySelectorAll(""" + _js_str(SEL_BUTTONS) + r""")) {
+            const t = (el.textContent || '').toLowerCase();
+            if (words.some((w) => t.includes(w))) return true;
+        }
+        return false;
+    };
+"""
+
+# Odwzorowuje sygnały _is_analyzing_locators.
+_STOP_VISIBLE_EXPR = f"!!firstVisibleTextMatch(/{STOP_TEXT_RX_SRC}/i)"
+
+# Odwzorowuje sygnały _is_analyzing_locators.
+_ANALYZING_EXPR = f"""(
+        {_STOP_VISIBLE_EXPR} ||
+        visible(document.querySelector({_js_str(SEL_STOP_ARIA)})) ||
+        visible(document.querySelector({_js_str(SEL_SPINNER)}))
+    )"""
+
+# Odwzorowuje sygnały _is_attachment_present_locators.
+_ATTACHED_EXPR = f"""(
+        !!document.querySelector({_js_str(SEL_ATTACH)}) ||
+        anyButtonText(['usuń', 'remove']) ||
+        !!firstVisibleTextMatch(/plik|files|uploaded|załącz|zal[aą]cz/i)
+    )"""
+
+_ATTACH_JS = "() => {" + _JS_HELPERS + "    return " + _ATTACHED_EXPR + ";\n}"
+_ANALYZING_JS = "() => {" + _JS_HELPERS + "    return " + _ANALYZING_EXPR + ";\n}"
+
+
+# Start generowania po wysłaniu: 'stop' / 'answer' albo false.
+_SEND_STARTED_JS = "() => {" + _JS_HELPERS + r"""
+    if (""" + _STOP_VISIBLE_EXPR + r""") return 'stop';
+    if (document.querySelector(""" + _js_str(SEL_ANSWER) + r""")) return 'answer';
+    return false;
+}"""
+
+# Jak wyżej, ale odpowiedź rozpoznawana też po przyciskach oceny (👍/👎).
+_GEN_STARTED_JS = "() => {" + _JS_HELPERS + r"""
+    if (""" + _STOP_VISIBLE_EXPR + r""") return 'stop';
+    if (document.querySelector(""" + _js_str(SEL_ANSWER) + r""") || anyButtonText(['👍', '👎']))
+        return 'answer';
+    return false;
+}"""
+
+_GEN_STOPPED_JS = "() => {" + _JS_HELPERS + "    return !" + _STOP_VISIBLE_EXPR + ";\n}"
+
+# Gotowość do kolejnego skanu: 'mic' / 'composer' (i brak Stop) albo false.
+_READY_JS = "() => {" + _JS_HELPERS + r"""
+    if (""" + _STOP_VISIBLE_EXPR + r""") return false;
+    if (visible(document.querySelector(""" + _js_str(SEL_MIC) + r"""))) return 'mic';
+    if (visible(document.querySelector(""" + _js_str(SEL_COMPOSER) + r"""))) return 'composer';
+    return false;
+}"""
+
+
+_COMPOSER_HAS_TEXT_JS = "() => {" + r"""
+    const c = document.querySelector(""" + _js_str(SEL_COMPOSER) + r""");
+    return !!c && (c.innerText || '').trim().length > 0;
+}"""
+
+_COMPOSER_CLEARED_JS = "() => {" + r"""
+    const c = document.querySelector(""" + _js_str(SEL_COMPOSER) + r""");
+    return !c || (c.innerText || '').trim().length === 0;
+}"""
+
+# Miniatura i przyciski usuwania (część CSS z SEL_REMOVE) zniknęły.
+_ATTACH_REMOVED_JS = "() => !document.querySelector(" + _js_str(
+    "img[src^='blob:'], img[src^='data:'], "
+    "button[aria-label='Usuń plik'], button[aria-label='Remove file'], .remove-attachment"
+) + ")"
+
+
+# Błędy wait_for_function po nawigacji/przeładowaniu – wtedy czekanie ma sens wznowić.
+_JS_CONTEXT_LOST = (
+    "execution context was destroyed",
+    "cannot find context with specified id",
+)
+
+
+def _wait_for_js(page: Page, script: str, timeout_ms: int, poll_ms: int = 200) -> Any:
+    """
+    Czeka aż predykat JS zwróci wartość truthy i ją zwraca (None po timeoucie).
+    Predykat jest odpytywany w przeglądarce co poll_ms, bez round tripu na każdy tick.
+    Gdy kontekst strony zniknie w trakcie (np. nawigacja), czekanie jest wznawiane;
+    inne błędy (np. SyntaxError/ReferenceError w predykacie) idą od razu wyżej.
+    """
+    deadline = time.monotonic() + timeout_ms / 1000
+    while True:
+        remaining = int((deadline - time.monotonic()) * 1000)
+        if remaining <= 0:
+            return None
+        try:
+            return page.wait_for_function(script, timeout=remaining, polling=poll_ms).json_value()
+        except PlaywrightTimeoutError:
+            return None
+        except Exception as e:
+            msg = str(e).lower()
+            if not any(m in msg for m in _JS_CONTEXT_LOST):
+                raise
+            page.wait_for_timeout(min(poll_ms, remaining))
+
+
+def _eval_flag(page: Page, script: str) -> Optional[bool]:
+    """Wynik predykatu JS albo None, gdy evaluate nie zadziałało (wtedy fallback na lokatory)."""
+    try:
+        return bool(page.evaluate(script))
+    except Exception:
+        return None
+
+
 # ----------------------------
 # Attachment detection (FAST, multi-signal)
 # ----------------------------
@@ -218,7 +564,15 @@ def _is_attachment_present(page: Page) -> bool:
     """
     Wykrywa załącznik po wielu sygnałach. Nie opiera się wyłącznie o 'visible',
     bo Gemini bywa kapryśne (overlay, animacje, lazy render).
+    Wszystkie sygnały sprawdzane w przeglądarce jednym evaluate.
     """
+    flag = _eval_flag(page, _ATTACH_JS)
+    if flag is not None:
+        return flag
+    return _is_attachment_present_locators(page)
+
+
+def _is_attachment_present_locators(page: Page) -> bool:
     # (1) miniatura blob/data
     for sel in [
         "img[src^='blob:']",
@@ -270,35 +624,34 @@ def _is_attachment_present(page: Page) -> bool:
 
 def wait_attachment_fast(page: Page, timeout_ms: int = 8000, poll_ms: int = 200) -> bool:
     """
-    Krótki, reaktywny polling – jeśli UI pokaże załącznik szybko, idziemy dalej od razu.
+    Predykat sprawdzany w przeglądarce – jeśli UI pokaże załącznik szybko, idziemy dalej od razu.
     """
-    t0 = time.time()
-    while (time.time() - t0) * 1000 < timeout_ms:
-        if _is_attachment_present(page):
-            return True
-        page.wait_for_timeout(poll_ms)
-    return False
+    return bool(_wait_for_js(page, _ATTACH_JS, timeout_ms, poll_ms))
 
 
 def _is_analyzing(page: Page) -> bool:
-    stop_text = page.locator("text=/Stop|Zatrzymaj|Anuluj|Cancel|Stop generating/i")
+    flag = _eval_flag(page, _ANALYZING_JS)
+    if flag is not None:
+        return flag
+    return _is_analyzing_locators(page)
+
+
+def _is_analyzing_locators(page: Page) -> bool:
+    stop_text = page.locator(SEL_STOP_TEXT)
     try:
         if stop_text.count() > 0 and stop_text.first.is_visible():
             return True
     except Exception:
         pass
 
-    stop_aria = page.locator(
-        "button[aria-label*='Stop' i], button[aria-label*='Zatrzymaj' i], "
-        "button[aria-label*='Anuluj' i], button[aria-label*='Cancel' i]"
-    )
+    stop_aria = page.locator(SEL_STOP_ARIA)
     try:
         if stop_aria.count() > 0 and stop_aria.first.is_visible():
             return True
     except Exception:
         pass
 
-    spinners = page.locator("mat-spinner, [role='progressbar'], .spinner, .loading-indicator")
+    spinners = page.locator(SEL_SPINNER)
     try:
         if spinners.count() > 0 and spinners.first.is_visible():
             return True
@@ -308,14 +661,47 @@ def _is_analyzing(page: Page) -> bool:
     return False
 
 
+# Jeden round trip do przeglądarki zamiast kilkunastu count()/is_visible()/inner_text().
+_COMPOSER_STATE_JS = "() => {" + _JS_HELPERS + r"""
+    const comp = document.querySelector(""" + _js_str(SEL_COMPOSER) + r""");
+    return {
+        analyzing: """ + _ANALYZING_EXPR + """,
+        attached: """ + _ATTACHED_EXPR + r""",
+        composerVisible: visible(comp),
+        text: comp ? (comp.innerText || '') : '',
+    };
+}"""
+
+
+def _composer_state_snapshot(page: Page) -> Optional[Dict[str, Any]]:
+    try:
+        snap = page.evaluate(_COMPOSER_STATE_JS)
+    except Exception:
+        return None
+    return snap if isinstance(snap, dict) else None
+
+
 def get_composer_state(page: Page) -> ComposerState:
-    if _is_analyzing(page):
+    snap = _composer_state_snapshot(page)
+    if snap is not None:
+        if snap.get("analyzing"):
+            return ComposerState.ANALYZING
+        if snap.get("attached"):
+            return ComposerState.ATTACHED
+        if snap.get("composerVisible"):
+            if not (snap.get("text") or "").strip():
+                return ComposerState.EMPTY
+            return ComposerState.READY
+        return ComposerState.READY
+
+    # Fallback: osobne zapytania przez lokatory (np. gdy evaluate niedostępne).
+    if _is_analyzing_locators(page):
         return ComposerState.ANALYZING
-    if _is_attachment_present(page):
+    if _is_attachment_present_locators(page):
         return ComposerState.ATTACHED
 
     try:
-        comp = page.locator("div[contenteditable='true']").first
+        comp = page.locator(SEL_COMPOSER).first
         if comp.count() > 0 and comp.is_visible():
             text = comp.inner_text().strip()
             if not text:
@@ -331,46 +717,71 @@ def get_composer_state(page: Page) -> ComposerState:
 # Upload helpers
 # ----------------------------
 
-def _find_plus_button(page: Page, timeout_ms: int, debug_dir: Optional[Path]) -> Optional[Locator]:
-    root = _composer_root(page)
-    candidates = root.locator("button, [role='button']")
-    n = min(candidates.count(), 140)
-
-    aria_good = [
-        re.compile(r"menu\s+przesyłania\s+pliku", re.I),
-        re.compile(r"menu\s+przesylania\s+pliku", re.I),
-        re.compile(r"dodaj\s+pliki", re.I),
-        re.compile(r"upload", re.I),
-        re.compile(r"attach", re.I),
-        re.compile(r"file", re.I),
-        re.compile(r"zał[aą]cz", re.I),
-    ]
+_PLUS_ARIA_RX = re.compile(
+    r"menu\s+przesyłania\s+pliku|menu\s+przesylania\s+pliku|dodaj\s+pliki|upload|attach|file|zał[aą]cz",
+    re.I,
+)
+_PLUS_SKIP_ARIA = frozenset(
+    {"mikrofon", "microphone", "wyślij wiadomość", "wyslij wiadomosc", "send", "send message"}
+)
+_PLUS_TOOLTIP_RX = re.compile(r"\bDodaj\s+pliki\b", re.I)
+_SEND_ARIA_RX = re.compile(r"(wyślij|wyslij|prześlij|przeslij|send)", re.I)
+_SEND_TOOLTIP_RX = re.compile(r"\bPrze[śs]lij\b", re.I)
+
+# Widoczność + aria-label + tekst tooltipa dla pierwszych `limit` przycisków – jeden round trip.
+_BUTTONS_META_JS = r"""(els, limit) => els.slice(0, limit).map((e) => {
+    const r = e.getBoundingClientRect();
+    return {
+        v: r.width > 0 && r.height > 0 && getComputedStyle(e).visibility !== 'hidden',
+        a: (e.getAttribute('aria-label') || '').trim(),
+        t: (e.getAttribute('title') || e.getAttribute('data-tooltip') ||
+            e.getAttribute('mattooltip') || e.getAttribute('ng-reflect-message') || '').trim(),
+    };
+})"""
+
+
+def _buttons_meta(candidates: Locator, limit: int) -> List[Dict[str, Any]]:
+    try:
+        return candidates.evaluate_all(_BUTTONS_META_JS, limit) or []
+    except Exception:
+        return []
 
-    for i in range(n):
-        el = candidates.nth(i)
-        try:
-            if not el.is_visible():
-                continue
-            aria = (el.get_attribute("aria-label") or "").strip()
-            if aria and any(rx.search(aria) for rx in aria_good):
-                return el
-        except Exception:
-            continue
 
-    for i in range(n):
+def _find_by_hover(page: Page, candidates: Locator, idxs: Iterable[int], tooltip_rx: re.Pattern,
+                   timeout_ms: Optional[int] = None) -> Optional[Locator]:
+    """Ostatnia deska ratunku: najechanie kolejno na przyciski i sprawdzenie tooltipa."""
+    for i in idxs:
         el = candidates.nth(i)
         try:
-            if not el.is_visible():
-                continue
-            aria = (el.get_attribute("aria-label") or "").strip().lower()
-            if aria in ("mikrofon", "microphone", "wyślij wiadomość", "wyslij wiadomosc", "send", "send message"):
-                continue
             el.hover(timeout=timeout_ms)
             page.wait_for_timeout(150)
-            if _tooltip_visible(page, r"\bDodaj\s+pliki\b"):
+            if _tooltip_visible(page, tooltip_rx):
                 return el
         except Exception:
             continue
+    return None
+
+
+def _find_plus_button(page: Page, timeout_ms: int, debug_dir: Optional[Path]) -> Optional[Locator]:
+    root = _composer_root(page)
+    candidates = root.locator(SEL_BUTTONS)
+    meta = _buttons_meta(candidates, 140)
+
+    for i, m in enumerate(meta):
+        if m["v"] and m["a"] and _PLUS_ARIA_RX.search(m["a"]):
+            return candidates.nth(i)
+
+    hover_idxs = []
+    for i, m in enumerate(meta):
+        if not m["v"] or m["a"].lower() in _PLUS_SKIP_ARIA:
+            continue
+        if m["t"] and _PLUS_TOOLTIP_RX.search(m["t"]):
+            return candidates.nth(i)
+        hover_idxs.append(i)
+
+    el = _find_by_hover(page, candidates, hover_idxs, _PLUS_TOOLTIP_RX, timeout_ms)
+    if el is not None:
+        return el
 
     dump_debug(page, debug_dir, "plus_not_found")
     return None
@@ -384,18 +795,21 @@ def _overlay_upload_button(page: Page) -> Locator:
     ).first
 
 
-def _try_input_type_file(page: Page, img_path: Path) -> bool:
+def _try_input_type_file(page: Page, img_path: Path, timeout_ms: int = 5000) -> bool:
+    """
+    set_input_files działa na ukrytych inputach (wystarczy, że są w DOM), więc
+    jeśli input już istnieje, omijamy '+', overlay i file chooser.
+    Inputy z accept="image/..." próbujemy najpierw.
+    """
     inputs = page.locator("input[type='file']")
     try:
-        cnt = inputs.count()
+        accepts = inputs.evaluate_all("(els) => els.map((e) => (e.accept || '').toLowerCase())")
     except Exception:
-        cnt = 0
-    if cnt <= 0:
         return False
-    for i in range(cnt):
-        inp = inputs.nth(i)
+    order = sorted(range(len(accepts)), key=lambda i: "image" not in accepts[i])
+    for i in order:
         try:
-            inp.set_input_files(str(img_path))
+            inputs.nth(i).set_input_files(str(img_path), timeout=timeout_ms)
             return True
         except Exception:
             continue
@@ -451,7 +865,7 @@ def upload_image(
     log(f"upload: start -> {img_path}")
     _ = find_composer(page, timeout_ms=timeout_ms)
 
-    if _try_input_type_file(page, img_path):
+    if _try_input_type_file(page, img_path, timeout_ms=min(timeout_ms, 5000)):
         log("upload: OK przez input[type=file]")
         ok = wait_attachment_fast(page, timeout_ms=attach_confirm_ms)
         if ok:
@@ -558,21 +972,20 @@ def paste_prompt_fast(page: Page, text: str, timeout_ms: int, debug_dir: Optiona
         page.evaluate("(t) => navigator.clipboard.writeText(t)", text)
         page.keyboard.press("Control+V")
     except Exception:
+        # Bez schowka: insert_text wstawia cały tekst jednym zdarzeniem input
+        # (jak IME), zamiast pisać znak po znaku z opóźnieniem.
         try:
-            page.keyboard.type(text, delay=3)
-        except Exception as e:
-            dump_debug(page, debug_dir, "prompt_paste_failed")
-            raise GeminiRuntimeError(f"Nie udało się wkleić prompta: {e}")
-
-    t0 = time.time()
-    while (time.time() - t0) < 3.0:
-        try:
-            if comp.inner_text().strip():
-                log("prompt: wklejony")
-                return
+            page.keyboard.insert_text(text)
         except Exception:
-            pass
-        page.wait_for_timeout(150)
+            try:
+                page.keyboard.type(text)
+            except Exception as e:
+                dump_debug(page, debug_dir, "prompt_paste_failed")
+                raise GeminiRuntimeError(f"Nie udało się wkleić prompta: {e}")
+
+    if _wait_for_js(page, _COMPOSER_HAS_TEXT_JS, 3000, poll_ms=150):
+        log("prompt: wklejony")
+        return
 
     log("prompt: UWAGA — nie potwierdziłem tekstu w 3s, ale idziemy dalej (UI bywa opóźnione).")
 
@@ -583,36 +996,22 @@ def paste_prompt_fast(page: Page, text: str, timeout_ms: int, debug_dir: Optiona
 
 def _find_send_button(page: Page) -> Optional[Locator]:
     root = _composer_root(page)
-    rx = re.compile(r"(wyślij|wyslij|prześlij|przeslij|send)", re.I)
 
     candidates = root.locator("button[aria-label], [role='button'][aria-label]")
-    n = min(candidates.count(), 160)
-    for i in range(n):
-        el = candidates.nth(i)
-        try:
-            if not el.is_visible():
-                continue
-            aria = (el.get_attribute("aria-label") or "").strip()
-            if aria and rx.search(aria):
-                return el
-        except Exception:
+    for i, m in enumerate(_buttons_meta(candidates, 160)):
+        if m["v"] and m["a"] and _SEND_ARIA_RX.search(m["a"]):
+            return candidates.nth(i)
+
+    candidates2 = root.locator(SEL_BUTTONS)
+    hover_idxs = []
+    for i, m in enumerate(_buttons_meta(candidates2, 220)):
+        if not m["v"]:
             continue
+        if m["t"] and _SEND_TOOLTIP_RX.search(m["t"]):
+            return candidates2.nth(i)
+        hover_idxs.append(i)
 
-    candidates2 = root.locator("button, [role='button']")
-    n2 = min(candidates2.count(), 220)
-    for i in range(n2):
-        el = candidates2.nth(i)
-        try:
-            if not el.is_visible():
-                continue
-            el.hover()
-            page.wait_for_timeout(150)
-            if _tooltip_visible(page, r"\bPrze[śs]lij\b"):
-                return el
-        except Exception:
-            continue
-
-    return None
+    return _find_by_hover(page, candidates2, hover_idxs, _SEND_TOOLTIP_RX)
 
 
 def send_message_with_retry(page: Page, timeout_ms: int, debug_dir: Optional[Path]) -> None:
@@ -622,11 +1021,6 @@ def send_message_with_retry(page: Page, timeout_ms: int, debug_dir: Optional[Pat
       - pojawia się element odpowiedzi,
     a nie tylko tym, że przycisk Send zrobił się disabled.
     """
-    stop_like = page.locator("text=/Stop|Zatrzymaj|Anuluj|Cancel|Stop generating/i")
-    answer_area = page.locator(
-        "[data-test-id*='response' i], [data-testid*='response' i], .response-container, .markdown, message-content"
-    )
-
     max_retries = 3
     for attempt in range(1, max_retries + 1):
         log(f"send: próba {attempt}/{max_retries}")
@@ -655,24 +1049,14 @@ def send_message_with_retry(page: Page, timeout_ms: int, debug_dir: Optional[Pat
 
         # 3) Twarde potwierdzenie: czekaj na start generowania / odpowiedź
         log("send: czekam na twardy sygnał startu generowania (Stop/odpowiedź)...")
-        t0 = time.time()
-        while (time.time() - t0) < 8.0:
-            try:
-                if stop_like.count() > 0 and stop_like.first.is_visible():
-                    log("send: potwierdzone ✅ (Stop/Cancel widoczny)")
-                    return
-            except Exception:
-                pass
-
-            try:
-                if answer_area.count() > 0:
-                    # czasem odpowiedź pojawia się od razu bez 'Stop'
-                    log("send: potwierdzone ✅ (elementy odpowiedzi widoczne)")
-                    return
-            except Exception:
-                pass
-
-            page.wait_for_timeout(200)
+        started = _wait_for_js(page, _SEND_STARTED_JS, 8000)
+        if started == "stop":
+            log("send: potwierdzone ✅ (Stop/Cancel widoczny)")
+            return
+        if started:
+            # czasem odpowiedź pojawia się od razu bez 'Stop'
+            log("send: potwierdzone ✅ (elementy odpowiedzi widoczne)")
+            return
 
         # 4) Jeśli brak potwierdzenia – zrób debug i ponów
         log("send: brak potwierdzenia wysłania – retry...")
@@ -688,76 +1072,28 @@ def send_message(page: Page, timeout_ms: int, debug_dir: Optional[Path]) -> None
 
 
 def wait_generation_cycle(page: Page, appear_timeout_ms: int, done_timeout_ms: int, debug_dir: Optional[Path]) -> None:
-    stop_like = page.locator("text=/Stop|Zatrzymaj|Anuluj|Cancel|Stop generating/i")
-    mic_like = page.locator(
-        "button[aria-label='Mikrofon'], button[aria-label='Microphone'], "
-        "[role='button'][aria-label='Mikrofon'], [role='button'][aria-label='Microphone']"
-    )
-
-    answer_area = page.locator(
-        "[data-test-id*='response'], [data-testid*='response'], .response-container, .markdown, message-content, "
-        "button:has-text('👍'), button:has-text('👎')"
-    )
-
     log("send: czekam na start generowania (Stop/odpowiedź)...")
-    t0 = time.time()
-    saw_stop = False
-    while (time.time() - t0) * 1000 < appear_timeout_ms:
-        page.wait_for_timeout(300)
-
-        try:
-            if stop_like.count() > 0 and stop_like.first.is_visible():
-                saw_stop = True
-                log("send: wykryto stan generowania (Stop/Cancel) ✅")
-                break
-        except Exception:
-            pass
-
-        try:
-            if answer_area.count() > 0:
-                log("send: wykryto elementy odpowiedzi ✅")
-                break
-        except Exception:
-            pass
+    started = _wait_for_js(page, _GEN_STARTED_JS, appear_timeout_ms, poll_ms=300)
+    saw_stop = started == "stop"
+    if saw_stop:
+        log("send: wykryto stan generowania (Stop/Cancel) ✅")
+    elif started:
+        log("send: wykryto elementy odpowiedzi ✅")
 
     if saw_stop:
         log("ready: czekam aż Stop/Cancel zniknie...")
-        t1 = time.time()
-        while (time.time() - t1) * 1000 < done_timeout_ms:
-            page.wait_for_timeout(500)
-            try:
-                if stop_like.count() == 0 or not stop_like.first.is_visible():
-                    break
-            except Exception:
-                break
+        _wait_for_js(page, _GEN_STOPPED_JS, done_timeout_ms, poll_ms=500)
     else:
         page.wait_for_timeout(500)
 
     log("ready: czekam na gotowość do kolejnego skanu (mikrofon/composer)...")
-    t2 = time.time()
-    while (time.time() - t2) * 1000 < done_timeout_ms:
-        page.wait_for_timeout(500)
-
-        try:
-            if stop_like.count() > 0 and stop_like.first.is_visible():
-                continue
-        except Exception:
-            pass
-
-        try:
-            if mic_like.count() > 0 and mic_like.first.is_visible():
-                log("ready: mikrofon wrócił ✅ (można kolejny skan)")
-                return
-        except Exception:
-            pass
-
-        try:
-            comp = page.locator("div[contenteditable='true']").first
-            if comp.count() and comp.is_visible():
-                log("ready: composer widoczny ✅ (można kolejny skan)")
-                return
-        except Exception:
-            pass
+    ready = _wait_for_js(page, _READY_JS, done_timeout_ms, poll_ms=500)
+    if ready == "mic":
+        log("ready: mikrofon wrócił ✅ (można kolejny skan)")
+        return
+    if ready:
+        log("ready: composer widoczny ✅ (można kolejny skan)")
+        return
 
     dump_debug(page, debug_dir, "ready_timeout")
     raise GeminiTimeoutError("Timeout czekania na powrót gotowości (mikrofon/composer).")
@@ -781,20 +1117,20 @@ def cleanup_composer(page: Page, debug_dir: Optional[Path]) -> bool:
         log(f"cleanup: timeout czekania na koniec ANALYZING. Stan={state}")
         return False
 
-    remove_btns = page.locator(
-        "button[aria-label='Usuń plik'], button[aria-label='Remove file'], "
-        "button:has-text('Usuń'), button:has-text('Remove'), .remove-attachment"
-    )
+    remove_btns = page.locator(SEL_REMOVE)
     try:
-        count = remove_btns.count()
-        if count > 0:
-            log(f"cleanup: klikam {count} przycisków usuwania załącznika")
-            for i in range(count):
+        # Uchwyty pobrane raz: jeden round trip zamiast count() + nth(i) na każdy przycisk,
+        # a usunięcie załącznika nie przesuwa indeksów kolejnych przycisków.
+        handles = remove_btns.element_handles()
+        if handles:
+            log(f"cleanup: klikam {len(handles)} przycisków usuwania załącznika")
+            for h in handles:
                 try:
-                    remove_btns.nth(i).click(timeout=2000)
+                    h.click(timeout=2000)
                 except Exception:
                     pass
-            page.wait_for_timeout(500)
+            # najwyżej tyle co dawny stały sleep, ale wracamy od razu po zniknięciu załącznika
+            _wait_for_js(page, _ATTACH_REMOVED_JS, 500, poll_ms=100)
     except Exception as e:
         log(f"cleanup: błąd przy usuwaniu załącznika: {e}")
 
@@ -804,7 +1140,7 @@ def cleanup_composer(page: Page, debug_dir: Optional[Path]) -> bool:
             comp.click(force=True)
             page.keyboard.press("Control+A")
             page.keyboard.press("Backspace")
-            page.wait_for_timeout(500)
+            _wait_for_js(page, _COMPOSER_CLEARED_JS, 500, poll_ms=100)
     except Exception as e:
         log(f"cleanup: błąd przy czyszczeniu tekstu: {e}")
 
@@ -820,71 +1156,104 @@ def cleanup_composer(page: Page, debug_dir: Optional[Path]) -> bool:
     return False
 
 
+def start_new_chat(page: Page, debug_dir: Optional[Path]) -> bool:
+    """Klik "Nowy czat" – świeży composer bez przeładowania całej aplikacji."""
+    try:
+        btn = page.locator(SEL_NEW_CHAT).first
+        if not btn.is_visible():
+            log("new chat: nie widzę przycisku")
+            return False
+        btn.click(timeout=3000)
+        find_composer(page, timeout_ms=5000)
+    except Exception as e:
+        log(f"new chat: błąd: {e}")
+        return False
+
+    state = get_composer_state(page)
+    log(f"new chat: stan = {state}")
+    return state in (ComposerState.READY, ComposerState.EMPTY)
+
+
+def recover_page(page: Page, args: argparse.Namespace, debug_dir: Optional[Path]) -> str:
+    """
+    Stopniowana naprawa strony po błędzie – od najtańszego kroku:
+      1) cleanup_composer (usunięcie załącznika + tekstu),
+      2) "Nowy czat",
+      3) pełne przeładowanie (reload_gemini) – tylko gdy oba zawiodły.
+    Zwraca nazwę kroku, który zadziałał ("cleanup" / "new_chat" / "reload").
+    """
+    if cleanup_composer(page, debug_dir):
+        return "cleanup"
+    log("Cleanup failed, próbuję nowy czat...")
+    if start_new_chat(page, debug_dir):
+        return "new_chat"
+    log("Nowy czat nie pomógł, refreshing page...")
+    reload_gemini(page, timeout_ms=args.timeout_ms, debug_dir=debug_dir)
+    return "reload"
+
+
 # ----------------------------
 # Response extraction (NEW)
 # ----------------------------
 
-def _candidate_response_locators(page: Page) -> list[Locator]:
-    # Uwaga: Gemini zmienia DOM — bierzemy kilka “dobrych” heurystyk.
-    sels = [
-        "message-content",
-        "[data-test-id*='response' i]",
-        "[data-testid*='response' i]",
-        ".response-container",
-        ".markdown",
-        "div:has(button:has-text('👍'))",
-        "div:has(button:has-text('👎'))",
-    ]
-    return [page.locator(sel) for sel in sels]
+# Uwaga: Gemini zmienia DOM — bierzemy kilka “dobrych” heurystyk, w tej kolejności.
+RESPONSE_SELECTORS = (
+    "message-content",
+    "[data-test-id*='response' i]",
+    "[data-testid*='response' i]",
+    ".response-container",
+    ".markdown",
+)
+RESPONSE_FEEDBACK_EMOJI = ("👍", "👎")  # div zawierający przycisk oceny odpowiedzi
+
+# Cała heurystyka w jednym evaluate: dla każdej grupy (po kolei) ostatnie 7 elementów,
+# pierwszy widoczny z tekstem >= 20 znaków. Zwraca tekst albo null.
+_RESPONSE_TEXT_JS = "() => {" + _JS_HELPERS + r"""
+    const groups = """ + json.dumps(list(RESPONSE_SELECTORS)) + r""".map((sel) => () => document.querySelectorAll(sel));
+    for (const emoji of """ + json.dumps(list(RESPONSE_FEEDBACK_EMOJI), ensure_ascii=False) + r""") {
+        groups.push(() => Array.from(document.querySelectorAll('div:has(button)')).filter((d) =>
+            Array.from(d.querySelectorAll('button')).some((b) => (b.textContent || '').includes(emoji))));
+    }
+    for (const group of groups) {
+        const els = group();
+        for (let i = els.length - 1; i >= Math.max(0, els.length - 7); i--) {
+            const el = els[i];
+            if (!visible(el)) continue;
+            const t = (el.innerText || '').trim();
+            if (t && t.length >= 20) return t;
+        }
+    }
+    return null;
+}"""
 
 
 def extract_latest_response_text(page: Page, timeout_ms: int, debug_dir: Optional[Path]) -> str:
     """
     Próbuje wyciągnąć tekst ostatniej odpowiedzi. To jest kluczowe do DB i plików.
+    Heurystyki sprawdzane w przeglądarce (jeden predykat), bez RPC na każdy element.
     """
-    t0 = time.time()
-    last_err: Optional[Exception] = None
-
-    while (time.time() - t0) * 1000 < timeout_ms:
-        try:
-            for loc in _candidate_response_locators(page):
-                try:
-                    n = loc.count()
-                except Exception:
-                    n = 0
-                if n <= 0:
-                    continue
-
-                # Bierzemy “ostatni” element z danej heurystyki
-                for idx in range(n - 1, max(-1, n - 8), -1):
-                    el = loc.nth(idx)
-                    try:
-                        if not el.is_visible():
-                            continue
-                        txt = el.inner_text().strip()
-                        # odfiltruj “puste” / UI-only
-                        if txt and len(txt) >= 20:
-                            return txt
-                    except Exception as e:
-                        last_err = e
-                        continue
-        except Exception as e:
-            last_err = e
-
-        page.wait_for_timeout(250)
+    txt = _wait_for_js(page, _RESPONSE_TEXT_JS, timeout_ms, poll_ms=250)
+    if isinstance(txt, str) and txt:
+        return txt
 
     dump_debug(page, debug_dir, "extract_response_failed")
-    raise GeminiTimeoutError(f"Nie udało się wyciągnąć tekstu odpowiedzi (timeout). last_err={last_err!r}")
+    raise GeminiTimeoutError("Nie udało się wyciągnąć tekstu odpowiedzi (timeout).")
 
 
 # ----------------------------
 # Output files (NEW)
 # ----------------------------
 
+_SAFE_STEM_RX = re.compile(r"[^\w.\-]+", re.UNICODE)
+_SAFE_STEM_ASCII = frozenset(string.ascii_letters + string.digits + "_.-")
+
+
 def safe_stem(p: Path) -> str:
     # stabilna nazwa pliku wynikowego
     s = p.stem
-    s = re.sub(r"[^\w.\-]+", "_", s, flags=re.UNICODE)
+    # typowa nazwa skanu jest już bezpieczna: sprawdzenie zbioru zamiast regexa
+    if not _SAFE_STEM_ASCII.issuperset(s):
+        s = _SAFE_STEM_RX.sub("_", s)
     return s[:180] if len(s) > 180 else s
 
 
@@ -901,10 +1270,87 @@ def write_outputs(out_root: Optional[Path], img: Path, response_text: str, meta:
     json_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
+class ProcessedIndex:
+    """
+    Trwały indeks plików już przetworzonych (append-only JSONL), czytany na starcie.
+    Klucz: ścieżka + rozmiar + mtime_ns – bez czytania zawartości pliku, a podmieniony
+    lub zmieniony skan dostaje nowy klucz i jest przetwarzany ponownie.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._keys: set[str] = set()
+        if path.exists():
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._keys.add(json.loads(line)["key"])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+
+    @staticmethod
+    def key_for(img: Path) -> str:
+        st = img.stat()
+        return f"{img}|{st.st_size}|{st.st_mtime_ns}"
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, img: Path) -> bool:
+        try:
+            return self.key_for(img) in self._keys
+        except OSError:
+            return False
+
+    def add(self, img: Path) -> None:
+        key = self.key_for(img)
+        if key in self._keys:
+            return
+        ensure_dir(self.path.parent)
+        line = json.dumps({"key": key, "img": str(img), "ts": datetime.now().isoformat()}, ensure_ascii=False)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        self._keys.add(key)
+
+
 # ----------------------------
 # DB write (NEW)
 # ----------------------------
 
+def _db_rows(
+    img: Path,
+    response_text: str,
+    meta: Dict[str, Any],
+    started_at: datetime,
+    finished_at: datetime,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    doc = dict(
+        source_path=str(img),
+        file_name=img.name,
+        source_sha256=meta.get("source_sha256"),
+        doc_type=meta.get("doc_type", "unknown"),
+        confidence=meta.get("confidence"),
+        issues=meta.get("issues"),
+        pipeline=meta.get("pipeline", "two-step"),
+        run_tag=meta.get("run_tag"),
+        status=meta.get("status", "done"),
+        processing_by=meta.get("processing_by"),
+        processing_started_at=started_at,
+        processing_finished_at=finished_at,
+    )
+    entries = [
+        dict(
+            entry_no=1,  # minimalnie: 1 entry na dokument
+            entry_text=response_text,
+            entry_json=meta,
+            entry_type=meta.get("entry_type"),
+            entry_date=meta.get("entry_date"),
+            location=meta.get("location"),
+        )
+    ]
+    return doc, entries
+
+
 def write_to_db_minimal(
     *,
     img: Path,
@@ -918,33 +1364,12 @@ def write_to_db_minimal(
 
     writer = MinimalDbWriter(db_config_from_env())
     try:
-        doc_id = writer.upsert_document(
-            source_path=str(img),
-            file_name=img.name,
-            source_sha256=meta.get("source_sha256"),
-            doc_type=meta.get("doc_type", "unknown"),
-            confidence=meta.get("confidence"),
-            issues=meta.get("issues"),
-            pipeline=meta.get("pipeline", "two-step"),
-            run_tag=meta.get("run_tag"),
-            status=meta.get("status", "done"),
-            processing_by=meta.get("processing_by"),
-            processing_started_at=started_at,
-            processing_finished_at=finished_at,
-        )
-
-        entry_id = writer.upsert_entry(
-            doc_id=doc_id,
-            entry_no=1,  # minimalnie: 1 entry na dokument
-            entry_text=response_text,
-            entry_json=meta,
-            entry_type=meta.get("entry_type"),
-            entry_date=meta.get("entry_date"),
-            location=meta.get("location"),
-        )
+        # dokument + wpis w jednym round tripie do bazy
+        doc, entries = _db_rows(img, response_text, meta, started_at, finished_at)
+        doc_id, entry_ids = writer.write_document_with_entries(doc=doc, entries=entries)
 
         writer.commit()
-        return doc_id, entry_id
+        return doc_id, entry_ids[0]
     except Exception:
         writer.rollback()
         raise
@@ -952,21 +1377,114 @@ def write_to_db_minimal(
         writer.close()
 
 
+class DbBatch:
+    """
+    Zapis do bazy paczkami na cały run: jeden writer (jedno połączenie z puli),
+    `size` dokumentów w jednym execute i jednym commicie.
+    Pliki trafiają do indeksu przetworzonych dopiero po commicie ich paczki.
+    Gdy zapis paczki się nie uda, dokumenty idą ponownie pojedynczo; te, które
+    nadal nie przechodzą, są logowane i odrzucane (nie blokują kolejnych paczek).
+    """
+
+    def __init__(self, size: int, processed: Optional[ProcessedIndex] = None):
+        if not HAS_DB:
+            raise RuntimeError("Brak db_writer/psycopg2 w środowisku (HAS_DB=False). Dodaj psycopg2-binary i plik db_writer.py.")
+        self.size = size
+        self.processed = processed
+        # dokumenty odrzucone przez bazę w całym runie (nie trafiły do indeksu przetworzonych)
+        self.dropped = 0
+        self.writer = MinimalDbWriter(db_config_from_env())
+        self.pending: List[Tuple[Path, Tuple[Dict[str, Any], List[Dict[str, Any]]]]] = []
+
+    def add(self, **kwargs: Any) -> None:
+        """Argumenty jak write_to_db_minimal."""
+        self.pending.append((kwargs["img"], _db_rows(**kwargs)))
+        if len(self.pending) >= self.size:
+            self.flush()
+
+    def _write(self, items: List[Tuple[Path, Tuple[Dict[str, Any], List[Dict[str, Any]]]]]) -> None:
+        try:
+            self.writer.write_documents_with_entries([rows for _, rows in items])
+            self.writer.commit()
+        except Exception:
+            self.writer.rollback()
+            raise
+        if self.processed is not None:
+            for img, _ in items:
+                self.processed.add(img)
+
+    def flush(self) -> int:
+        """Zapisuje bufor; zwraca liczbę zapisanych dokumentów."""
+        if not self.pending:
+            return 0
+        items = list(self.pending)
+        self.pending.clear()
+        try:
+            self._write(items)
+            return len(items)
+        except Exception as e:
+            log(f"DB: paczka {len(items)} dok. nie zapisana ({e}) – ponawiam pojedynczo")
+
+        written = 0
+        for item in items:
+            try:
+                self._write([item])
+                written += 1
+            except Exception as e:
+                self.dropped += 1
+                log(f"ERROR: DB: pominięto {item[0].name}: {e}")
+        return written
+
+    def close(self) -> None:
+        try:
+            n = self.flush()
+            if n:
+                log(f"DB: zapisano ostatnią paczkę ({n} dok.) ✅")
+        finally:
+            self.writer.close()
+
+
+_DB_BATCH: Optional[DbBatch] = None
+
+
 # ----------------------------
 # Main
 # ----------------------------
 
+# Domyślna ścieżka promptów liczona raz (Path.home() czyta bazę passwd / env).
+_DEFAULT_PROMPTS = str(Path.home() / "gemini_prompts.json")
+
+
+@lru_cache(maxsize=16)
+def _exp(p: str) -> Path:
+    """expanduser + resolve dla ścieżek z CLI – każdą normalizujemy tylko raz."""
+    return Path(os.path.expanduser(p)).resolve()
+
+
 def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--root", required=True)
+    ap.add_argument("--root", default="")
+    ap.add_argument("--paths-from", default="",
+                    help="Zamiast skanować --root: czytaj ścieżki obrazów (po jednej w linii) z pliku/FIFO "
+                         "albo '-' = stdin, na bieżąco, w jednej sesji przeglądarki.")
     ap.add_argument("--recursive", action="store_true")
     ap.add_argument("--limit", type=int, default=0)
     ap.add_argument("--import-only", action="store_true", help="Only scan files and print them.")
+    ap.add_argument("--register-db", action="store_true",
+                    help="Z --import-only: zarejestruj znalezione pliki (ścieżka, nazwa, sha256) w ocr_document "
+                         "jednym COPY; istniejące wiersze zostają bez zmian.")
+
+    ap.add_argument("--shard-count", type=int, default=1,
+                    help="Na ile procesów dzielony jest skan (każdy proces z osobnym --profile-dir).")
+    ap.add_argument("--shard-index", type=int, default=0,
+                    help="Który shard (0..shard-count-1) przetwarza ten proces.")
 
     ap.add_argument("--out-root", default="")
     ap.add_argument("--debug-dir", default="")
+    ap.add_argument("--processed-index", default="",
+                    help="Plik JSONL z już przetworzonymi skanami: pomijaj je i dopisuj nowe (wznawialne runy).")
 
-    ap.add_argument("--prompts-file", default=str(Path.home() / "gemini_prompts.json"))
+    ap.add_argument("--prompts-file", default=_DEFAULT_PROMPTS)
     ap.add_argument("--prompt-id", default=None)
 
     ap.add_argument("--profile-dir", required=False)
@@ -1006,10 +1524,93 @@ def parse_args() -> argparse.Namespace:
     ap.add_argument("--doc-type", default="unknown", help="doc_type do ocr_document (default: unknown)")
     ap.add_argument("--pipeline", default="two-step", help="pipeline label do ocr_document (default: two-step)")
     ap.add_argument("--run-tag", default="", help="Opcjonalny run_tag do ocr_document")
+    ap.add_argument("--overlap-writes", action="store_true",
+                    help="Zapisuj wyniki (sha256, pliki, DB) w wątku w tle, równolegle z OCR kolejnego pliku.")
+    ap.add_argument("--db-batch", type=int, default=1,
+                    help="Zapisuj do bazy paczkami po N dokumentów (jeden commit na paczkę). "
+                         "Domyślnie 1: commit po każdym pliku.")
+    ap.add_argument("--reload-every", type=int, default=0,
+                    help="Przeładuj Gemini co N plików (ogranicza wycieki pamięci karty). "
+                         "Domyślnie 0: tylko przy nieudanej naprawie po błędzie.")
 
     return ap.parse_args()
 
 
+@lru_cache(maxsize=1)
+def _processing_by() -> str:
+    """OCR_WORKER_ID albo hostname – stałe dla procesu, liczone raz (gethostname może pytać resolver)."""
+    return os.environ.get("OCR_WORKER_ID") or socket.gethostname()
+
+
+def persist_result(
+    *,
+    img: Path,
+    response_text: str,
+    args: argparse.Namespace,
+    out_root: Optional[Path],
+    started_at: datetime,
+    finished_at: datetime,
+) -> None:
+    """Zapis wyniku jednego pliku: meta (z sha256), pliki wynikowe, DB, indeks przetworzonych."""
+    meta: Dict[str, Any] = {
+        "file_name": img.name,
+        "source_path": str(img),
+        "source_sha256": sha256_file(img),
+        "prompt_id": args.prompt_id,
+        "doc_type": args.doc_type,
+        "pipeline": args.pipeline,
+        "run_tag": (args.run_tag or None),
+        "processing_by": _processing_by(),
+        "status": "done",
+        "started_at": started_at.isoformat(),
+        "finished_at": finished_at.isoformat(),
+        "response_len": len(response_text),
+    }
+
+    # save files
+    write_outputs(out_root, img, response_text, meta)
+
+    # save DB
+    if args.db and _DB_BATCH is not None:
+        _DB_BATCH.add(
+            img=img,
+            response_text=response_text,
+            meta=meta,
+            started_at=started_at,
+            finished_at=finished_at,
+        )
+        # do indeksu przetworzonych dopiero po commicie paczki (DbBatch.flush)
+        log(f"DB: w paczce ({len(_DB_BATCH.pending)}/{_DB_BATCH.size})")
+        return
+    elif args.db:
+        doc_id, entry_id = write_to_db_minimal(
+            img=img,
+            response_text=response_text,
+            meta=meta,
+            started_at=started_at,
+            finished_at=finished_at,
+        )
+        log(f"DB: zapisano doc_id={doc_id} entry_id={entry_id} ✅")
+    else:
+        log("DB: pominięto (--no-db).")
+
+    if _PROCESSED is not None:
+        _PROCESSED.add(img)
+
+
+# --overlap-writes: jeden wątek zapisujący wyniki, równolegle z pracą przeglądarki
+# nad kolejnym plikiem. Jeden worker = zapisy (i DbBatch) zawsze z jednego wątku.
+_WRITE_POOL: Optional[ThreadPoolExecutor] = None
+_PROCESSED: Optional[ProcessedIndex] = None
+
+
+def _persist_in_background(persist: Callable[[], None], img: Path) -> None:
+    try:
+        persist()
+    except Exception as e:
+        log(f"ERROR: zapis wyniku {img.name} nie powiódł się: {e}")
+
+
 def process_file_safe(
     page: Page,
     img: Path,
@@ -1071,39 +1672,23 @@ def process_file_safe(
 
             # 5) Outputs + DB (NEW)
             if response_text:
-                meta: Dict[str, Any] = {
-                    "file_name": img.name,
-                    "source_path": str(img),
-                    "source_sha256": sha256_file(img),
-                    "prompt_id": args.prompt_id,
-                    "doc_type": args.doc_type,
-                    "pipeline": args.pipeline,
-                    "run_tag": (args.run_tag or None),
-                    "processing_by": os.environ.get("OCR_WORKER_ID") or socket.gethostname(),
-                    "status": "done",
-                    "started_at": started_at.isoformat(),
-                    "finished_at": finished_at.isoformat(),
-                    "response_len": len(response_text),
-                }
-
-                # save files
-                write_outputs(out_root, img, response_text, meta)
-
-                # save DB
-                if args.db:
-                    doc_id, entry_id = write_to_db_minimal(
-                        img=img,
-                        response_text=response_text,
-                        meta=meta,
-                        started_at=started_at,
-                        finished_at=finished_at,
-                    )
-                    log(f"DB: zapisano doc_id={doc_id} entry_id={entry_id} ✅")
+                persist = partial(
+                    persist_result,
+                    img=img,
+                    response_text=response_text,
+                    args=args,
+                    out_root=out_root,
+                    started_at=started_at,
+                    finished_at=finished_at,
+                )
+                if _WRITE_POOL is not None:
+                    # sha256 + pliki + DB w tle – przeglądarka od razu bierze kolejny plik
+                    _WRITE_POOL.submit(_persist_in_background, persist, img)
                 else:
-                    log("DB: pominięto (--no-db).")
+                    persist()
 
             metrics.finish("success")
-            log(str(metrics))
+            emit_metrics(metrics)
             return True
 
         except (GeminiError, PlaywrightTimeoutError) as e:
@@ -1116,9 +1701,7 @@ def process_file_safe(
             try:
                 if attempt < max_doc_attempts:
                     log("Próba cleanup przed kolejnym podejściem...")
-                    if not cleanup_composer(page, debug_dir):
-                        log("Cleanup failed, refreshing page...")
-                        goto_gemini(page, timeout_ms=args.timeout_ms, debug_dir=debug_dir)
+                    recover_page(page, args, debug_dir)
             except Exception as e2:
                 log(f"Cleanup error: {e2}")
 
@@ -1126,30 +1709,55 @@ def process_file_safe(
             log(f"CRITICAL: Nieoczekiwany wyjątek przy {img.name}: {e}")
             dump_debug(page, debug_dir, f"critical_{img.name}")
             metrics.finish("error", error_reason=f"CRITICAL: {e}")
-            log(str(metrics))
+            emit_metrics(metrics)
             return False
 
     log(f"ERROR: Wyczerpano limit prób dla {img.name}. Skipping.")
-    log(str(metrics))
+    emit_metrics(metrics)
     return False
 
 
+def _iter_source(args: argparse.Namespace, root: Optional[Path]) -> Iterator[Path]:
+    if args.paths_from:
+        return iter_paths_from(args.paths_from)
+    return iter(iter_images(root, args.recursive))
+
+
 def main() -> int:
     args = parse_args()
 
-    root = Path(os.path.expanduser(args.root)).resolve()
-    out_root = Path(os.path.expanduser(args.out_root)).resolve() if args.out_root else None
-    debug_dir = Path(os.path.expanduser(args.debug_dir)).resolve() if args.debug_dir else None
+    if bool(args.root) == bool(args.paths_from):
+        log("Error: podaj dokładnie jedno z --root / --paths-from.")
+        return 1
+    if args.paths_from == "-" and (args.wait_login or args.pause or args.pause_each):
+        log("Error: --paths-from - (stdin) wyklucza --wait-login/--pause/--pause-each (też czytają stdin).")
+        return 1
+    root = _exp(args.root) if args.root else None
+    out_root = _exp(args.out_root) if args.out_root else None
+    debug_dir = _exp(args.debug_dir) if args.debug_dir else None
+    processed = (
+        ProcessedIndex(_exp(args.processed_index))
+        if args.processed_index and not args.import_only
+        else None
+    )
+    if processed is not None:
+        log(f"Indeks przetworzonych: {processed.path} ({len(processed)} wpisów)")
 
     if not args.import_only:
         if not args.profile_dir:
             log("Error: --profile-dir is required (unless --import-only is used).")
             return 1
-        profile_dir = Path(os.path.expanduser(args.profile_dir)).resolve()
+        profile_dir = _exp(args.profile_dir)
     else:
         profile_dir = None
 
-    prompts_path = Path(os.path.expanduser(args.prompts_file)).resolve()
+    if args.shard_count < 1 or not (0 <= args.shard_index < args.shard_count):
+        log(f"Error: niepoprawny shard {args.shard_index}/{args.shard_count}.")
+        return 1
+    if args.shard_count > 1:
+        log(f"Shard {args.shard_index}/{args.shard_count}")
+
+    prompts_path = _exp(args.prompts_file)
 
     # Load prompts
     try:
@@ -1167,15 +1775,42 @@ def main() -> int:
     if args.import_only:
         log("Tryb IMPORT-ONLY: skanowanie plików...")
         count = 0
-        for img in iter_images(root, args.recursive):
+        found: List[Path] = []
+        for img in iter_shard(_iter_source(args, root), args.shard_index, args.shard_count):
             print(f"FOUND: {img}")
+            if args.register_db:
+                found.append(img)
             count += 1
             if args.limit and count >= args.limit:
                 log(f"Limit {args.limit} reached.")
                 break
         log(f"Skanowanie zakończone. Znaleziono: {count}")
+        if args.register_db and found:
+            if not HAS_DB:
+                log("Error: --register-db wymaga db_writer/psycopg2.")
+                return 1
+            writer = MinimalDbWriter(db_config_from_env())
+            try:
+                new_docs = writer.register_documents(
+                    ((str(p), p.name, sha256_file(p)) for p in found),
+                    doc_type=args.doc_type,
+                    pipeline=args.pipeline,
+                    run_tag=(args.run_tag or None),
+                )
+            finally:
+                writer.close()
+                close_pool()
+            log(f"DB: zarejestrowano {new_docs} nowych dokumentów (COPY, {len(found)} plików).")
         return 0
 
+    global _DB_BATCH, _WRITE_POOL, _PROCESSED
+    _PROCESSED = processed
+    if args.overlap_writes:
+        _WRITE_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr-writer")
+    if args.db and args.db_batch > 1:
+        _DB_BATCH = DbBatch(args.db_batch, processed=processed)
+        log(f"DB: zapis paczkami po {args.db_batch}")
+
     log(f"Profil Playwright: {profile_dir}")
     log("Rozpoczynam przetwarzanie (streaming)...")
 
@@ -1196,10 +1831,21 @@ def main() -> int:
                 input()
 
             count = 0
-            for img in iter_images(root, args.recursive):
+            for img in iter_shard(_iter_source(args, root), args.shard_index, args.shard_count):
+                if processed is not None and img in processed:
+                    log(f"skip (already processed): {img}")
+                    continue
+
                 count += 1
                 log(f"--- [#{count}] {img} ---")
 
+                if args.reload_every > 0 and count > 1 and (count - 1) % args.reload_every == 0:
+                    log(f"reload: planowe przeładowanie po {args.reload_every} plikach")
+                    try:
+                        reload_gemini(page, timeout_ms=args.timeout_ms, debug_dir=debug_dir)
+                    except Exception as e:
+                        log(f"reload: nieudane ({e}), jadę dalej na obecnej stronie")
+
                 success = process_file_safe(page, img, prompt_text, args, debug_dir, out_root)
 
                 if not success:
@@ -1219,6 +1865,21 @@ def main() -> int:
 
         finally:
             context.close()
+            close_dump_pool()
+            if _WRITE_POOL is not None:
+                _WRITE_POOL.shutdown(wait=True)
+                _WRITE_POOL = None
+            if _DB_BATCH is not None:
+                try:
+                    _DB_BATCH.close()
+                except Exception as e:
+                    log(f"DB: zamknięcie połączenia paczek nie powiodło się: {e}")
+                if _DB_BATCH.dropped:
+                    log(f"ERROR: DB: {_DB_BATCH.dropped} dok. nie zapisano w bazie (pójdą ponownie w kolejnym runie)")
+                _DB_BATCH = None
+            close_metrics()
+            if HAS_DB:
+                close_pool()
 
 
 if __name__ == "__main__":
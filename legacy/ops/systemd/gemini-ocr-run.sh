@@ -68,6 +68,11 @@ if [ -n "$OCR_LIMIT" ] && [ "$OCR_LIMIT" != "0" ]; then
     CMD+=("--limit" "$OCR_LIMIT")
 fi
 
+# 9. Sharding (several instances, each with its own OCR_PROFILE_DIR)
+if [ -n "$OCR_SHARD_COUNT" ] && [ "$OCR_SHARD_COUNT" != "1" ]; then
+    CMD+=("--shard-count" "$OCR_SHARD_COUNT" "--shard-index" "${OCR_SHARD_INDEX:-0}")
+fi
+
 # --- Execution / Debug ---
 
 # If PRINT_ARGS is set to 1, print the command in shell-escaped format and exit.
@@ -3,81 +3,132 @@ import sys
 import re
 import argparse
 import csv
+import math
 from collections import defaultdict
-from statistics import mean
+from operator import itemgetter
+
+CSV_BUFFER_SIZE = 1 << 20
+CSV_BATCH_ROWS = 4096
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Parse Gemini OCR logs and generate a metrics summary.")
-    parser.add_argument("logfile", nargs="?", type=argparse.FileType("r"), default=sys.stdin,
+    parser.add_argument("logfile", nargs="?", type=argparse.FileType("rb"), default=sys.stdin.buffer,
                         help="Path to log file (or stdin if not specified).")
     parser.add_argument("--csv", type=str, help="Output metrics to a CSV file.")
     return parser.parse_args()
 
-def parse_metrics(line):
-    # Expected format:
-    # METRICS: file=doc_001.jpg | status=success | attempts=1 | duration=15.4s
-    # Optional: ... | reason=Timeout
+# Expected format:
+# METRICS: file=doc_001.jpg | status=success | attempts=1 | duration=15.4s
+# Optional: ... | reason=Timeout
+_METRICS_RE = re.compile(
+    r"METRICS: file=(?P<file>[^|]*?)\s*\|\s*status=(?P<status>\S+)\s*\|\s*"
+    r"attempts=(?P<attempts>\d+)\s*\|\s*duration=(?P<duration>[\d.]+)s"
+    r"(?:\s*\|\s*reason=(?P<reason>.*?))?\s*$"
+)
+
+
+_METRICS_MARKER = b"METRICS:"
+
 
-    if "METRICS:" not in line:
+def parse_metrics(line):
+    # Byte-level prefilter: most log lines are rejected by a single C-level
+    # search, before any decoding or regex work.
+    if isinstance(line, bytes):
+        if _METRICS_MARKER not in line:
+            return None
+        line = line.decode("utf-8", "replace")
+
+    m = _METRICS_RE.search(line)
+    if not m:
         return None
 
     try:
-        parts = line.split("METRICS:", 1)[1].strip().split("|")
-        data = {}
-        for part in parts:
-            if "=" in part:
-                k, v = part.split("=", 1)
-                data[k.strip()] = v.strip()
-
-        # Cleanup/Cast
-        if "duration" in data:
-            data["duration"] = float(data["duration"].replace("s", ""))
-        if "attempts" in data:
-            data["attempts"] = int(data["attempts"])
-
-        return data
-    except Exception:
+        return {
+            "file": m["file"],
+            "status": m["status"],
+            # groups are digits-only (no trailing "s"), so convert directly
+            "attempts": int(m["attempts"], 10),
+            "duration": float(m["duration"]),
+            "reason": m["reason"] or "",
+        }
+    except ValueError:
         return None
 
+
 def main():
     args = parse_args()
 
     total_files = 0
     statuses = defaultdict(int)
     errors = defaultdict(int)
-    durations = []
-    attempts_list = []
 
-    records = []
+    # Running accumulators (O(1) memory regardless of log size)
+    dur_n = 0
+    dur_sum = 0.0
+    dur_sumsq = 0.0
+    dur_max = 0.0
+    attempts_retry_count = 0
+
+    # CSV Export (streamed: rows are written as they are parsed)
+    fieldnames = ("file", "status", "attempts", "duration", "reason")
+    row_of = itemgetter(*fieldnames)
+    csvfile = None
+    writer = None
+    batch = []
+    if args.csv:
+        try:
+            csvfile = open(args.csv, "w", newline="", buffering=CSV_BUFFER_SIZE)
+            writer = csv.writer(csvfile)
+            writer.writerow(fieldnames)
+        except OSError as e:
+            print(f"\nError writing CSV: {e}")
+            csvfile = None
+            writer = None
 
     print(f"Reading from {args.logfile.name}...")
 
-    for line in args.logfile:
-        m = parse_metrics(line)
-        if m:
-            total_files += 1
-            records.append(m)
-
-            status = m.get("status", "unknown")
-            statuses[status] += 1
-
-            if status == "error":
-                reason = m.get("reason", "unknown")
-                errors[reason] += 1
-
-            if "duration" in m:
-                durations.append(m["duration"])
-            if "attempts" in m:
-                attempts_list.append(m["attempts"])
+    try:
+        for line in args.logfile:
+            m = parse_metrics(line)
+            if m:
+                total_files += 1
+
+                if writer:
+                    # positional row in fieldnames order (parse_metrics always sets every key)
+                    batch.append(row_of(m))
+                    if len(batch) >= CSV_BATCH_ROWS:
+                        writer.writerows(batch)
+                        batch.clear()
+
+                status = m["status"]
+                statuses[status] += 1
+
+                if status == "error":
+                    errors[m["reason"] or "unknown"] += 1
+
+                d = m["duration"]
+                dur_n += 1
+                dur_sum += d
+                dur_sumsq += d * d
+                if d > dur_max:
+                    dur_max = d
+                if m["attempts"] > 1:
+                    attempts_retry_count += 1
+        if writer and batch:
+            writer.writerows(batch)
+    finally:
+        if csvfile:
+            csvfile.close()
 
     if total_files == 0:
         print("No metrics found in input.")
         return
 
     # Statistics
-    avg_duration = mean(durations) if durations else 0.0
-    max_duration = max(durations) if durations else 0.0
-    total_duration = sum(durations)
+    avg_duration = dur_sum / dur_n if dur_n else 0.0
+    max_duration = dur_max if dur_n else 0.0
+    std_duration = math.sqrt(max(dur_sumsq / dur_n - avg_duration * avg_duration, 0.0)) if dur_n else 0.0
+    total_duration = dur_sum
 
     # Report
     print("\n--- Gemini OCR Run Summary ---")
@@ -99,25 +150,13 @@ def main():
     print("Performance:")
     print(f"  Avg Duration: {avg_duration:.2f}s")
     print(f"  Max Duration: {max_duration:.2f}s")
+    print(f"  Std Duration: {std_duration:.2f}s")
 
-    if attempts_list:
-        retries = sum(1 for a in attempts_list if a > 1)
-        print(f"  Files Retried: {retries} ({(retries/total_files)*100:.1f}%)")
+    retries = attempts_retry_count
+    print(f"  Files Retried: {retries} ({(retries/total_files)*100:.1f}%)")
 
-    # CSV Export
-    if args.csv:
-        try:
-            with open(args.csv, "w", newline="") as csvfile:
-                fieldnames = ["file", "status", "attempts", "duration", "reason"]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                for r in records:
-                    # filtering keys to match fieldnames
-                    row = {k: r.get(k, "") for k in fieldnames}
-                    writer.writerow(row)
-            print(f"\nCSV Report saved to: {args.csv}")
-        except OSError as e:
-            print(f"\nError writing CSV: {e}")
+    if writer:
+        print(f"\nCSV Report saved to: {args.csv}")
 
 if __name__ == "__main__":
     main()
@@ -10,8 +10,11 @@ try:
     print("--- Effective Gemini OCR Configuration ---")
     print(f"{'TIMEOUT':<35} | {'VALUE (ms)':<10}")
     print("-" * 50)
-    for key, val in gemini_config.UI_TIMEOUTS.items():
-        print(f"{key:<35} | {val:<10}")
+    rows = [f"{key:<35} | {val:<10}" for key, val in gemini_config.UI_TIMEOUTS.items()]
+    sys.stdout.write("\n".join(rows) + "\n")
+    print("-" * 50)
+    rows = [f"{'DEBUG_' + key:<35} | {val:<10}" for key, val in gemini_config.DEBUG_DUMP.items()]
+    sys.stdout.write("\n".join(rows) + "\n")
     print("-" * 50)
     print("To override, set env vars like: export GEMINI_TIMEOUT_PAGE_LOAD=300000")
 except ImportError:
@@ -1,22 +1,35 @@
-import os
 import pytest
-from unittest.mock import patch
+
+from gemini_config import UI_TIMEOUTS, build_debug_dump, build_ui_timeouts
+
 
 def test_config_defaults():
-    # Reload config to clear any previous env vars
-    import gemini_config
-    import importlib
-    importlib.reload(gemini_config)
+    timeouts = build_ui_timeouts({})
 
-    assert gemini_config.UI_TIMEOUTS["PAGE_LOAD"] == 180_000
-    assert gemini_config.UI_TIMEOUTS["ATTACH_CONFIRM"] == 8_000
+    assert timeouts["PAGE_LOAD"] == 180_000
+    assert timeouts["ATTACH_CONFIRM"] == 8_000
 
 def test_config_env_override():
-    with patch.dict(os.environ, {"GEMINI_TIMEOUT_PAGE_LOAD": "99999"}):
-        import gemini_config
-        import importlib
-        importlib.reload(gemini_config)
-
-        assert gemini_config.UI_TIMEOUTS["PAGE_LOAD"] == 99999
-        # Check that other values remain defaults
-        assert gemini_config.UI_TIMEOUTS["ATTACH_CONFIRM"] == 8_000
+    timeouts = build_ui_timeouts({"GEMINI_TIMEOUT_PAGE_LOAD": "99999"})
+
+    assert timeouts["PAGE_LOAD"] == 99999
+    # Check that other values remain defaults
+    assert timeouts["ATTACH_CONFIRM"] == 8_000
+
+def test_config_invalid_value_falls_back_to_default():
+    assert build_ui_timeouts({"GEMINI_TIMEOUT_GEN_DONE": "abc"})["GEN_DONE"] == 240_000
+
+def test_debug_dump_env_override():
+    dump = build_debug_dump({"GEMINI_DEBUG_JPEG_QUALITY": "55"})
+
+    assert dump["JPEG_QUALITY"] == 55
+    assert dump["HTML"] == 1
+
+def test_invalid_value_is_reported(capsys):
+    build_ui_timeouts({"GEMINI_TIMEOUT_PAGE_LOAD": "3m"})
+
+    assert "GEMINI_TIMEOUT_PAGE_LOAD" in capsys.readouterr().err
+
+def test_process_values_are_read_only():
+    with pytest.raises(TypeError):
+        UI_TIMEOUTS["PAGE_LOAD"] = 1
@@ -0,0 +1,100 @@
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+import gemini_ocr
+
+
+class FakeWriter:
+    def __init__(self, _cfg):
+        self.batches = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+        self.fail = False
+        self.bad = set()  # file_name, które baza odrzuca
+
+    def write_documents_with_entries(self, items):
+        if self.fail or any(d["file_name"] in self.bad for d, _ in items):
+            raise RuntimeError("db down")
+        self.batches.append(list(items))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeProcessed:
+    def __init__(self):
+        self.added = []
+
+    def add(self, img):
+        self.added.append(img.name)
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    monkeypatch.setattr(gemini_ocr, "HAS_DB", True)
+    monkeypatch.setattr(gemini_ocr, "MinimalDbWriter", FakeWriter, raising=False)
+    monkeypatch.setattr(gemini_ocr, "db_config_from_env", lambda: None, raising=False)
+    return gemini_ocr.DbBatch(2, processed=FakeProcessed())
+
+
+def _add(batch, name):
+    now = datetime.now()
+    batch.add(img=Path(name), response_text="txt", meta={"status": "done"}, started_at=now, finished_at=now)
+
+
+def test_db_batch_flushes_every_n_and_on_close(batch):
+    _add(batch, "a.jpg")
+    assert batch.writer.batches == []
+    _add(batch, "b.jpg")
+    assert [d["file_name"] for d, _ in batch.writer.batches[0]] == ["a.jpg", "b.jpg"]
+    assert batch.writer.commits == 1
+
+    _add(batch, "c.jpg")
+    batch.close()
+    assert len(batch.writer.batches) == 2
+    assert batch.writer.commits == 2
+    assert batch.writer.closed
+
+
+def test_db_batch_marks_processed_only_after_commit(batch):
+    _add(batch, "a.jpg")
+    assert batch.processed.added == []
+    _add(batch, "b.jpg")
+    assert batch.processed.added == ["a.jpg", "b.jpg"]
+
+
+def test_db_batch_retries_failed_batch_row_by_row(batch):
+    batch.writer.bad = {"a.jpg"}
+    _add(batch, "a.jpg")
+    _add(batch, "b.jpg")  # paczka pada, b.jpg przechodzi pojedynczo, a.jpg odrzucony
+
+    assert batch.pending == []
+    assert [d["file_name"] for b in batch.writer.batches for d, _ in b] == ["b.jpg"]
+    assert batch.processed.added == ["b.jpg"]
+    assert batch.writer.rollbacks == 2
+    assert batch.dropped == 1
+
+    # zły wiersz nie blokuje kolejnych paczek
+    _add(batch, "c.jpg")
+    _add(batch, "d.jpg")
+    assert batch.processed.added == ["b.jpg", "c.jpg", "d.jpg"]
+
+
+def test_db_batch_db_down_drops_rows_without_marking(batch):
+    batch.writer.fail = True
+    _add(batch, "a.jpg")
+    _add(batch, "b.jpg")
+
+    assert batch.pending == []
+    assert batch.processed.added == []
+    assert batch.writer.commits == 0
+    assert batch.dropped == 2
@@ -0,0 +1,93 @@
+from db_writer import DbConfig, MinimalDbWriter
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, params))
+        if "INSERT INTO" in sql:
+            self.rowcount = 2
+
+    def copy_expert(self, sql, f):
+        self.conn.copies.append((sql, f.read()))
+
+
+class FakeConn:
+    closed = 0
+
+    def __init__(self):
+        self.executed = []
+        self.copies = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_register_documents_streams_copy_chunks_then_single_insert():
+    writer = MinimalDbWriter(DbConfig(host="h", port=1, dbname="d", user="u"))
+    writer.conn = FakeConn()
+
+    rows = [("/a\tb.jpg", "a\tb.jpg", None), ("/c.jpg", "c.jpg", "abc"), ("/d.jpg", "d.jpg", "def")]
+    assert writer.register_documents(iter(rows), pipeline="p", chunk_rows=2) == 2
+
+    copies = writer.conn.copies
+    assert len(copies) == 2  # 2 + 1 wiersz
+    assert copies[0][1] == "/a\\tb.jpg\ta\\tb.jpg\t\\N\n/c.jpg\tc.jpg\tabc\n"
+    assert copies[1][1] == "/d.jpg\td.jpg\tdef\n"
+
+    inserts = [(sql, p) for sql, p in writer.conn.executed if "INSERT INTO" in sql]
+    assert len(inserts) == 1
+    assert "ON CONFLICT (source_path) DO NOTHING" in inserts[0][0]
+    assert inserts[0][1] == ("unknown", "p", None)
+    assert writer.conn.commits == 1
+
+
+class FakePool:
+    """Jak ThreadedConnectionPool: maxconn pożyczonych naraz, potem PoolError."""
+    closed = False
+
+    def __init__(self, maxconn):
+        self.maxconn = maxconn
+        self.used = set()
+        self.closed_conns = 0
+
+    def getconn(self):
+        if len(self.used) >= self.maxconn:
+            raise RuntimeError("connection pool exhausted")
+        conn = FakeConn()
+        self.used.add(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        self.used.discard(conn)
+        self.closed_conns += bool(close)
+
+
+def test_connect_returns_dead_connection_to_pool(monkeypatch):
+    import db_writer
+
+    pool = FakePool(maxconn=2)
+    monkeypatch.setattr(db_writer, "_get_pool", lambda _cfg: pool)
+    monkeypatch.setattr(MinimalDbWriter, "_prepare_statements", lambda self: None)
+
+    writer = MinimalDbWriter(DbConfig(host="h", port=1, dbname="d", user="u"))
+    writer.connect()
+    for _ in range(5):
+        writer.conn.closed = 1  # serwer zerwał połączenie
+        writer.connect()
+
+    assert len(pool.used) == 1
+    assert pool.closed_conns == 5
@@ -7,7 +7,7 @@ import sys
 # Add root to sys.path to allow importing gemini_ocr
 sys.path.append(str(Path(__file__).parent.parent))
 
-from gemini_ocr import iter_images
+from gemini_ocr import iter_images, iter_shard
 
 @pytest.fixture
 def fs_structure(tmp_path):
@@ -90,3 +90,50 @@ def test_limit_stops_recursion(fs_structure):
     # Root dir name is random, but 'sub' and 'sub2' are fixed names.
     assert "sub" not in scanned_paths
     assert "sub2" not in scanned_paths
+
+
+def test_iter_shard_splits_scan_disjointly(fs_structure):
+    full = list(iter_images(fs_structure, recursive=True))
+    shards = [list(iter_shard(iter_images(fs_structure, recursive=True), k, 3)) for k in range(3)]
+    assert sorted(p for s in shards for p in s) == sorted(full)
+    assert shards[0] == full[0::3]
+    assert list(iter_shard(iter(full), 0, 1)) == full
+
+
+def test_iter_paths_from_reads_existing_files(fs_structure, tmp_path):
+    from gemini_ocr import iter_paths_from
+
+    listing = tmp_path / "paths.txt"
+    listing.write_text(
+        f"# komentarz\n{fs_structure / 'a.jpg'}\n\n{fs_structure / 'missing.jpg'}\n{fs_structure / 'sub' / 'c.png'}\n",
+        encoding="utf-8",
+    )
+    assert list(iter_paths_from(str(listing))) == [fs_structure / "a.jpg", fs_structure / "sub" / "c.png"]
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="no FIFO support")
+def test_iter_paths_from_fifo_survives_writer_close(fs_structure, tmp_path):
+    import itertools
+    import threading
+
+    from gemini_ocr import iter_paths_from
+
+    fifo = tmp_path / "ocr.in"
+    os.mkfifo(fifo)
+
+    def writers():
+        # dwóch osobnych pisarzy, jak dwa `echo ścieżka > fifo`
+        for rel in ("a.jpg", "sub/d.jpg"):
+            with open(fifo, "w", encoding="utf-8") as w:
+                w.write(f"{fs_structure / rel}\n")
+
+    t = threading.Thread(target=writers, daemon=True)
+    t.start()
+    gen = iter_paths_from(str(fifo))
+    try:
+        got = list(itertools.islice(gen, 2))
+    finally:
+        gen.close()
+    t.join(timeout=5)
+
+    assert got == [fs_structure / "a.jpg", fs_structure / "sub" / "d.jpg"]
@@ -1,6 +1,6 @@
 import pytest
 
-from gemini_ocr import ComposerState, get_composer_state
+from gemini_ocr import ComposerState, _is_attachment_present, _wait_for_js, get_composer_state
 
 # === Selektory 1:1 z gemini_ocr.py ===
 STOP_SELECTOR = "text=/Stop|Zatrzymaj|Anuluj|Cancel|Stop generating/i"
@@ -71,3 +71,83 @@ def test_state_ready_when_composer_has_text():
         COMPOSER_SELECTOR: FakeLocator(count=1, visible=True, text="hello"),
     })
     assert get_composer_state(page) == ComposerState.READY
+
+
+class FakeEvalPage(FakePage):
+    """Fake Page z evaluate() — ścieżka jednego round tripu (snapshot)."""
+    def __init__(self, snapshot):
+        super().__init__({})
+        self.snapshot = snapshot
+        self.evaluate_calls = 0
+
+    def evaluate(self, _script):
+        self.evaluate_calls += 1
+        return self.snapshot
+
+
+def _snap(analyzing=False, attached=False, visible=True, text=""):
+    return {"analyzing": analyzing, "attached": attached, "composerVisible": visible, "text": text}
+
+
+@pytest.mark.parametrize(
+    "snapshot, expected",
+    [
+        (_snap(analyzing=True, attached=True), ComposerState.ANALYZING),
+        (_snap(attached=True), ComposerState.ATTACHED),
+        (_snap(text="   "), ComposerState.EMPTY),
+        (_snap(text="hello"), ComposerState.READY),
+        (_snap(visible=False), ComposerState.READY),
+    ],
+)
+def test_state_from_single_evaluate_snapshot(snapshot, expected):
+    page = FakeEvalPage(snapshot)
+    assert get_composer_state(page) == expected
+    assert page.evaluate_calls == 1
+
+
+@pytest.mark.parametrize("flag", [True, False])
+def test_attachment_present_uses_single_evaluate(flag):
+    page = FakeEvalPage(flag)
+    page.mapping = {ATTACHMENT_SELECTOR: FakeLocator(count=1, visible=True)}
+    assert _is_attachment_present(page) is flag
+    assert page.evaluate_calls == 1
+
+
+def test_attachment_present_falls_back_to_locators_without_evaluate():
+    page = FakePage({ATTACHMENT_SELECTOR: FakeLocator(count=1, visible=True)})
+    assert _is_attachment_present(page) is True
+
+
+class FakeWaitPage:
+    """Fake Page: wait_for_function zwraca/rzuca kolejno podane wyniki."""
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+        self.sleeps = 0
+
+    def wait_for_function(self, _script, timeout, polling):
+        self.calls += 1
+        r = self.results.pop(0)
+        if isinstance(r, Exception):
+            raise r
+        return type("Handle", (), {"json_value": lambda _self: r})()
+
+    def wait_for_timeout(self, _ms):
+        self.sleeps += 1
+
+
+def test_wait_for_js_resumes_after_navigation():
+    page = FakeWaitPage(
+        RuntimeError("Execution context was destroyed, most likely because of a navigation"),
+        "stop",
+    )
+    assert _wait_for_js(page, "() => 1", 5000) == "stop"
+    assert page.calls == 2
+
+
+def test_wait_for_js_raises_broken_predicate_immediately():
+    page = FakeWaitPage(RuntimeError("SyntaxError: Unexpected token ')'"), "never")
+    with pytest.raises(RuntimeError, match="SyntaxError"):
+        _wait_for_js(page, "() => (", 180000)
+    assert page.calls == 1
+    assert page.sleeps == 0
@@ -0,0 +1,51 @@
+"""
+Predykaty JS z gemini_ocr.py uruchamiane w node na minimalnym, sztucznym DOM
+(bez przeglądarki). Sprawdza tylko logikę wyszukiwania tekstu.
+"""
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from gemini_ocr import _ATTACH_JS, _GEN_STOPPED_JS, _SEND_STARTED_JS
+
+NODE = shutil.which("node")
+pytestmark = pytest.mark.skipif(NODE is None, reason="node not installed")
+
+# Węzły tekstowe w kolejności dokumentu: [tag rodzica, widoczny?, tekst]
+_FAKE_DOM = r"""
+const NodeFilter = { SHOW_TEXT: 4 };
+const texts = NODES.map(([tagName, shown, value]) => ({
+    nodeValue: value,
+    parentElement: { tagName, shown, getBoundingClientRect: () => ({ width: shown ? 10 : 0, height: shown ? 10 : 0 }) },
+}));
+const getComputedStyle = () => ({ visibility: 'visible' });
+const document = {
+    body: {},
+    createTreeWalker: () => { let i = 0; return { nextNode: () => texts[i++] || null }; },
+    querySelector: () => null,
+    querySelectorAll: () => [],
+};
+"""
+
+
+def _run(script: str, nodes) -> object:
+    src = f"const NODES = {json.dumps(nodes)};\n{_FAKE_DOM}\nconsole.log(JSON.stringify(({script})()));"
+    out = subprocess.run([NODE, "-e", src], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def test_script_and_style_text_is_ignored():
+    nodes = [["SCRIPT", False, '{"files":[],"label":"Stop"}'], ["STYLE", False, ".files{}"]]
+    assert _run(_ATTACH_JS, nodes) is False
+    assert _run(_GEN_STOPPED_JS, nodes) is True
+
+
+def test_hidden_match_does_not_hide_visible_one():
+    nodes = [["SPAN", False, "Stop"], ["SCRIPT", False, "Stop"], ["BUTTON", True, "Stop generating"]]
+    assert _run(_GEN_STOPPED_JS, nodes) is False
+    assert _run(_SEND_STARTED_JS, nodes) == "stop"
+
+    assert _run(_ATTACH_JS, [["DIV", False, "Uploaded files"]]) is False
+    assert _run(_ATTACH_JS, [["DIV", False, "files"], ["SPAN", True, "plik.jpg"]]) is True
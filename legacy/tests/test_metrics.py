@@ -20,3 +20,19 @@ def test_metrics_error():
     assert m.error_reason == "Timeout"
     assert m.attempts == 2
     assert "reason=Timeout" in str(m)
+
+def test_metrics_sink_writes_lines_in_order():
+    import io
+    from gemini_metrics import MetricsSink
+
+    buf = io.StringIO()
+    sink = MetricsSink(buf, flush_every=2, flush_interval_s=0.01)
+    for i in range(5):
+        m = DocumentMetrics(file_name=f"doc_{i}.jpg", start_ts=time.time())
+        m.finish("success")
+        sink.emit(m)
+    sink.close()
+
+    lines = buf.getvalue().splitlines()
+    assert len(lines) == 5
+    assert [l.split(" | ")[0] for l in lines] == [f"METRICS: file=doc_{i}.jpg" for i in range(5)]
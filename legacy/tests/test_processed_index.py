@@ -0,0 +1,37 @@
+import os
+
+from gemini_ocr import ProcessedIndex
+
+
+def test_processed_index_persists_and_skips(tmp_path):
+    img = tmp_path / "a.jpg"
+    img.write_bytes(b"x")
+    idx_path = tmp_path / "idx" / "processed_index.jsonl"
+
+    idx = ProcessedIndex(idx_path)
+    assert img not in idx
+    idx.add(img)
+    idx.add(img)
+    assert img in idx
+    assert len(idx_path.read_text(encoding="utf-8").splitlines()) == 1
+
+    # Nowy proces widzi wpis z pliku.
+    assert img in ProcessedIndex(idx_path)
+
+
+def test_processed_index_changed_file_is_not_skipped(tmp_path):
+    img = tmp_path / "a.jpg"
+    img.write_bytes(b"x")
+    idx_path = tmp_path / "processed_index.jsonl"
+    ProcessedIndex(idx_path).add(img)
+
+    img.write_bytes(b"xyz")
+    st = img.stat()
+    os.utime(img, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert img not in ProcessedIndex(idx_path)
+
+
+def test_processed_index_ignores_corrupt_lines(tmp_path):
+    idx_path = tmp_path / "processed_index.jsonl"
+    idx_path.write_text('{"key": "x"}\nnot json\n{}\n', encoding="utf-8")
+    assert len(ProcessedIndex(idx_path)) == 1
@@ -0,0 +1,54 @@
+import argparse
+
+import pytest
+
+import gemini_ocr
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    seen = []
+
+    def step(name, ok):
+        def _fn(*_a, **_kw):
+            seen.append(name)
+            return ok
+        return _fn
+
+    def setup(cleanup_ok, new_chat_ok):
+        monkeypatch.setattr(gemini_ocr, "cleanup_composer", step("cleanup", cleanup_ok))
+        monkeypatch.setattr(gemini_ocr, "start_new_chat", step("new_chat", new_chat_ok))
+        monkeypatch.setattr(gemini_ocr, "reload_gemini", step("reload", None))
+        return seen
+
+    return setup
+
+
+ARGS = argparse.Namespace(timeout_ms=1000)
+
+
+@pytest.mark.parametrize(
+    "cleanup_ok, new_chat_ok, expected",
+    [
+        (True, True, ["cleanup"]),
+        (False, True, ["cleanup", "new_chat"]),
+        (False, False, ["cleanup", "new_chat", "reload"]),
+    ],
+)
+def test_recover_page_stops_at_first_working_step(calls, cleanup_ok, new_chat_ok, expected):
+    seen = calls(cleanup_ok, new_chat_ok)
+    assert gemini_ocr.recover_page(object(), ARGS, None) == expected[-1]
+    assert seen == expected
+
+
+def test_reload_gemini_backs_off_then_raises(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(gemini_ocr.time, "sleep", sleeps.append)
+
+    def boom(*_a, **_kw):
+        raise RuntimeError("net")
+
+    monkeypatch.setattr(gemini_ocr, "goto_gemini", boom)
+    with pytest.raises(RuntimeError):
+        gemini_ocr.reload_gemini(object(), timeout_ms=1, debug_dir=None, attempts=3, base_delay_s=1.0)
+    assert sleeps == [1.0, 2.0]
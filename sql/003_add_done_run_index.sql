@@ -0,0 +1,3 @@
+-- Partial index for "is there a done run for this document" lookups (OcrRepo.has_successful_run)
+
+CREATE INDEX IF NOT EXISTS ocr_run_done_doc_idx ON ocr_run (doc_id) WHERE status = 'done';
@@ -0,0 +1,90 @@
+"""
+Persistent sha256 cache keyed on (path, size, mtime_ns).
+
+Lets --resume / --retry-failed runs skip re-reading files that were already hashed
+by a previous run: a hit costs one stat() + one indexed SELECT.
+Disabled unless open_cache() is called (CLI: --hash-cache / OCR_HASH_CACHE).
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+COMMIT_EVERY = 100
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_pending = 0
+
+
+def open_cache(db_path: Union[str, Path]) -> None:
+    """Open (or create) the cache database. Safe to call again with another path."""
+    global _conn, _pending
+    db_path = Path(db_path).expanduser()
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    close()
+    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS h (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha TEXT)"
+    )
+    conn.commit()
+    with _lock:
+        _conn = conn
+        _pending = 0
+
+
+def is_open() -> bool:
+    return _conn is not None
+
+
+def get(path: str, size: int, mtime_ns: int) -> Optional[str]:
+    """Digest stored for path, or None if missing or the file changed since."""
+    if _conn is None:
+        return None
+    with _lock:
+        if _conn is None:
+            return None
+        row = _conn.execute("SELECT size, mtime_ns, sha FROM h WHERE path = ?", (path,)).fetchone()
+    if row and row[0] == size and row[1] == mtime_ns:
+        return row[2]
+    return None
+
+
+def put(path: str, size: int, mtime_ns: int, sha: str) -> None:
+    """Store digest; commits every COMMIT_EVERY inserts (and on close())."""
+    global _pending
+    if _conn is None:
+        return
+    with _lock:
+        if _conn is None:
+            return
+        _conn.execute(
+            "INSERT OR REPLACE INTO h (path, size, mtime_ns, sha) VALUES (?, ?, ?, ?)",
+            (path, size, mtime_ns, sha),
+        )
+        _pending += 1
+        if _pending >= COMMIT_EVERY:
+            _conn.commit()
+            _pending = 0
+
+
+def close() -> None:
+    """Commit pending inserts and close the database."""
+    global _conn, _pending
+    with _lock:
+        conn, _conn = _conn, None
+        _pending = 0
+    if conn is not None:
+        try:
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def default_path() -> Optional[str]:
+    return os.environ.get("OCR_HASH_CACHE") or None
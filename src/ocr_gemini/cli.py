@@ -2,28 +2,93 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import heapq
 import os
 import sys
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import List, Optional, Set
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
+from . import _hashcache
 from .config import PipelineConfig
 from .db import db_config_from_env
 from .db.repo import OcrRepo
-from .engine.errors import ErrorKind, classify_error
+from .engine.errors import ErrorKind, classify_error, parse_error_kinds
 from .engine.playwright_engine import PlaywrightEngine
-from .engine.retry_logic import decide_retry_action
+from .engine.retry_logic import backoff_delay, decide_retry_action
 from .files import sha256_file
 
 IMAGE_EXTS: Set[str] = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp"}
 
 
+# str.endswith(tuple) runs in C; the cased tuple covers "x.png"/"X.PNG" without allocating,
+# lower() is only needed for mixed-case names like "x.Png".
+_EXT_LOWER = tuple(sorted(IMAGE_EXTS))
+_EXT_CASED = _EXT_LOWER + tuple(e.upper() for e in _EXT_LOWER)
+
+
+def _is_image_name(name: str) -> bool:
+    """Same result as Path(name).suffix.lower() in IMAGE_EXTS, without building a Path."""
+    if not (name.endswith(_EXT_CASED) or name.lower().endswith(_EXT_LOWER)):
+        return False
+    # ".png" alone has no suffix (dotfile), ".x.png" does
+    return "." in name[1:]
+
+
+def _iter_images_sorted(top: str) -> Iterator[Path]:
+    """
+    Recursive scandir walk yielding image paths already in str(path) order.
+
+    Entries of each directory are visited sorted by name, with directories keyed
+    as "name/" - the same prefix every path below them shares - so the DFS order
+    equals a global sort of the full path strings. That lets callers stop after
+    `limit` hits instead of listing the whole tree first.
+    Hidden directories are pruned and symlinked directories are not followed
+    (same as the previous os.walk(followlinks=False) scan).
+    """
+    stack: List[Iterator[Tuple[str, str, bool]]] = []
+
+    def _push(path: str) -> None:
+        items: List[Tuple[str, str, bool]] = []
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    try:
+                        is_dir = e.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if e.name.startswith(".") or e.is_symlink():
+                            continue
+                        items.append((e.name + "/", e.path, True))
+                    elif _is_image_name(e.name):
+                        items.append((e.name, e.path, False))
+        except OSError:
+            return
+        items.sort()
+        stack.append(iter(items))
+
+    _push(top)
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            continue
+        _, path, is_dir = item
+        if is_dir:
+            _push(path)
+        else:
+            yield Path(path)
+
+
 def _scan_images(input_dir: Path, recursive: bool, limit: int) -> List[Path]:
     """
     Fast scan for images.
-    - recursive=False: only direct children (iterdir)
-    - recursive=True: os.walk (streaming) + early stop when limit reached
+    - recursive=False: only direct children (scandir)
+    - recursive=True: sorted scandir DFS + early stop when limit reached
 
     Returns list of image paths (sorted for determinism).
     """
@@ -36,33 +101,164 @@ def _scan_images(input_dir: Path, recursive: bool, limit: int) -> List[Path]:
     lim = int(limit) if limit else 0
 
     if not recursive:
-        for p in input_dir.iterdir():
-            if p.is_file() and p.suffix.lower() in IMAGE_EXTS:
-                found.append(p)
-
-        # Sort ALL found, then slice to ensure deterministic order regardless of FS iteration
-        # Requirement: Sort by string form of path to handle subfolders deterministically
-        found.sort(key=str)
+        # DirEntry.is_file() answers from readdir's d_type (no stat per entry, unlike Path.is_file)
+        names: List[str] = []
+        with os.scandir(input_dir) as it:
+            for e in it:
+                if _is_image_name(e.name) and e.is_file():
+                    names.append(e.name)
+
+        # Sort ALL found, then slice to ensure deterministic order regardless of FS iteration.
+        # All entries share the parent prefix, so sorting names == sorting str(path).
         if lim:
-            return found[:lim]
-        return found
-
-    # recursive walk
-    for root, dirnames, filenames in os.walk(input_dir, followlinks=False):
-        # optionally prune hidden dirs
-        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            names = heapq.nsmallest(lim, names)
+        else:
+            names.sort()
+        return [input_dir / n for n in names]
 
-        for fn in filenames:
-            p = Path(root) / fn
-            if p.suffix.lower() in IMAGE_EXTS:
-                found.append(p)
-
-    # Sort ALL found, then slice
+    # recursive walk: results already come in str(path) order, so stop at the limit
     # Requirement: Sort by string form of path to handle subfolders deterministically
-    found.sort(key=str)
+    images = _iter_images_sorted(os.fspath(input_dir))
     if lim:
-        return found[:lim]
-    return found
+        return list(islice(images, lim))
+    return list(images)
+
+
+def _open_dir_fd(path: Path) -> Optional[int]:
+    """Directory FD for relative writes (POSIX only); None -> fall back to path writes."""
+    if os.open not in os.supports_dir_fd or not hasattr(os, "O_DIRECTORY"):
+        return None
+    try:
+        return os.open(path, os.O_RDONLY | os.O_DIRECTORY | getattr(os, "O_CLOEXEC", 0))
+    except OSError:
+        return None
+
+
+def _write_text(out_root: str, dir_fd: Optional[int], name: str, text: str) -> str:
+    """
+    Write UTF-8 text as out_root/name (returned as str); with dir_fd the kernel skips the full path walk.
+    The text is encoded once and written in binary mode to name + ".tmp", then renamed over name,
+    so an interrupted run never leaves a truncated .txt (which --resume without DB would treat as done).
+    """
+    data = text.encode("utf-8")
+    tmp = name + ".tmp"
+    if dir_fd is None:
+        out = os.path.join(out_root, name)
+        tmp_path = os.path.join(out_root, tmp)
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, out)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+        return out
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_CLOEXEC", 0), 0o644, dir_fd=dir_fd)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        os.replace(tmp, name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp, dir_fd=dir_fd)
+        raise
+    return os.path.join(out_root, name)
+
+
+class _Sha256Prefetch:
+    """
+    Hashes the next `depth` images on worker threads while the current one is in OCR.
+    hashlib releases the GIL, so the digests are ready by the time the loop needs them.
+    depth=0 disables prefetching (hash inline).
+    """
+
+    def __init__(self, paths: List[Path], depth: int) -> None:
+        self._paths = paths
+        self._depth = max(0, int(depth))
+        self._futures: Dict[int, Future] = {}
+        self._next = 0
+        self._pool = ThreadPoolExecutor(max_workers=self._depth, thread_name_prefix="sha256") if self._depth else None
+
+    def get(self, i: int) -> str:
+        if self._pool is None:
+            return sha256_file(self._paths[i])
+        # indices passed over (skipped images) will never be asked for: stop hashing them
+        for k in [k for k in self._futures if k < i]:
+            self._futures.pop(k).cancel()
+        self._next = max(self._next, i)
+        while self._next < len(self._paths) and self._next <= i + self._depth:
+            self._futures[self._next] = self._pool.submit(sha256_file, self._paths[self._next])
+            self._next += 1
+        fut = self._futures.pop(i, None)
+        return fut.result() if fut is not None else sha256_file(self._paths[i])
+
+    def ready(self, i: int) -> bool:
+        """True if get(i) would return without hashing or waiting."""
+        fut = self._futures.get(i)
+        return fut is not None and fut.done() and fut.exception() is None
+
+    def close(self) -> None:
+        if self._pool is not None:
+            for fut in self._futures.values():
+                fut.cancel()
+            self._pool.shutdown(wait=True)
+
+
+class _Preflight:
+    """
+    DB pre-flight (doc_id + latest run) for several images per round trip.
+    The batch is the current image plus following ones whose hash is already prefetched,
+    so batching never makes the loop wait for extra hashing. Two queries per batch
+    instead of two per image; a DB error is re-raised for every image of its batch.
+    """
+
+    def __init__(
+        self,
+        repo: OcrRepo,
+        images: List[Path],
+        hashes: _Sha256Prefetch,
+        pipeline: str,
+        skip: Callable[[Path], bool],
+        max_batch: int,
+    ) -> None:
+        self._repo = repo
+        self._images = images
+        self._hashes = hashes
+        self._pipeline = pipeline
+        self._skip = skip
+        self._max_batch = max(1, int(max_batch))
+        self._results: Dict[int, object] = {}
+
+    def get(self, i: int) -> Tuple[int, Optional[Dict[str, Any]]]:
+        if i not in self._results:
+            self._fill(i)
+        res = self._results.pop(i)
+        if isinstance(res, Exception):
+            raise res
+        return res  # type: ignore[return-value]
+
+    def _fill(self, i: int) -> None:
+        batch = [i]
+        j = i + 1
+        while len(batch) < self._max_batch and j < len(self._images) and self._hashes.ready(j):
+            if j not in self._results and not self._skip(self._images[j]):
+                batch.append(j)
+            j += 1
+        try:
+            rows = [(str(self._images[k]), self._hashes.get(k)) for k in batch]
+            doc_ids = self._repo.bulk_get_or_create_documents(rows)
+            runs = self._repo.bulk_get_latest_runs(list(doc_ids.values()), self._pipeline)
+            for k, (path, _) in zip(batch, rows):
+                doc_id = doc_ids[path]
+                self._results[k] = (doc_id, runs.get(doc_id))
+        except Exception as e:
+            for k in batch:
+                self._results[k] = e
 
 
 def main() -> None:
@@ -76,6 +272,31 @@ def main() -> None:
 
     # NEW
     parser.add_argument("--recursive", action="store_true", help="Scan input directory recursively")
+    parser.add_argument(
+        "--shard-count",
+        type=int,
+        default=1,
+        help="Split the sorted image list across N processes (each with its own --profile-dir)",
+    )
+    parser.add_argument("--shard-index", type=int, default=0, help="Which shard (0..N-1) this process takes")
+    parser.add_argument(
+        "--hash-prefetch",
+        type=int,
+        default=4,
+        help="Hash this many upcoming images in background threads (0 = hash inline)",
+    )
+    parser.add_argument(
+        "--preflight-batch",
+        type=int,
+        default=32,
+        help="Max images per DB pre-flight round trip (only already-hashed images are batched)",
+    )
+    parser.add_argument(
+        "--hash-cache",
+        type=Path,
+        default=_hashcache.default_path(),
+        help="SQLite file caching sha256 by (path, size, mtime) across runs (env: OCR_HASH_CACHE)",
+    )
 
     # Stage 1.5 args
     parser.add_argument("--resume", action="store_true", help="Resume failed/missing runs only")
@@ -85,6 +306,16 @@ def main() -> None:
     parser.add_argument("--retry-failed", action="store_true", help="Retry failed documents (requires DB)")
     parser.add_argument("--max-attempts", type=int, default=3, help="Max attempts per document")
     parser.add_argument("--retry-backoff-seconds", type=int, default=0, help="Wait between attempts (seconds)")
+    parser.add_argument(
+        "--retry-base-delay",
+        type=float,
+        default=1.0,
+        help="Base wait (seconds) after an in-attempt recovery; doubles per recovery, 0 disables",
+    )
+    parser.add_argument("--retry-max-delay", type=float, default=30.0, help="Cap for any retry wait (seconds)")
+    parser.add_argument(
+        "--retry-jitter", type=float, default=0.5, help="Random extra wait, as a fraction of the delay (0..1)"
+    )
     parser.add_argument(
         "--retry-error-kinds",
         type=str,
@@ -94,7 +325,7 @@ def main() -> None:
 
     args = parser.parse_args()
 
-    retry_kinds = [k.strip().lower() for k in (args.retry_error_kinds or "").split(",") if k.strip()]
+    retry_kinds = parse_error_kinds(args.retry_error_kinds or "")
 
     cfg = PipelineConfig(
         ocr_root=args.input_dir,
@@ -108,6 +339,9 @@ def main() -> None:
         retry_failed=bool(args.retry_failed),
         max_attempts=int(args.max_attempts),
         retry_backoff_seconds=int(args.retry_backoff_seconds),
+        retry_base_delay=float(args.retry_base_delay),
+        retry_max_delay=float(args.retry_max_delay),
+        retry_jitter=float(args.retry_jitter),
         retry_error_kinds=retry_kinds,
     )
 
@@ -115,6 +349,12 @@ def main() -> None:
         print(f"Error: Input directory {cfg.ocr_root} does not exist.")
         sys.exit(1)
 
+    shard_count = int(args.shard_count or 1)
+    shard_index = int(args.shard_index or 0)
+    if shard_count < 1 or not (0 <= shard_index < shard_count):
+        print(f"Error: invalid shard {shard_index}/{shard_count}.")
+        sys.exit(1)
+
     cfg.out_root.mkdir(parents=True, exist_ok=True)
     if cfg.debug_dir:
         cfg.debug_dir.mkdir(parents=True, exist_ok=True)
@@ -135,12 +375,31 @@ def main() -> None:
         sys.exit(1)
 
     # FAST scan (with early stop on limit)
-    images = _scan_images(cfg.ocr_root, recursive=bool(args.recursive), limit=int(cfg.limit))
+    # --limit is per process: with shards, scan limit*N so every shard can still get `limit` images
+    scan_limit = int(cfg.limit) * shard_count
+    images = _scan_images(cfg.ocr_root, recursive=bool(args.recursive), limit=scan_limit)
+    if shard_count > 1:
+        images = images[shard_index::shard_count]
+        print(f"Shard {shard_index}/{shard_count}")
 
     if not images:
         print(f"No images found in {cfg.ocr_root}")
         return
 
+    # Offline manifest: one bulk lookup instead of a hash + DB round trip per finished file.
+    done_paths: Set[str] = set()
+    done_stems: Set[str] = set()
+    if not cfg.force:
+        if repo:
+            try:
+                done_paths = set(repo.get_done_source_paths(cfg.pipeline_name))
+            except Exception as e:
+                print(f"Warning: could not preload done documents: {e}")
+        elif cfg.resume:
+            # no DB: an existing <stem>.txt in out-dir means the image was already transcribed
+            with os.scandir(cfg.out_root) as it:
+                done_stems = {e.name[:-4] for e in it if e.name.endswith(".txt")}
+
     print(f"Processing {len(images)} images...")
 
     engine = PlaywrightEngine(
@@ -149,6 +408,28 @@ def main() -> None:
         debug_dir=cfg.debug_dir,
     )
 
+    if repo and args.hash_cache:
+        try:
+            _hashcache.open_cache(args.hash_cache)
+        except Exception as e:
+            print(f"Warning: hash cache disabled: {e}")
+
+    hashes = _Sha256Prefetch(images, args.hash_prefetch if repo else 0)
+
+    def _stem(p: Path) -> str:
+        # images always carry an extension (_is_image_name), so this equals p.stem
+        name = p.name
+        return name[:name.rindex(".")]
+
+    def _already_done(p: Path) -> bool:
+        return (bool(done_paths) and str(p) in done_paths) or (bool(done_stems) and _stem(p) in done_stems)
+
+    preflight = (
+        _Preflight(repo, images, hashes, cfg.pipeline_name, _already_done, args.preflight_batch) if repo else None
+    )
+    out_fd = _open_dir_fd(cfg.out_root)
+    out_root_str = os.fspath(cfg.out_root)
+
     try:
         print("Starting engine...")
         engine.start()
@@ -156,6 +437,10 @@ def main() -> None:
         for i, img_path in enumerate(images):
             print(f"[{i + 1}/{len(images)}] Checking {img_path.name}...")
 
+            if _already_done(img_path):
+                print("  SKIPPING: Already done")
+                continue
+
             run_id = None
             doc_id = None
             last_run = None
@@ -163,11 +448,9 @@ def main() -> None:
             attempt_no = 1
             parent_run_id = None
 
-            if repo:
+            if preflight:
                 try:
-                    s256 = sha256_file(img_path)
-                    doc_id = repo.get_or_create_document(str(img_path), s256)
-                    last_run = repo.get_latest_run(doc_id, cfg.pipeline_name)
+                    doc_id, last_run = preflight.get(i)
 
                     decision = decide_retry_action(last_run, cfg)
 
@@ -187,16 +470,22 @@ def main() -> None:
                     parent_run_id = None
 
             # Backoff (between attempts)
+            # --retry-backoff-seconds is the base: attempt 2 waits ~S, attempt 3 ~2S, ...
             if attempt_no > 1 and cfg.retry_backoff_seconds > 0:
-                print(f"  Waiting {cfg.retry_backoff_seconds}s before retry...")
-                time.sleep(cfg.retry_backoff_seconds)
+                delay = backoff_delay(
+                    cfg.retry_backoff_seconds,
+                    attempt_no - 2,
+                    max_delay=max(cfg.retry_max_delay, cfg.retry_backoff_seconds),
+                    jitter=cfg.retry_jitter,
+                )
+                print(f"  Waiting {delay:.1f}s before retry...")
+                time.sleep(delay)
 
-            # Create run row
+            # Create run row (already 'processing', with the engine_start step)
             if repo:
-                run_id = repo.create_run(
+                run_id = repo.start_run(
                     doc_id,
                     cfg.pipeline_name,
-                    status="queued",
                     attempt_no=attempt_no,
                     parent_run_id=parent_run_id,
                 )
@@ -207,19 +496,21 @@ def main() -> None:
 
             while True:
                 try:
-                    if repo and run_id:
-                        repo.mark_run_status(run_id, "processing")
+                    if repo and run_id and recovery_count:
                         repo.mark_step(run_id, "engine_start", "started")
 
                     result = engine.ocr(img_path, prompt_id=cfg.prompt_id)
 
-                    out_txt = cfg.out_root / f"{img_path.stem}.txt"
-                    out_txt.write_text(result.text, encoding="utf-8")
+                    out_txt = _write_text(out_root_str, out_fd, _stem(img_path) + ".txt", result.text)
                     print(f"  OK: Saved to {out_txt}")
 
                     if repo and run_id:
-                        repo.mark_run_status(run_id, "done", out_path=str(out_txt))
-                        repo.mark_step(run_id, "engine_finish", "done")
+                        repo.finish_run(
+                            run_id,
+                            "done",
+                            out_path=out_txt,
+                            steps=[("engine_finish", "done", None)],
+                        )
 
                     break
 
@@ -249,21 +540,24 @@ def main() -> None:
                                     error_message=str(rec_e),
                                 )
 
+                        delay = backoff_delay(
+                            cfg.retry_base_delay,
+                            recovery_count - 1,
+                            max_delay=cfg.retry_max_delay,
+                            jitter=cfg.retry_jitter,
+                        )
+                        if delay > 0:
+                            time.sleep(delay)
                         continue
 
                     # Final failure for this attempt
                     if repo and run_id:
-                        repo.mark_run_status(
+                        repo.finish_run(
                             run_id,
                             "failed",
                             error_message=str(e),
                             error_kind=kind.value,
-                        )
-                        repo.mark_step(
-                            run_id,
-                            "engine_finish",
-                            "failed",
-                            error_message=str(e),
+                            steps=[("engine_finish", "failed", str(e))],
                         )
                     break
 
@@ -276,7 +570,20 @@ def main() -> None:
         except Exception:
             pass
 
+        hashes.close()
+        if out_fd is not None:
+            try:
+                os.fsync(out_fd)  # one directory sync at the end, not per file
+            except OSError:
+                pass
+            os.close(out_fd)
+        _hashcache.close()
+
         if repo:
+            try:
+                repo.commit()  # pre-flight upserts of trailing skipped images
+            except Exception:
+                pass
             try:
                 repo.close()
             except Exception:
@@ -1,25 +1,31 @@
 from __future__ import annotations
 
 import os
+import sys
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, List
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, Optional
+
+from .engine.errors import ErrorKind, parse_error_kinds
 
 
 def _get_int(env_var: str, default: int) -> int:
-    """Read int from env, fallback to default on missing/invalid."""
+    """Read int from env, fallback to default on missing/empty; warn and fallback on invalid."""
+    val = os.environ.get(env_var)
+    if not val:
+        return default
     try:
-        val = os.getenv(env_var)
-        if val:
-            return int(val)
+        return int(val)
     except ValueError:
-        pass
-    return default
+        print(f"Warning: invalid {env_var}={val!r}, using default {default}", file=sys.stderr)
+        return default
 
 
 # Centralized timeouts (in milliseconds) used by UI automation (Playwright).
 # NOTE: Stage 1 only переносит конфиг; UI code will use this later.
-UI_TIMEOUTS: dict[str, int] = {
+# Parsed once at import and exposed read-only.
+UI_TIMEOUTS: Mapping[str, int] = MappingProxyType({
     # Page load / navigation
     "PAGE_LOAD": _get_int("GEMINI_TIMEOUT_PAGE_LOAD", 180_000),
     "FIND_COMPOSER": _get_int("GEMINI_TIMEOUT_FIND_COMPOSER", 60_000),
@@ -34,7 +40,7 @@ UI_TIMEOUTS: dict[str, int] = {
     "GEN_DONE": _get_int("GEMINI_TIMEOUT_GEN_DONE", 240_000),
     # Cleanup / Recovery
     "CLEANUP_WAIT": _get_int("GEMINI_TIMEOUT_CLEANUP_WAIT", 5_000),
-}
+})
 
 
 @dataclass
@@ -54,6 +60,8 @@ class PipelineConfig:
     processing_by: str = "ocr-gemini-pipeline"
     debug_dir: Optional[Path] = None
     ui_timeout_ms: int = 180_000
+    # Pipeline: commit co N udanych plików (1 = po każdym); błąd cofa tylko bieżący plik (SAVEPOINT)
+    commit_every: int = 1
 
     # Stage 1.5+
     resume: bool = False
@@ -63,4 +71,15 @@ class PipelineConfig:
     retry_failed: bool = False
     max_attempts: int = 3
     retry_backoff_seconds: int = 0
-    retry_error_kinds: List[str] = field(default_factory=lambda: ["transient", "unknown"])
+    # exponential backoff + jitter (engine.retry_logic.backoff_delay)
+    retry_base_delay: float = 1.0
+    retry_max_delay: float = 30.0
+    retry_jitter: float = 0.5
+    retry_error_kinds: FrozenSet[ErrorKind] = field(
+        default_factory=lambda: frozenset({ErrorKind.TRANSIENT, ErrorKind.UNKNOWN})
+    )
+
+    def __post_init__(self) -> None:
+        # accept lists / comma strings too; decide_retry_action only needs O(1) membership
+        if not isinstance(self.retry_error_kinds, frozenset):
+            self.retry_error_kinds = parse_error_kinds(self.retry_error_kinds)
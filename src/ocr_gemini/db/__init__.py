@@ -75,6 +75,27 @@ class MinimalDbWriter:
         if self.conn:
             self.conn.rollback()
 
+    def savepoint(self) -> None:
+        """Początek zapisów jednego pliku w paczce (Pipeline, commit_every > 1)."""
+        self.connect()
+        with self.conn.cursor() as cur:
+            cur.execute("SAVEPOINT ocr_file")
+
+    def release_savepoint(self) -> None:
+        """
+        Zamyka savepoint udanego pliku. Bez tego paczka commit_every=N trzyma N
+        zagnieżdżonych subtransakcji (powyżej 64 przepełnia się cache subxid w PostgreSQL).
+        """
+        if self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute("RELEASE SAVEPOINT ocr_file")
+
+    def rollback_to_savepoint(self) -> None:
+        """Cofa tylko zapisy od ostatniego savepoint(); reszta transakcji zostaje."""
+        if self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute("ROLLBACK TO SAVEPOINT ocr_file")
+
     def upsert_document(
         self,
         *,
@@ -1,37 +1,103 @@
 from __future__ import annotations
-import psycopg2
-from typing import Optional, Dict, Any, Tuple
+import csv
+import io
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from typing import Optional, Dict, Any, Iterator, List, Sequence, Set, Tuple
 from . import DbConfig
 
 class OcrRepo:
+    """
+    Writes go through one pooled connection held for the repo's lifetime (explicit
+    commit/rollback); reads borrow autocommit connections from a separate pool, so
+    lookups never sit inside (or extend) the write transaction.
+    """
+
+    WRITE_POOL_MAX = 2
+    READ_POOL_MAX = 4
+    # mark_step rows buffered before an automatic flush_steps()
+    STEP_FLUSH_ROWS = 64
+
     def __init__(self, cfg: DbConfig):
         self.cfg = cfg
         self.conn = None
+        self._write_pool: Optional[ThreadedConnectionPool] = None
+        self._read_pool: Optional[ThreadedConnectionPool] = None
+        # names from _PREPARED already PREPAREd on self.conn
+        self._prepared: Set[str] = set()
+        # (run_id, step_name, status, error_message, created_at) waiting for flush_steps()
+        self._step_buffer: List[Tuple[int, str, str, Optional[str], str]] = []
+
+    def _new_pool(self, maxconn: int) -> ThreadedConnectionPool:
+        # minconn=1: psycopg2 pools close returned connections beyond minconn, so keep one warm
+        if self.cfg.dsn:
+            return ThreadedConnectionPool(1, maxconn, self.cfg.dsn)
+        return ThreadedConnectionPool(
+            1,
+            maxconn,
+            host=self.cfg.host,
+            port=self.cfg.port,
+            dbname=self.cfg.dbname,
+            user=self.cfg.user,
+            password=self.cfg.password,
+        )
 
     def connect(self):
         if self.conn and not self.conn.closed:
             return
-        if self.cfg.dsn:
-            self.conn = psycopg2.connect(self.cfg.dsn)
-        else:
-            self.conn = psycopg2.connect(
-                host=self.cfg.host,
-                port=self.cfg.port,
-                dbname=self.cfg.dbname,
-                user=self.cfg.user,
-                password=self.cfg.password,
-            )
+        if self._write_pool is None:
+            self._write_pool = self._new_pool(self.WRITE_POOL_MAX)
+        if self.conn is not None:
+            self._write_pool.putconn(self.conn, close=True)
+        self.conn = self._write_pool.getconn()
         self.conn.autocommit = False
+        self._prepared = set()
+
+    def _execute_prepared(self, cur: Any, name: str, params: Sequence[Any]) -> None:
+        """EXECUTE statement `name` from _PREPARED, PREPAREing it first on a new connection."""
+        if name not in self._prepared:
+            types, sql = _PREPARED[name]
+            cur.execute(f"PREPARE {name} ({types}) AS {sql}")
+            self._prepared.add(name)
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", tuple(params))
+
+    @contextmanager
+    def _read_cursor(self) -> Iterator[Any]:
+        if self._read_pool is None:
+            self._read_pool = self._new_pool(self.READ_POOL_MAX)
+        conn = self._read_pool.getconn()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                yield cur
+        finally:
+            self._read_pool.putconn(conn, close=bool(conn.closed))
 
     def close(self):
-        if self.conn and not self.conn.closed:
-            self.conn.close()
+        if self._step_buffer and self.conn is not None and not self.conn.closed:
+            self.flush_steps()
+            self.conn.commit()
+        if self._write_pool is not None:
+            if self.conn is not None:
+                self._write_pool.putconn(self.conn, close=bool(self.conn.closed))
+            self._write_pool.closeall()
+            self._write_pool = None
+        self.conn = None
+        self._prepared = set()
+        if self._read_pool is not None:
+            self._read_pool.closeall()
+            self._read_pool = None
 
     def commit(self):
+        if self._step_buffer:
+            self.flush_steps()
         if self.conn:
             self.conn.commit()
 
     def rollback(self):
+        self._step_buffer.clear()
         if self.conn:
             self.conn.rollback()
 
@@ -43,17 +109,51 @@ class OcrRepo:
         ON CONFLICT (source_path) DO UPDATE SET
             source_sha256 = EXCLUDED.source_sha256,
             updated_at = NOW()
+        WHERE ocr_document.source_sha256 IS DISTINCT FROM EXCLUDED.source_sha256
         RETURNING doc_id
         """
         with self.conn.cursor() as cur:
             cur.execute(sql, (source_path, source_sha256))
             row = cur.fetchone()
+            if not row:
+                # unchanged sha256: the row was not rewritten, so nothing was RETURNed
+                cur.execute("SELECT doc_id FROM ocr_document WHERE source_path = %s", (source_path,))
+                row = cur.fetchone()
             if row:
                 return row[0]
             raise ValueError("Failed to get doc_id")
 
-    def has_successful_run(self, doc_id: int, pipeline: str) -> bool:
+    def bulk_get_or_create_documents(self, rows: Sequence[Tuple[str, Optional[str]]]) -> Dict[str, int]:
+        """
+        get_or_create_document for many (source_path, source_sha256) pairs in one statement.
+        source_path values must be unique within `rows`. Returns {source_path: doc_id}.
+        """
+        if not rows:
+            return {}
         self.connect()
+        sql = """
+        INSERT INTO ocr_document (source_path, source_sha256, updated_at)
+        VALUES %s
+        ON CONFLICT (source_path) DO UPDATE SET
+            source_sha256 = EXCLUDED.source_sha256,
+            updated_at = NOW()
+        WHERE ocr_document.source_sha256 IS DISTINCT FROM EXCLUDED.source_sha256
+        RETURNING source_path, doc_id
+        """
+        with self.conn.cursor() as cur:
+            result = execute_values(cur, sql, rows, template="(%s, %s, NOW())", page_size=len(rows), fetch=True)
+            doc_ids = {r[0]: r[1] for r in result}
+            # documents with an unchanged sha256 are left as they are (no new row version / WAL)
+            # and therefore not RETURNed
+            missing = [r[0] for r in rows if r[0] not in doc_ids]
+            if missing:
+                cur.execute(
+                    "SELECT source_path, doc_id FROM ocr_document WHERE source_path = ANY(%s)", (missing,)
+                )
+                doc_ids.update(cur.fetchall())
+        return doc_ids
+
+    def has_successful_run(self, doc_id: int, pipeline: str) -> bool:
         # Check if done, and ensure it belongs to the same pipeline if needed?
         # Actually, if a doc is done by ANY pipeline, usually we treat it as done?
         # But for strict consistency, maybe we should check pipeline.
@@ -71,40 +171,40 @@ class OcrRepo:
 
         # So: if ocr_document.pipeline == pipeline AND exists(ocr_run where status='done')
 
+        # Single EXISTS probe; with the partial index ocr_run_done_doc_idx
+        # (sql/003_add_done_run_index.sql) the run lookup touches only 'done' rows.
         sql = """
-        SELECT 1
-        FROM ocr_run r
-        JOIN ocr_document d ON r.doc_id = d.doc_id
-        WHERE d.doc_id = %s AND r.status = 'done' AND d.pipeline = %s
-        LIMIT 1
+        SELECT EXISTS (
+            SELECT 1
+            FROM ocr_document d
+            WHERE d.doc_id = %s AND d.pipeline = %s
+              AND EXISTS (SELECT 1 FROM ocr_run r WHERE r.doc_id = d.doc_id AND r.status = 'done')
+        )
         """
-        with self.conn.cursor() as cur:
+        with self._read_cursor() as cur:
             cur.execute(sql, (doc_id, pipeline))
-            return cur.fetchone() is not None
+            row = cur.fetchone()
+            return bool(row and row[0])
 
     def get_latest_run(self, doc_id: int, pipeline: str) -> Optional[Dict[str, Any]]:
-        self.connect()
-
         # Ensure we are looking at the history of the requested pipeline.
         # Since ocr_run doesn't have pipeline_id, we check ocr_document.pipeline.
         # If the document's last associated pipeline is different, we consider this a fresh start for the new pipeline.
-        check_sql = "SELECT pipeline FROM ocr_document WHERE doc_id = %s"
-        with self.conn.cursor() as cur:
-            cur.execute(check_sql, (doc_id,))
-            row = cur.fetchone()
-            if row and row[0] != pipeline:
-                 return None
-
-        # Fetch the most recent run for this document
+        # Pipeline check + most recent run in one round-trip: no row -> None.
         sql = """
-        SELECT run_id, status, attempt_no, error_kind
-        FROM ocr_run
-        WHERE doc_id = %s
-        ORDER BY run_id DESC
-        LIMIT 1
+        SELECT r.run_id, r.status, r.attempt_no, r.error_kind
+        FROM ocr_document d
+        JOIN LATERAL (
+            SELECT run_id, status, attempt_no, error_kind
+            FROM ocr_run
+            WHERE doc_id = d.doc_id
+            ORDER BY run_id DESC
+            LIMIT 1
+        ) r ON TRUE
+        WHERE d.doc_id = %s AND d.pipeline = %s
         """
-        with self.conn.cursor() as cur:
-            cur.execute(sql, (doc_id,))
+        with self._read_cursor() as cur:
+            cur.execute(sql, (doc_id, pipeline))
             row = cur.fetchone()
             if row:
                 return {
@@ -115,6 +215,54 @@ class OcrRepo:
                 }
             return None
 
+    def bulk_get_latest_runs(self, doc_ids: List[int], pipeline: str) -> Dict[int, Dict[str, Any]]:
+        """
+        get_latest_run for many documents in one query: {doc_id: run dict}.
+        Documents whose last pipeline differs (or that have no runs) are absent,
+        i.e. the same as get_latest_run returning None.
+        """
+        if not doc_ids:
+            return {}
+        sql = """
+        SELECT DISTINCT ON (r.doc_id) r.doc_id, r.run_id, r.status, r.attempt_no, r.error_kind
+        FROM ocr_run r
+        JOIN ocr_document d ON d.doc_id = r.doc_id
+        WHERE r.doc_id = ANY(%s) AND d.pipeline = %s
+        ORDER BY r.doc_id, r.run_id DESC
+        """
+        with self._read_cursor() as cur:
+            cur.execute(sql, (list(doc_ids), pipeline))
+            return {
+                row[0]: {
+                    "run_id": row[1],
+                    "status": row[2],
+                    "attempt_no": row[3] or 1,
+                    "error_kind": row[4],
+                }
+                for row in cur.fetchall()
+            }
+
+    def get_done_source_paths(self, pipeline: str) -> Set[str]:
+        """
+        source_path of every document whose latest run for `pipeline` is 'done'.
+        One bulk query at startup; the CLI skips these paths without hashing or
+        per-file get_latest_run (same outcome as decide_retry_action -> "Already done").
+        """
+        sql = """
+        SELECT d.source_path
+        FROM ocr_document d
+        JOIN LATERAL (
+            SELECT r.status FROM ocr_run r
+            WHERE r.doc_id = d.doc_id
+            ORDER BY r.run_id DESC
+            LIMIT 1
+        ) last ON TRUE
+        WHERE d.pipeline = %s AND last.status = 'done'
+        """
+        with self._read_cursor() as cur:
+            cur.execute(sql, (pipeline,))
+            return {row[0] for row in cur.fetchall()}
+
     def create_run(self, doc_id: int, pipeline: str, run_tag: Optional[str] = None, status: str = 'queued',
                    attempt_no: int = 1, parent_run_id: Optional[int] = None) -> int:
         self.connect()
@@ -142,30 +290,141 @@ class OcrRepo:
             cur.execute(sql, (doc_id, status, attempt_no, parent_run_id))
             return cur.fetchone()[0]
 
+    def start_run(self, doc_id: int, pipeline: str, run_tag: Optional[str] = None,
+                  attempt_no: int = 1, parent_run_id: Optional[int] = None) -> int:
+        """
+        create_run(status='processing') + mark_step('engine_start', 'started') as one
+        statement (data-modifying CTEs) and one commit. Returns run_id.
+        """
+        self.connect()
+        with self.conn.cursor() as cur:
+            self._execute_prepared(cur, "ocr_start_run", (pipeline, run_tag, doc_id, attempt_no, parent_run_id))
+            run_id = cur.fetchone()[0]
+        self.conn.commit()
+        return run_id
+
+    def finish_run(self, run_id: int, status: str, *, out_path: Optional[str] = None,
+                   error_message: Optional[str] = None, error_kind: Optional[str] = None,
+                   steps: Sequence[Tuple[str, str, Optional[str]]] = ()) -> None:
+        """
+        mark_run_status + mark_step for each (step_name, status, error_message) in `steps`,
+        as one statement and one commit (which also commits earlier mark_step calls of the run).
+        """
+        self.connect()
+        self.flush_steps()
+        params: List[Any] = [status, error_message, out_path, error_kind, run_id]
+        for step in steps:
+            params.extend(step)
+        with self.conn.cursor() as cur:
+            self._execute_prepared(cur, _finish_run_statement(len(steps)), params)
+        self.conn.commit()
+
     def mark_run_status(self, run_id: int, status: str, error_code: Optional[str] = None,
                         error_message: Optional[str] = None, out_path: Optional[str] = None,
                         error_kind: Optional[str] = None, retry_after_seconds: Optional[int] = None):
         self.connect()
-        sql = """
-        UPDATE ocr_run
-        SET status = %s,
-            error_code = COALESCE(%s, error_code),
-            error_message = COALESCE(%s, error_message),
-            out_path = COALESCE(%s, out_path),
-            error_kind = COALESCE(%s, error_kind),
-            retry_after_seconds = COALESCE(%s, retry_after_seconds),
-            finished_at = CASE WHEN %s IN ('done', 'failed') THEN NOW() ELSE finished_at END,
-            started_at = CASE WHEN %s = 'processing' AND started_at IS NULL THEN NOW() ELSE started_at END
-        WHERE run_id = %s
-        """
+        if status in ("done", "failed"):
+            self.flush_steps()
         with self.conn.cursor() as cur:
-            cur.execute(sql, (status, error_code, error_message, out_path, error_kind, retry_after_seconds, status, status, run_id))
+            self._execute_prepared(
+                cur,
+                "ocr_mark_run_status",
+                (status, error_code, error_message, out_path, error_kind, retry_after_seconds, run_id),
+            )
 
     def mark_step(self, run_id: int, step_name: str, status: str, error_message: Optional[str] = None):
-        self.connect()
-        sql = """
-        INSERT INTO ocr_step (run_id, step_name, status, error_message)
-        VALUES (%s, %s, %s, %s)
         """
+        Buffer an ocr_step row (created_at taken now). Rows are written by flush_steps(),
+        which runs from finish_run, mark_run_status('done'|'failed'), commit() and close(),
+        or once STEP_FLUSH_ROWS rows are waiting.
+        """
+        self._step_buffer.append(
+            (run_id, step_name, status, error_message, datetime.now(timezone.utc).isoformat())
+        )
+        if len(self._step_buffer) >= self.STEP_FLUSH_ROWS:
+            self.flush_steps()
+
+    def flush_steps(self) -> None:
+        """Write buffered mark_step rows with one COPY (part of the current transaction)."""
+        if not self._step_buffer:
+            return
+        self.connect()
+        buf = io.StringIO()
+        # CSV: None -> unquoted empty field -> NULL
+        csv.writer(buf).writerows(self._step_buffer)
+        buf.seek(0)
         with self.conn.cursor() as cur:
-            cur.execute(sql, (run_id, step_name, status, error_message))
+            cur.copy_expert(
+                "COPY ocr_step (run_id, step_name, status, error_message, created_at) FROM STDIN WITH (FORMAT csv)",
+                buf,
+            )
+        self._step_buffer.clear()
+
+
+# Hot per-image statements, PREPAREd once per write connection and then run as
+# EXECUTE name(...): Postgres skips re-parsing/planning and only the parameters go
+# over the wire. name -> (parameter types, SQL with $n placeholders).
+_PREPARED: Dict[str, Tuple[str, str]] = {
+    "ocr_start_run": (
+        "text, text, integer, integer, integer",
+        """
+        WITH d AS (
+            UPDATE ocr_document SET pipeline = $1, run_tag = $2 WHERE doc_id = $3
+        ), r AS (
+            INSERT INTO ocr_run (doc_id, status, attempt_no, parent_run_id, created_at, started_at)
+            VALUES ($3, 'processing', $4, $5, NOW(), NOW())
+            RETURNING run_id
+        ), s AS (
+            INSERT INTO ocr_step (run_id, step_name, status)
+            SELECT run_id, 'engine_start', 'started' FROM r
+        )
+        SELECT run_id FROM r
+        """,
+    ),
+    "ocr_mark_run_status": (
+        "text, text, text, text, text, integer, integer",
+        """
+        UPDATE ocr_run
+        SET status = $1,
+            error_code = COALESCE($2, error_code),
+            error_message = COALESCE($3, error_message),
+            out_path = COALESCE($4, out_path),
+            error_kind = COALESCE($5, error_kind),
+            retry_after_seconds = COALESCE($6, retry_after_seconds),
+            finished_at = CASE WHEN $1 IN ('done', 'failed') THEN NOW() ELSE finished_at END,
+            started_at = CASE WHEN $1 = 'processing' AND started_at IS NULL THEN NOW() ELSE started_at END
+        WHERE run_id = $7
+        """,
+    ),
+}
+
+_FINISH_RUN_UPDATE = """
+        UPDATE ocr_run
+        SET status = $1,
+            error_message = COALESCE($2, error_message),
+            out_path = COALESCE($3, out_path),
+            error_kind = COALESCE($4, error_kind),
+            finished_at = CASE WHEN $1 IN ('done', 'failed') THEN NOW() ELSE finished_at END
+        WHERE run_id = $5
+        """
+
+
+def _finish_run_statement(n_steps: int) -> str:
+    """Name of the prepared finish_run statement for `n_steps` steps (registered on first use)."""
+    name = f"ocr_finish_run_{n_steps}"
+    if name not in _PREPARED:
+        types = "text, text, text, text, integer" + ", text, text, text" * n_steps
+        if n_steps:
+            values = ", ".join(
+                f"(${6 + 3 * i}, ${7 + 3 * i}, ${8 + 3 * i})" for i in range(n_steps)
+            )
+            sql = f"""
+            WITH u AS ({_FINISH_RUN_UPDATE} RETURNING run_id)
+            INSERT INTO ocr_step (run_id, step_name, status, error_message)
+            SELECT u.run_id, v.step_name, v.status, v.error_message
+            FROM u, (VALUES {values}) AS v(step_name, status, error_message)
+            """
+        else:
+            sql = _FINISH_RUN_UPDATE
+        _PREPARED[name] = (types, sql)
+    return name
@@ -1,13 +1,35 @@
 from __future__ import annotations
 
+import os
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, List, Optional, Tuple
+
+# ASCII characters not allowed in debug file names (everything except alnum, ".", "_", "-")
+_UNSAFE_ASCII = str.maketrans(
+    "", "", "".join(chr(c) for c in range(128) if not (chr(c).isalnum() or chr(c) in "._-"))
+)
+
+# Viewport JPEG by default (error context, not archival); OCR_GEMINI_DEBUG_FULL=1 restores full-page PNG
+_DEBUG_JPEG_QUALITY = 60
+
+
+def _safe_label(label: str) -> str:
+    """Keep only alphanumeric, dot, underscore, hyphen; max 50 chars; 'unknown' if nothing is left."""
+    if label.isascii():
+        # single C-level pass instead of a per-character generator
+        safe_chars = label.translate(_UNSAFE_ASCII)
+    else:
+        # non-ASCII letters/digits count as alnum too (str.isalnum semantics)
+        safe_chars = "".join(c for c in label if c.isalnum() or c in "._-")
+    return safe_chars[:50] or "unknown"
 
 
 def save_debug_artifacts(page: Any, debug_dir: Optional[Path], label: str) -> None:
     """
     Saves debug artifacts (screenshot, HTML, metadata) if debug_dir is set and page is available.
+    The screenshot is a viewport JPEG (quality 60); set OCR_GEMINI_DEBUG_FULL=1 for a full-page PNG.
 
     Args:
         page: Playwright Page object (or mock with screenshot/content methods).
@@ -25,44 +47,57 @@ def save_debug_artifacts(page: Any, debug_dir: Optional[Path], label: str) -> No
         # Create directory if it doesn't exist
         debug_dir.mkdir(parents=True, exist_ok=True)
 
-        # Sanitize label
-        # 1. Allow only alphanumeric, dot, underscore, hyphen
-        safe_chars = "".join(c for c in label if c.isalnum() or c in "._-")
-        # 2. Limit length (e.g., 50 chars)
-        safe_label = safe_chars[:50]
-        if not safe_label:
-             safe_label = "unknown"
+        safe_label = _safe_label(label)
 
         # Generate safe filename timestamp + label
         timestamp = time.strftime("%Y%m%d_%H%M%S")
         base_name = f"{timestamp}_{safe_label}"
 
-        # Save screenshot
-        try:
-            screenshot_path = debug_dir / f"{base_name}.png"
-            # Duck-typing: check if method exists
-            if hasattr(page, "screenshot"):
-                 page.screenshot(path=str(screenshot_path), full_page=True)
-        except Exception as e:
-            print(f"Warning: Failed to save debug screenshot: {e}")
-
-        # Save HTML
-        try:
-            html_path = debug_dir / f"{base_name}.html"
-            if hasattr(page, "content"):
-                content = page.content()
-                html_path.write_text(content, encoding="utf-8")
-        except Exception as e:
-            print(f"Warning: Failed to save debug HTML: {e}")
-
-        # Save Metadata
-        try:
+        # Playwright's sync Page must only be used from this thread, so page.content() and
+        # page.screenshot() stay here; the HTML/metadata disk writes run on a worker
+        # thread meanwhile and overlap with the screenshot (viewport JPEG, or full-page PNG
+        # with OCR_GEMINI_DEBUG_FULL=1).
+        # A per-call executor is fine: this only runs on the error path.
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            pending: List[Tuple[str, Future]] = []
+
+            # Save HTML
+            try:
+                html_path = debug_dir / f"{base_name}.html"
+                if hasattr(page, "content"):
+                    content = page.content()
+                    pending.append(("HTML", writer.submit(html_path.write_text, content, encoding="utf-8")))
+            except Exception as e:
+                print(f"Warning: Failed to save debug HTML: {e}")
+
+            # Save Metadata
             meta_path = debug_dir / f"{base_name}_meta.txt"
             url = getattr(page, "url", "unknown")
             meta_content = f"Timestamp: {timestamp}\nLabel: {label}\nSafeLabel: {safe_label}\nURL: {url}\n"
-            meta_path.write_text(meta_content, encoding="utf-8")
-        except Exception as e:
-            print(f"Warning: Failed to save debug metadata: {e}")
+            pending.append(("metadata", writer.submit(meta_path.write_text, meta_content, encoding="utf-8")))
+
+            # Save screenshot
+            try:
+                # Duck-typing: check if method exists
+                if hasattr(page, "screenshot"):
+                    if os.environ.get("OCR_GEMINI_DEBUG_FULL") == "1":
+                        page.screenshot(path=str(debug_dir / f"{base_name}.png"), full_page=True)
+                    else:
+                        # full-page PNG of a long chat is multi-MB and slow to encode in Chromium
+                        page.screenshot(
+                            path=str(debug_dir / f"{base_name}.jpg"),
+                            full_page=False,
+                            type="jpeg",
+                            quality=_DEBUG_JPEG_QUALITY,
+                        )
+            except Exception as e:
+                print(f"Warning: Failed to save debug screenshot: {e}")
+
+            for what, fut in pending:
+                try:
+                    fut.result()
+                except Exception as e:
+                    print(f"Warning: Failed to save debug {what}: {e}")
 
     except Exception as e:
         print(f"Error saving debug artifacts: {e}")
@@ -1,11 +1,23 @@
 from enum import Enum
-from typing import Optional
+from typing import FrozenSet, Iterable, Optional, Union
 
 class ErrorKind(str, Enum):
     TRANSIENT = "transient"
     PERMANENT = "permanent"
     UNKNOWN = "unknown"
 
+def parse_error_kinds(kinds: Union[str, Iterable[str]]) -> FrozenSet[ErrorKind]:
+    """
+    Parses "transient,unknown" (or an iterable of names) once into a frozenset of ErrorKind.
+    Unknown names are ignored. ErrorKind is a str Enum, so plain strings read from the DB
+    (ocr_run.error_kind) still match with `in`.
+    """
+    if isinstance(kinds, str):
+        kinds = kinds.split(",")
+    valid = {k.value for k in ErrorKind}
+    names = (str(k).strip().lower() for k in kinds)
+    return frozenset(ErrorKind(n) for n in names if n in valid)
+
 def classify_error(e: Exception) -> ErrorKind:
     """
     Classifies an exception into Transient, Permanent, or Unknown.
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import sys
 from pathlib import Path
 from typing import Optional
 
@@ -8,6 +9,8 @@ from ..ui import actions
 from .core import OcrEngine, OcrResult
 from .browser_session import BrowserSession
 
+GEMINI_APP_URL = "https://gemini.google.com/app"
+
 
 class PlaywrightEngine(OcrEngine):
     """
@@ -38,8 +41,21 @@ class PlaywrightEngine(OcrEngine):
         self.session = BrowserSession()
 
     def start(self) -> None:
-        """Starts the browser session."""
+        """
+        Starts the browser session and warms it up by opening Gemini, so the
+        first ocr() call does not pay for DNS + TLS + initial page load.
+        """
         self.session.start(headless=self.headless, profile_dir=self.profile_dir)
+        self._warm_up()
+
+    def _warm_up(self) -> None:
+        """Best-effort navigation to Gemini; ocr() navigates again if this fails."""
+        try:
+            page = self.session.page
+            if "gemini.google.com" not in (page.url or ""):
+                page.goto(GEMINI_APP_URL, timeout=60000, wait_until="domcontentloaded")
+        except Exception as e:
+            print(f"Warning: Gemini warm-up navigation failed, will retry on first OCR: {e}", file=sys.stderr)
 
     def stop(self) -> None:
         """Stops the browser session."""
@@ -72,7 +88,7 @@ class PlaywrightEngine(OcrEngine):
         try:
             # 1. Navigate (if needed)
             if "gemini.google.com" not in (page.url or ""):
-                page.goto("https://gemini.google.com/app", timeout=60000)
+                page.goto(GEMINI_APP_URL, timeout=60000)
 
             # 2. Upload image (robust implementation lives in actions.upload_image)
             actions.upload_image(
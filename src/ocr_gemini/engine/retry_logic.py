@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import Optional, Dict, Any, List
+import random
+from typing import Callable, Optional, Dict, Any, List
 from ..config import PipelineConfig
 from .errors import ErrorKind
 
@@ -96,3 +97,21 @@ def decide_retry_action(
               action["reason"] = f"Status {status} (use --resume to reset)"
 
     return action
+
+
+def backoff_delay(
+    base: float,
+    n: int,
+    *,
+    max_delay: float,
+    jitter: float,
+    rand: Callable[[], float] = random.random,
+) -> float:
+    """
+    Exponential backoff with jitter for the n-th retry (n >= 0):
+    base * 2**n * (1 + rand() * jitter), capped at max_delay.
+    The random factor spreads retries of concurrent workers apart.
+    """
+    if base <= 0:
+        return 0.0
+    return min(max_delay, base * (2 ** max(n, 0)) * (1 + rand() * jitter))
@@ -2,9 +2,13 @@ from __future__ import annotations
 
 import hashlib
 import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Iterator, Optional, Sequence
+from typing import Deque, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from . import _hashcache
 
 
 DEFAULT_IMAGE_EXTS: tuple[str, ...] = (".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff")
@@ -18,10 +22,19 @@ class DiscoveredFile:
     sha256: Optional[str] = None
 
 
+_DEFAULT_EXTS_SET: FrozenSet[str] = frozenset(e.lower() for e in DEFAULT_IMAGE_EXTS)
+
+
+def _exts_set(exts: Sequence[str]) -> FrozenSet[str]:
+    if exts is DEFAULT_IMAGE_EXTS:
+        return _DEFAULT_EXTS_SET
+    return frozenset(e.lower() for e in exts)
+
+
 def is_image_file(path: Path, exts: Sequence[str] = DEFAULT_IMAGE_EXTS) -> bool:
     if not path.is_file():
         return False
-    return path.suffix.lower() in set(e.lower() for e in exts)
+    return path.suffix.lower() in _exts_set(exts)
 
 
 def iter_files(
@@ -43,48 +56,120 @@ def iter_files(
         raise NotADirectoryError(f"Input root is not a directory: {root}")
 
     yielded = 0
+    exts_set = _exts_set(exts)
 
-    def _scan_dir(dir_path: Path) -> Iterable[Path]:
-        # sort for deterministic behavior
+    def _sorted_entries(dir_path: str) -> Iterator[os.DirEntry]:
+        # sort for deterministic behavior; the list closes the scandir handle right away
         with os.scandir(dir_path) as it:
-            entries = sorted(it, key=lambda e: e.name.lower())
-        for e in entries:
-            p = Path(e.path)
-            if e.is_file():
-                if is_image_file(p, exts=exts):
-                    yield p
-            elif e.is_dir() and recursive:
-                yield from _scan_dir(p)
-
-    for p in _scan_dir(root):
-        rel = p.relative_to(root)
-        yield DiscoveredFile(path=p, rel_path=rel, file_name=p.name, sha256=None)
-        yielded += 1
-        if limit and yielded >= limit:
-            break
-
-
-def sha256_file(path: Path, *, chunk_size: int = 1024 * 1024) -> str:
+            return iter(sorted(it, key=lambda e: e.name.lower()))
+
+    # Iterative DFS (no generator recursion / RecursionError on deep trees).
+    # One entry iterator per open directory, with its rel_path prefix; a subdirectory is
+    # entered as soon as it is reached, so the order matches the per-directory sort.
+    stack: List[Tuple[Iterator[os.DirEntry], str]] = [(_sorted_entries(str(root)), "")]
+    while stack:
+        entries, rel_prefix = stack[-1]
+        e = next(entries, None)
+        if e is None:
+            stack.pop()
+            continue
+        # DirEntry.is_file() comes from readdir (no stat); build Paths only for hits
+        if e.is_file():
+            if os.path.splitext(e.name)[1].lower() in exts_set:
+                yield DiscoveredFile(
+                    path=Path(e.path),
+                    rel_path=Path(rel_prefix + e.name),
+                    file_name=e.name,
+                    sha256=None,
+                )
+                yielded += 1
+                if limit and yielded >= limit:
+                    break
+        elif recursive and e.is_dir():
+            stack.append((_sorted_entries(e.path), rel_prefix + e.name + os.sep))
+
+
+# (path, size, mtime_ns) -> sha256; lets repeated lookups in one process skip re-reading the file
+_SHA_MEMO: Dict[Tuple[str, int, int], str] = {}
+
+
+def sha256_file(path: Path, *, chunk_size: int = 4 * 1024 * 1024) -> str:
+    """
+    Compute sha256 of a file.
+    Uses hashlib.file_digest (Python 3.11+, zero-copy readinto loop) when available,
+    a readinto loop over one reusable chunk_size buffer (default 4MB) otherwise.
+    Results are memoized per (path, size, mtime_ns), so an unchanged file is hashed once;
+    with _hashcache opened the memo also persists across runs.
+    """
+    st = os.stat(path)
+    key = (os.fspath(path), st.st_size, st.st_mtime_ns)
+    cached = _SHA_MEMO.get(key)
+    if cached is None:
+        cached = _hashcache.get(*key)
+    if cached is not None:
+        _SHA_MEMO[key] = cached
+        return cached
+
+    with open(path, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                # whole file, front to back: let the kernel read ahead aggressively
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        if hasattr(hashlib, "file_digest"):
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        else:
+            # one preallocated buffer + readinto: no new bytes object per chunk
+            h = hashlib.sha256()
+            buf = bytearray(chunk_size)
+            view = memoryview(buf)
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(view[:n])
+            digest = h.hexdigest()
+
+    _SHA_MEMO[key] = digest
+    _hashcache.put(*key, digest)
+    return digest
+
+
+def _hashed(it: DiscoveredFile, sha256: str) -> DiscoveredFile:
+    return DiscoveredFile(
+        path=it.path,
+        rel_path=it.rel_path,
+        file_name=it.file_name,
+        sha256=sha256,
+    )
+
+
+def with_sha256(items: Iterable[DiscoveredFile], *, workers: int = 0) -> Iterator[DiscoveredFile]:
     """
-    Compute sha256 of a file using streaming reads.
-    Default chunk_size=1MB (fast enough, low memory).
+    Yield DiscoveredFile with sha256 computed, in input order.
+    - Hashes on `workers` threads (default min(8, cpu_count)); hashlib releases the GIL,
+      so one file's reads overlap with another's hashing.
+    - At most 2x workers files are in flight, and `items` is consumed lazily.
+    - workers=1 hashes inline.
     """
-    h = hashlib.sha256()
-    with path.open("rb") as f:
-        while True:
-            b = f.read(chunk_size)
-            if not b:
-                break
-            h.update(b)
-    return h.hexdigest()
-
-
-def with_sha256(items: Iterable[DiscoveredFile]) -> Iterator[DiscoveredFile]:
-    """Yield DiscoveredFile with sha256 computed."""
-    for it in items:
-        yield DiscoveredFile(
-            path=it.path,
-            rel_path=it.rel_path,
-            file_name=it.file_name,
-            sha256=sha256_file(it.path),
-        )
+    n = workers or min(8, os.cpu_count() or 1)
+    if n <= 1:
+        for it in items:
+            yield _hashed(it, sha256_file(it.path))
+        return
+
+    pool = ThreadPoolExecutor(max_workers=n, thread_name_prefix="sha256")
+    pending: Deque[Tuple[DiscoveredFile, Future]] = deque()
+    try:
+        for it in items:
+            pending.append((it, pool.submit(sha256_file, it.path)))
+            if len(pending) >= 2 * n:
+                head, fut = pending.popleft()
+                yield _hashed(head, fut.result())
+        while pending:
+            head, fut = pending.popleft()
+            yield _hashed(head, fut.result())
+    finally:
+        # consumer stopped early (limit / error): drop files not started yet
+        pool.shutdown(wait=True, cancel_futures=True)
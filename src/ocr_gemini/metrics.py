@@ -2,11 +2,11 @@ from __future__ import annotations
 
 import json
 import time
-from dataclasses import asdict, dataclass
-from typing import Optional
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
 
 
-@dataclass
+@dataclass(slots=True)
 class DocumentMetrics:
     file_name: str
     start_ts: float
@@ -22,8 +22,20 @@ class DocumentMetrics:
         self.outcome = outcome
         self.error_reason = error_reason
 
+    def as_dict(self) -> Dict[str, Any]:
+        # keys in field order, same as dataclasses.asdict (meta.json layout; see test_metrics)
+        return {
+            "file_name": self.file_name,
+            "start_ts": self.start_ts,
+            "end_ts": self.end_ts,
+            "duration_s": self.duration_s,
+            "attempts": self.attempts,
+            "outcome": self.outcome,
+            "error_reason": self.error_reason,
+        }
+
     def to_json(self) -> str:
-        return json.dumps(asdict(self), ensure_ascii=False)
+        return json.dumps(self.as_dict(), ensure_ascii=False)
 
     def __str__(self) -> str:
         err_str = f" | reason={self.error_reason}" if self.error_reason else ""
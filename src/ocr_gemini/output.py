@@ -1,11 +1,17 @@
 from __future__ import annotations
 
 import json
+import os
 import re
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, Optional
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 _SAFE_STEM_RE = re.compile(r"[^A-Za-z0-9._-]+")
 
@@ -53,14 +59,42 @@ def ensure_dir(p: Path) -> None:
     p.mkdir(parents=True, exist_ok=True)
 
 
+def _write_bytes_atomic(path: Path, data: bytes) -> None:
+    """
+    Write via <name>.tmp + os.replace, so readers never see a half-written file.
+    """
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _dumps_json(data: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
 def write_text(path: Path, text: str) -> None:
-    ensure_dir(path.parent)
-    path.write_text(text, encoding="utf-8")
+    """
+    UTF-8 text. The parent directory must exist (write_outputs creates it once).
+    """
+    _write_bytes_atomic(path, text.encode("utf-8"))
 
 
 def write_json(path: Path, data: Dict[str, Any]) -> None:
-    ensure_dir(path.parent)
-    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    """
+    UTF-8 JSON, 2-space indent. Uses orjson when installed (same layout, much faster).
+    The parent directory must exist (write_outputs creates it once).
+    """
+    _write_bytes_atomic(path, _dumps_json(data))
 
 
 def write_outputs(
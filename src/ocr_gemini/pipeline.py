@@ -3,8 +3,8 @@ from __future__ import annotations
 import json
 import os
 import socket
+import sys
 import time
-from dataclasses import asdict, dataclass
 from pathlib import Path
 from typing import Any, Dict, Optional
 
@@ -35,6 +35,7 @@ def config_from_env() -> PipelineConfig:
 
     # Plumbing for future UI integration
     ui_timeout_ms = int(os.environ.get("OCR_UI_TIMEOUT_MS", "180000"))
+    commit_every = int(os.environ.get("OCR_COMMIT_EVERY", "1") or "1")
 
     host = socket.gethostname()
     processing_by = f"{os.environ.get('USER','user')}@{host}"
@@ -50,6 +51,7 @@ def config_from_env() -> PipelineConfig:
         processing_by=processing_by,
         debug_dir=debug_dir,
         ui_timeout_ms=ui_timeout_ms,
+        commit_every=commit_every,
     )
 
 
@@ -69,6 +71,23 @@ class Pipeline:
         self.cfg = cfg
         self.db = db_writer or MinimalDbWriter(db_config_from_env())
         self.engine = engine or FakeEngine()
+        # udane pliki od ostatniego commitu (cfg.commit_every)
+        self._pending = 0
+        # Stałe dla całego runu - liczone raz, a nie dla każdego pliku
+        self._meta_const: Dict[str, Any] = {
+            "prompt_id": cfg.prompt_id,
+            "run_tag": cfg.run_tag,
+            "pipeline": cfg.pipeline_name,
+            "processing_by": cfg.processing_by,
+        }
+        self._doc_const: Dict[str, Any] = {
+            "doc_type": "unknown",
+            "confidence": None,
+            "issues": None,
+            "pipeline": cfg.pipeline_name,
+            "run_tag": cfg.run_tag,
+            "processing_by": cfg.processing_by,
+        }
 
     def run(self) -> int:
         items = with_sha256(
@@ -76,36 +95,41 @@ class Pipeline:
         )
 
         processed = 0
-        for item in items:
-            processed += 1
-            self._process_one(item, entry_no=1)
+        try:
+            for item in items:
+                processed += 1
+                self._process_one(item, entry_no=1)
+        except BaseException:
+            # udane pliki z niepełnej paczki zapisujemy mimo błędu, ale błąd commitu
+            # (np. zerwane połączenie) nie może przesłonić właściwego wyjątku
+            try:
+                self._commit_pending()
+            except Exception as commit_err:
+                print(f"WARN: commit of pending files failed: {commit_err}", file=sys.stderr)
+            raise
 
+        # ostatnia (niepełna) paczka commit_every
+        self._commit_pending()
         return processed
 
+    def _commit_pending(self) -> None:
+        if self._pending:
+            self._pending = 0
+            self.db.commit()
+
     def _process_one(self, item: DiscoveredFile, *, entry_no: int) -> None:
         m = DocumentMetrics(file_name=item.file_name, start_ts=time.time())
         m.attempts = 1
 
         started_at = None
         finished_at = None
+        source_path = str(item.path)
 
-        try:
-            # DB: document start
-            doc_id = self.db.upsert_document(
-                source_path=str(item.path),
-                file_name=item.file_name,
-                source_sha256=item.sha256,
-                doc_type="unknown",
-                confidence=None,
-                issues=None,
-                pipeline=self.cfg.pipeline_name,
-                run_tag=self.cfg.run_tag,
-                status="processing",
-                processing_by=self.cfg.processing_by,
-                processing_started_at=started_at,
-                processing_finished_at=finished_at,
-            )
+        batched = self.cfg.commit_every > 1
+        if batched:
+            self.db.savepoint()
 
+        try:
             # OCR (engine; Stage 2/3: Playwright)
             res = self.engine.ocr(item.path, self.cfg.prompt_id)
             ocr_text = res.text
@@ -121,19 +145,28 @@ class Pipeline:
                     "Placeholder OCR blocked. Set OCR_ALLOW_PLACEHOLDER=1 if you really want placeholder outputs."
                 )
 
+            # DB: document done. Jeden upsert zamiast 'processing' + 'done': wiersz 'processing'
+            # i tak nie był widoczny (ta sama, niezacommitowana transakcja co 'done').
+            doc_id = self.db.upsert_document(
+                source_path=source_path,
+                file_name=item.file_name,
+                source_sha256=item.sha256,
+                status="done",
+                processing_started_at=started_at,
+                processing_finished_at=finished_at,
+                **self._doc_const,
+            )
+
             # Output meta
             meta: Dict[str, Any] = {
-                "source_path": str(item.path),
+                "source_path": source_path,
                 "rel_path": str(item.rel_path),
                 "file_name": item.file_name,
                 "sha256": item.sha256,
-                "prompt_id": self.cfg.prompt_id,
-                "run_tag": self.cfg.run_tag,
-                "pipeline": self.cfg.pipeline_name,
-                "processing_by": self.cfg.processing_by,
+                **self._meta_const,
                 "doc_id": doc_id,
                 "entry_no": entry_no,
-                "metrics": asdict(m),
+                "metrics": m.as_dict(),
             }
 
             # Write artifacts
@@ -166,29 +199,23 @@ class Pipeline:
                 location=None,
             )
 
-            # DB: document done
-            m.finish("success")
-            doc_id2 = self.db.upsert_document(
-                source_path=str(item.path),
-                file_name=item.file_name,
-                source_sha256=item.sha256,
-                doc_type="unknown",
-                confidence=None,
-                issues=None,
-                pipeline=self.cfg.pipeline_name,
-                run_tag=self.cfg.run_tag,
-                status="done",
-                processing_by=self.cfg.processing_by,
-                processing_started_at=started_at,
-                processing_finished_at=finished_at,
-            )
+            if batched:
+                self.db.release_savepoint()
 
-            self.db.commit()
-            print(f"OK: {item.file_name} -> doc_id={doc_id2} entry_id={entry_id} out={paths.base_dir}")
+            m.finish("success")
+            self._pending += 1
+            if self._pending >= self.cfg.commit_every:
+                self.db.commit()
+                self._pending = 0
+            print(f"OK: {item.file_name} -> doc_id={doc_id} entry_id={entry_id} out={paths.base_dir}")
 
         except Exception as e:
             try:
-                self.db.rollback()
+                if batched:
+                    # tylko zapisy tego pliku; wcześniejsze z paczki zostają (commit w run())
+                    self.db.rollback_to_savepoint()
+                else:
+                    self.db.rollback()
             except Exception:
                 pass
 
@@ -202,16 +229,13 @@ class Pipeline:
             # best-effort error meta
             try:
                 meta_err = {
-                    "source_path": str(item.path),
+                    "source_path": source_path,
                     "rel_path": str(item.rel_path),
                     "file_name": item.file_name,
                     "sha256": item.sha256,
-                    "prompt_id": self.cfg.prompt_id,
-                    "run_tag": self.cfg.run_tag,
-                    "pipeline": self.cfg.pipeline_name,
-                    "processing_by": self.cfg.processing_by,
+                    **self._meta_const,
                     "error": str(e),
-                    "metrics": asdict(m),
+                    "metrics": m.as_dict(),
                 }
                 write_outputs(
                     out_root=self.cfg.out_root,
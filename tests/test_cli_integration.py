@@ -1,4 +1,5 @@
 import sys
+from pathlib import Path
 from unittest.mock import patch
 
 import pytest
@@ -29,6 +30,12 @@ def mock_args(tmp_path):
     ]
 
 
+def _preflight_returns(repo, doc_id, last_run):
+    # pre-flight is batched: {source_path: doc_id} + {doc_id: latest run}
+    repo.bulk_get_or_create_documents.side_effect = lambda rows: {path: doc_id for path, _ in rows}
+    repo.bulk_get_latest_runs.return_value = {doc_id: last_run} if last_run else {}
+
+
 @patch("ocr_gemini.cli.PlaywrightEngine")
 @patch("ocr_gemini.cli.OcrRepo")
 @patch("ocr_gemini.cli.db_config_from_env")
@@ -41,10 +48,9 @@ def test_cli_flow_with_db(mock_sha, mock_db_conf, mock_repo_cls, mock_engine_cls
 
     # Repo
     repo = mock_repo_cls.return_value
-    repo.get_or_create_document.return_value = 1
-    # IMPORTANT: provide a real dict to avoid MagicMock leakage into decision logic
-    repo.get_latest_run.return_value = None
-    repo.create_run.return_value = 100
+    # IMPORTANT: provide real dicts to avoid MagicMock leakage into decision logic
+    _preflight_returns(repo, 1, None)
+    repo.start_run.return_value = 100
 
     # Engine
     engine = mock_engine_cls.return_value
@@ -52,17 +58,22 @@ def test_cli_flow_with_db(mock_sha, mock_db_conf, mock_repo_cls, mock_engine_cls
 
     main()
 
-    repo.get_or_create_document.assert_called()
+    repo.bulk_get_or_create_documents.assert_called()
 
-    # Stage 2.x: create_run has attempt_no and parent_run_id
-    assert repo.create_run.called
-    args, kwargs = repo.create_run.call_args
+    # Stage 2.x: start_run has attempt_no and parent_run_id
+    assert repo.start_run.called
+    args, kwargs = repo.start_run.call_args
     assert args[0] == 1
     assert args[1] == "gemini-ui-cli"
-    assert kwargs["status"] == "queued"
     assert kwargs["attempt_no"] == 1
     assert kwargs.get("parent_run_id") is None
 
+    # success: one finish_run (status + engine_finish step, committed together)
+    repo.finish_run.assert_called_once()
+    args, kwargs = repo.finish_run.call_args
+    assert args == (100, "done")
+    assert kwargs["steps"] == [("engine_finish", "done", None)]
+
 
 @patch("ocr_gemini.cli.PlaywrightEngine")
 @patch("ocr_gemini.cli.OcrRepo")
@@ -78,10 +89,8 @@ def test_cli_idempotency_skip(mock_sha, mock_db_conf, mock_repo_cls, mock_engine
 
     mock_db_conf.return_value.dsn = "postgres://..."
     repo = mock_repo_cls.return_value
-    repo.get_or_create_document.return_value = 1
-
     # simulate "already done"
-    repo.get_latest_run.return_value = {"status": "done", "attempt_no": 1, "error_kind": None, "run_id": 10}
+    _preflight_returns(repo, 1, {"status": "done", "attempt_no": 1, "error_kind": None, "run_id": 10})
 
     # engine should NOT be used
     engine = mock_engine_cls.return_value
@@ -90,7 +99,7 @@ def test_cli_idempotency_skip(mock_sha, mock_db_conf, mock_repo_cls, mock_engine
     main()
 
     # Should skip without creating a new run row
-    repo.create_run.assert_not_called()
+    repo.start_run.assert_not_called()
     engine.ocr.assert_not_called()
 
 
@@ -103,21 +112,90 @@ def test_cli_force_run(mock_sha, mock_db_conf, mock_repo_cls, mock_engine_cls, m
 
     mock_db_conf.return_value.dsn = "postgres://..."
     repo = mock_repo_cls.return_value
-    repo.get_or_create_document.return_value = 1
-
     # previously done, but --force should process again
-    repo.get_latest_run.return_value = {"status": "done", "attempt_no": 1, "error_kind": None, "run_id": 10}
-    repo.create_run.return_value = 101
+    _preflight_returns(repo, 1, {"status": "done", "attempt_no": 1, "error_kind": None, "run_id": 10})
+    repo.start_run.return_value = 101
 
     engine = mock_engine_cls.return_value
     engine.ocr.return_value.text = "OCR Text"
 
     main()
 
-    assert repo.create_run.called
-    args, kwargs = repo.create_run.call_args
+    assert repo.start_run.called
+    args, kwargs = repo.start_run.call_args
     assert args[0] == 1
     assert args[1] == "gemini-ui-cli"
-    assert kwargs["status"] == "queued"
     assert kwargs["attempt_no"] == 2  # done->force => next attempt
     assert kwargs.get("parent_run_id") == 10
+
+
+@patch("ocr_gemini.cli.PlaywrightEngine")
+@patch("ocr_gemini.cli.db_config_from_env")
+def test_cli_shard_takes_every_nth_image(mock_db_conf, mock_engine_cls, mock_args, monkeypatch):
+    input_dir = mock_args[mock_args.index("--input-dir") + 1]
+    for name in ("img2.png", "img3.png"):
+        (Path(input_dir) / name).write_bytes(b"fake")
+    monkeypatch.setattr(sys, "argv", mock_args + ["--shard-count", "2", "--shard-index", "1"])
+
+    mock_db_conf.return_value.dsn = None
+    engine = mock_engine_cls.return_value
+    engine.ocr.return_value.text = "OCR Text"
+
+    main()
+
+    processed = [c.args[0].name for c in engine.ocr.call_args_list]
+    assert processed == ["img2.png"]
+
+
+@patch("ocr_gemini.cli.PlaywrightEngine")
+@patch("ocr_gemini.cli.OcrRepo")
+@patch("ocr_gemini.cli.db_config_from_env")
+@patch("ocr_gemini.cli.sha256_file", return_value="hash123")
+def test_cli_skips_preloaded_done_paths_without_db_roundtrip(
+    mock_sha, mock_db_conf, mock_repo_cls, mock_engine_cls, mock_args, monkeypatch
+):
+    monkeypatch.setattr(sys, "argv", mock_args)
+    mock_db_conf.return_value.dsn = "postgres://..."
+    img = Path(mock_args[mock_args.index("--input-dir") + 1]) / "img1.png"
+
+    repo = mock_repo_cls.return_value
+    repo.get_done_source_paths.return_value = {str(img)}
+
+    main()
+
+    repo.bulk_get_or_create_documents.assert_not_called()
+    mock_engine_cls.return_value.ocr.assert_not_called()
+
+
+@patch("ocr_gemini.cli.PlaywrightEngine")
+@patch("ocr_gemini.cli.db_config_from_env")
+def test_cli_resume_without_db_skips_existing_outputs(mock_db_conf, mock_engine_cls, mock_args, monkeypatch):
+    out_dir = Path(mock_args[mock_args.index("--out-dir") + 1])
+    (out_dir / "img1.txt").write_text("old", encoding="utf-8")
+    monkeypatch.setattr(sys, "argv", mock_args + ["--resume"])
+    mock_db_conf.return_value.dsn = None
+
+    main()
+
+    mock_engine_cls.return_value.ocr.assert_not_called()
+
+
+@patch("ocr_gemini.cli.time.sleep")
+@patch("ocr_gemini.cli.PlaywrightEngine")
+@patch("ocr_gemini.cli.db_config_from_env")
+def test_cli_recovery_without_delay_when_base_delay_is_zero(
+    mock_db_conf, mock_engine_cls, mock_sleep, mock_args, monkeypatch
+):
+    monkeypatch.setattr(sys, "argv", mock_args + ["--retry-base-delay", "0"])
+    mock_db_conf.return_value.dsn = None
+
+    engine = mock_engine_cls.return_value
+    ok = engine.ocr.return_value
+    ok.text = "OCR Text"
+    engine.ocr.side_effect = [RuntimeError("network error"), ok]
+
+    main()
+
+    assert engine.ocr.call_count == 2
+    engine.recover.assert_called_once()
+    mock_sleep.assert_not_called()
@@ -35,6 +35,9 @@ class TestCLI:
             max_attempts=3,
             retry_backoff_seconds=0,
             retry_error_kinds="transient,unknown",
+            # sharding (single process)
+            shard_count=1,
+            shard_index=0,
         )
 
         mock_engine = mock_engine_cls.return_value
@@ -74,9 +77,89 @@ class TestCLI:
             max_attempts=3,
             retry_backoff_seconds=0,
             retry_error_kinds="transient,unknown",
+            # sharding (single process)
+            shard_count=1,
+            shard_index=0,
         )
 
         main()
 
         mock_engine = mock_engine_cls.return_value
         assert mock_engine.ocr.call_count == 2
+
+
+def test_sha256_prefetch_returns_hashes_in_order(tmp_path):
+    from ocr_gemini.cli import _Sha256Prefetch
+    from ocr_gemini.files import sha256_file
+
+    paths = []
+    for n in range(5):
+        p = tmp_path / f"{n}.png"
+        p.write_bytes(bytes([n]) * 10)
+        paths.append(p)
+
+    for depth in (0, 2):
+        pre = _Sha256Prefetch(paths, depth)
+        try:
+            # skipping an index (e.g. `continue` in the loop) must not break later lookups
+            got = [pre.get(i) for i in (0, 1, 3)]
+            # the skipped index 2 is dropped, not kept until close()
+            assert all(k > 3 for k in pre._futures)
+            got.append(pre.get(4))
+        finally:
+            pre.close()
+        assert got == [sha256_file(paths[i]) for i in (0, 1, 3, 4)]
+
+
+def test_write_text_via_dir_fd_matches_path_write(tmp_path):
+    import os
+
+    from ocr_gemini.cli import _open_dir_fd, _write_text
+
+    fd = _open_dir_fd(tmp_path)
+    try:
+        out = _write_text(str(tmp_path), fd, "a.txt", "zażółć\n" * 3)
+        _write_text(str(tmp_path), fd, "a.txt", "krótszy")  # O_TRUNC: no stale tail
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+    assert out == str(tmp_path / "a.txt")
+    assert (tmp_path / "a.txt").read_text(encoding="utf-8") == "krótszy"
+    assert _write_text(str(tmp_path), None, "b.txt", "x") == str(tmp_path / "b.txt")
+    assert (tmp_path / "b.txt").read_text(encoding="utf-8") == "x"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.txt", "b.txt"]  # no .tmp leftovers
+
+
+def test_preflight_batches_prefetched_images_and_propagates_errors(tmp_path):
+    from pathlib import Path
+
+    import pytest
+
+    from ocr_gemini.cli import _Preflight
+
+    images = [Path(f"/x/{n}.png") for n in range(4)]
+
+    class ReadyHashes:
+        def ready(self, i):
+            return True
+
+        def get(self, i):
+            return f"h{i}"
+
+    repo = MagicMock()
+    repo.bulk_get_or_create_documents.side_effect = lambda rows: {p: n for n, (p, _) in enumerate(rows, 100)}
+    repo.bulk_get_latest_runs.return_value = {101: {"run_id": 7, "status": "done"}}
+
+    pre = _Preflight(repo, images, ReadyHashes(), "pipe", skip=lambda p: p.name == "2.png", max_batch=3)
+    assert pre.get(0) == (100, None)
+    assert pre.get(1) == (101, {"run_id": 7, "status": "done"})
+    # one round trip for images 0, 1, 3 (2 skipped)
+    assert repo.bulk_get_or_create_documents.call_count == 1
+    assert [p for p, _ in repo.bulk_get_or_create_documents.call_args[0][0]] == ["/x/0.png", "/x/1.png", "/x/3.png"]
+
+    repo.bulk_get_or_create_documents.side_effect = RuntimeError("db down")
+    pre = _Preflight(repo, images, ReadyHashes(), "pipe", skip=lambda p: False, max_batch=2)
+    for i in (0, 1):
+        with pytest.raises(RuntimeError, match="db down"):
+            pre.get(i)
@@ -1,89 +1,89 @@
 
+import tempfile
 import unittest
-from unittest.mock import MagicMock, patch
 from pathlib import Path
-from ocr_gemini.cli import _scan_images
+from ocr_gemini.cli import _is_image_name, _scan_images
 
 class TestFileOrdering(unittest.TestCase):
     def test_scan_images_non_recursive_ordering_and_limit(self):
         """
         Verify that _scan_images sorts files alphabetically before applying limit (non-recursive).
         """
-        input_dir = Path("/tmp/fake_dir")
-
-        # Patch is_file on the class, not instance
-        with patch.object(Path, 'exists', return_value=True), \
-             patch.object(Path, 'is_dir', return_value=True), \
-             patch.object(Path, 'is_file', return_value=True), \
-             patch.object(Path, 'iterdir') as mock_iterdir:
-
-            # Create real paths
-            files = [
-                Path("/tmp/fake_dir/z_image.png"),
-                Path("/tmp/fake_dir/a_image.jpg"),
-                Path("/tmp/fake_dir/m_image.png")
-            ]
-
-            # Simulate iterdir returning them in unsorted order
-            mock_iterdir.return_value = files # Z, A, M
+        with tempfile.TemporaryDirectory() as tmp:
+            input_dir = Path(tmp)
+            # created in unsorted order: Z, A, M (+ a non-image and a directory named like an image)
+            for name in ("z_image.png", "a_image.jpg", "m_image.png", "notes.txt"):
+                (input_dir / name).write_bytes(b"x")
+            (input_dir / "b_dir.png").mkdir()
 
             # Call with limit 2
             result = _scan_images(input_dir, recursive=False, limit=2)
 
             # Expected: Sorted [A, M, Z], then limit 2 -> [A, M]
-            # Path sorting is based on path string.
-            # /tmp/fake_dir/a_image.jpg
-            # /tmp/fake_dir/m_image.png
-            # /tmp/fake_dir/z_image.png
-
             self.assertEqual(len(result), 2)
             self.assertEqual(result[0].name, "a_image.jpg")
             self.assertEqual(result[1].name, "m_image.png")
+            self.assertEqual(result[0], input_dir / "a_image.jpg")
+
+            self.assertEqual(
+                [p.name for p in _scan_images(input_dir, recursive=False, limit=0)],
+                ["a_image.jpg", "m_image.png", "z_image.png"],
+            )
 
     def test_scan_images_recursive_ordering_and_limit(self):
         """
         Verify that _scan_images sorts files alphabetically before applying limit (recursive).
         """
-        input_dir = Path("/tmp/fake_dir")
-
-        with patch.object(Path, 'exists', return_value=True), \
-             patch.object(Path, 'is_dir', return_value=True), \
-             patch("os.walk") as mock_walk:
+        with tempfile.TemporaryDirectory() as tmp:
+            input_dir = Path(tmp)
 
-            # Mock os.walk structure
             # Structure:
-            # /tmp/fake_dir
             #   - z.png
             #   /sub1
             #     - c.png
             #   /sub2
             #     - a.png
+            for rel in ("z.png", "sub2/a.png", "sub1/c.png"):
+                f = input_dir / rel
+                f.parent.mkdir(parents=True, exist_ok=True)
+                f.write_bytes(b"")
 
-            # os.walk yield order could be anything.
-            mock_walk.return_value = [
-                ("/tmp/fake_dir", ["sub1", "sub2"], ["z.png"]),
-                ("/tmp/fake_dir/sub2", [], ["a.png"]),
-                ("/tmp/fake_dir/sub1", [], ["c.png"]),
-            ]
-
-            # Call with limit 2
-            result = _scan_images(input_dir, recursive=True, limit=2)
-
-            # Paths found:
-            # /tmp/fake_dir/z.png
-            # /tmp/fake_dir/sub2/a.png
-            # /tmp/fake_dir/sub1/c.png
-
-            # Sorted order (lexicographical):
-            # /tmp/fake_dir/sub1/c.png  (sub1 < sub2 < z.png)
-            # /tmp/fake_dir/sub2/a.png
-            # /tmp/fake_dir/z.png
-
+            # Sorted order (lexicographical): sub1/c.png < sub2/a.png < z.png
             # Limit 2 -> sub1/c.png, sub2/a.png
+            result = _scan_images(input_dir, recursive=True, limit=2)
 
             self.assertEqual(len(result), 2)
             self.assertEqual(result[0].name, "c.png")
             self.assertEqual(result[1].name, "a.png")
 
+    def test_scan_images_recursive_matches_global_string_sort(self):
+        """
+        Early stop must not change the order: the walk has to match sorted(str(path)).
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            input_dir = Path(tmp)
+            for rel in (
+                "a.png", "a/b.png", "a-b.png", "a.b/c.jpg", "ab/d.png",
+                "B.png", "x/.hidden/h.png", ".git/g.png", "notes.txt",
+            ):
+                f = input_dir / rel
+                f.parent.mkdir(parents=True, exist_ok=True)
+                f.write_bytes(b"")
+
+            full = _scan_images(input_dir, recursive=True, limit=0)
+            self.assertEqual(full, sorted(full, key=str))
+            self.assertEqual(len(full), 6)
+            self.assertNotIn("h.png", [p.name for p in full])
+            self.assertNotIn("g.png", [p.name for p in full])
+
+            self.assertEqual(_scan_images(input_dir, recursive=True, limit=3), full[:3])
+
+    def test_is_image_name_matches_path_suffix_rule(self):
+        from ocr_gemini.cli import IMAGE_EXTS
+
+        names = ["a.png", "A.PNG", "b.JpEg", "c.tif.txt", ".png", ".x.png", "noext", "d.webp", "e.gif", "f."]
+        for name in names:
+            self.assertEqual(_is_image_name(name), Path(name).suffix.lower() in IMAGE_EXTS, name)
+
 if __name__ == '__main__':
     unittest.main()
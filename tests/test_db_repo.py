@@ -12,8 +12,8 @@ def mock_db_config():
 
 @pytest.fixture
 def mock_connect():
-    # ✅ patch where it's USED (module under test), not global psycopg2
-    with patch("ocr_gemini.db.repo.psycopg2.connect") as m:
+    # ✅ patch where it's USED: OcrRepo connects through psycopg2.pool
+    with patch("psycopg2.pool.psycopg2.connect") as m:
         yield m
 
 
@@ -37,17 +37,47 @@ def test_get_or_create_document(mock_db_config, mock_connect):
     assert "INSERT INTO ocr_document" in mock_cursor.execute.call_args[0][0]
 
 
+def test_get_or_create_document_unchanged_sha_falls_back_to_select(mock_db_config, mock_connect):
+    repo = OcrRepo(mock_db_config)
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.side_effect = [None, [123]]
+
+    assert repo.get_or_create_document("/tmp/foo.jpg", "abc") == 123
+
+    upsert, select = [c[0][0] for c in mock_cursor.execute.call_args_list]
+    assert "IS DISTINCT FROM EXCLUDED.source_sha256" in upsert
+    assert select.startswith("SELECT doc_id FROM ocr_document")
+
+
 def test_has_successful_run(mock_db_config, mock_connect):
     repo = OcrRepo(mock_db_config)
     mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
 
-    mock_cursor.fetchone.return_value = [1]
+    mock_cursor.fetchone.return_value = (True,)
     assert repo.has_successful_run(1, "pipe") is True
+    assert "SELECT EXISTS" in mock_cursor.execute.call_args[0][0]
+
+    mock_cursor.fetchone.return_value = (False,)
+    assert repo.has_successful_run(1, "pipe") is False
 
     mock_cursor.fetchone.return_value = None
     assert repo.has_successful_run(1, "pipe") is False
 
 
+def test_get_latest_run_single_query(mock_db_config, mock_connect):
+    repo = OcrRepo(mock_db_config)
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+
+    mock_cursor.fetchone.return_value = (10, "failed", None, "transient")
+    assert repo.get_latest_run(1, "pipe") == {"run_id": 10, "status": "failed", "attempt_no": 1, "error_kind": "transient"}
+    mock_cursor.execute.assert_called_once()
+    assert mock_cursor.execute.call_args[0][1] == (1, "pipe")
+
+    # other pipeline / no runs -> no row
+    mock_cursor.fetchone.return_value = None
+    assert repo.get_latest_run(1, "other") is None
+
+
 def test_create_run(mock_db_config, mock_connect):
     repo = OcrRepo(mock_db_config)
     mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
@@ -58,3 +88,151 @@ def test_create_run(mock_db_config, mock_connect):
 
     # check calls: update doc, insert run
     assert mock_cursor.execute.call_count == 2
+
+
+def test_get_done_source_paths(mock_db_config, mock_connect):
+    repo = OcrRepo(mock_db_config)
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = [("/a.jpg",), ("/b.jpg",)]
+
+    assert repo.get_done_source_paths("pipe") == {"/a.jpg", "/b.jpg"}
+    mock_cursor.execute.assert_called_once()
+    assert mock_cursor.execute.call_args[0][1] == ("pipe",)
+
+
+def test_bulk_get_or_create_documents(mock_db_config, mock_connect):
+    repo = OcrRepo(mock_db_config)
+    with patch("ocr_gemini.db.repo.execute_values", return_value=[("/a.jpg", 1), ("/b.jpg", 2)]) as ev:
+        assert repo.bulk_get_or_create_documents([("/a.jpg", "h1"), ("/b.jpg", "h2")]) == {"/a.jpg": 1, "/b.jpg": 2}
+    assert ev.call_count == 1
+    assert "ON CONFLICT (source_path)" in ev.call_args[0][1]
+    assert repo.bulk_get_or_create_documents([]) == {}
+
+
+def test_bulk_get_or_create_documents_selects_unchanged(mock_db_config, mock_connect):
+    repo = OcrRepo(mock_db_config)
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = [("/b.jpg", 2)]
+    with patch("ocr_gemini.db.repo.execute_values", return_value=[("/a.jpg", 1)]):
+        assert repo.bulk_get_or_create_documents([("/a.jpg", "h1"), ("/b.jpg", "h2")]) == {"/a.jpg": 1, "/b.jpg": 2}
+    assert mock_cursor.execute.call_args[0][1] == (["/b.jpg"],)
+
+
+def test_bulk_get_latest_runs(mock_db_config, mock_connect):
+    repo = OcrRepo(mock_db_config)
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = [(1, 10, "done", None, None), (2, 20, "failed", 2, "transient")]
+
+    runs = repo.bulk_get_latest_runs([1, 2, 3], "pipe")
+
+    assert runs[1] == {"run_id": 10, "status": "done", "attempt_no": 1, "error_kind": None}
+    assert runs[2]["error_kind"] == "transient"
+    assert 3 not in runs
+    mock_cursor.execute.assert_called_once()
+
+
+def test_start_run_single_statement_and_commit(mock_db_config, mock_connect):
+    repo = OcrRepo(mock_db_config)
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = [55]
+
+    assert repo.start_run(1, "pipe", attempt_no=2, parent_run_id=9) == 55
+    prepare, execute = [c[0] for c in mock_cursor.execute.call_args_list]
+    assert prepare[0].startswith("PREPARE ocr_start_run")
+    assert "INSERT INTO ocr_run" in prepare[0] and "INSERT INTO ocr_step" in prepare[0]
+    assert execute == ("EXECUTE ocr_start_run (%s, %s, %s, %s, %s)", ("pipe", None, 1, 2, 9))
+    mock_connect.return_value.commit.assert_called_once()
+
+
+def test_finish_run_with_steps_single_statement(mock_db_config, mock_connect):
+    repo = OcrRepo(mock_db_config)
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+
+    repo.finish_run(55, "failed", error_message="boom", error_kind="transient",
+                    steps=[("engine_finish", "failed", "boom")])
+
+    prepare, execute = [c[0] for c in mock_cursor.execute.call_args_list]
+    assert "UPDATE ocr_run" in prepare[0] and "INSERT INTO ocr_step" in prepare[0]
+    assert "($6, $7, $8)" in prepare[0]
+    assert execute[1] == ("failed", "boom", None, "transient", 55, "engine_finish", "failed", "boom")
+    mock_connect.return_value.commit.assert_called_once()
+
+
+def test_hot_statements_prepared_once_per_connection(mock_db_config, mock_connect):
+    repo = OcrRepo(mock_db_config)
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+    mock_connect.return_value.closed = 0
+
+    repo.mark_run_status(1, "processing")
+    repo.mark_run_status(1, "failed", error_kind="transient")
+
+    sqls = [c[0][0] for c in mock_cursor.execute.call_args_list]
+    assert sum(s.startswith("PREPARE ocr_mark_run_status") for s in sqls) == 1
+    assert sqls[1:] == ["EXECUTE ocr_mark_run_status (%s, %s, %s, %s, %s, %s, %s)"] * 2
+
+    # reconnect -> fresh session, statements are PREPAREd again
+    mock_connect.return_value.closed = 1
+    repo.connect()
+    mock_connect.return_value.closed = 0
+    repo.mark_run_status(1, "done")
+    sqls = [c[0][0] for c in mock_cursor.execute.call_args_list]
+    assert sum(s.startswith("PREPARE ocr_mark_run_status") for s in sqls) == 2
+
+
+def test_mark_step_buffers_and_flushes_with_copy(mock_db_config, mock_connect):
+    repo = OcrRepo(mock_db_config)
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+    mock_connect.return_value.closed = 0
+    copied = []
+    mock_cursor.copy_expert.side_effect = lambda sql, f: copied.append((sql, f.read()))
+
+    repo.mark_step(7, "recover_refresh", "started")
+    repo.mark_step(7, "recover_refresh", "failed", error_message='boom, "quoted"')
+    assert mock_connect.call_count == 0  # nothing sent yet
+
+    repo.finish_run(7, "failed", error_kind="transient")
+
+    assert len(copied) == 1
+    sql, data = copied[0]
+    assert sql.startswith("COPY ocr_step (run_id, step_name, status, error_message, created_at)")
+    rows = data.splitlines()
+    assert rows[0].startswith("7,recover_refresh,started,,")
+    assert rows[1].startswith('7,recover_refresh,failed,"boom, ""quoted""",')
+    # steps go out before the run update, in the same transaction
+    assert mock_cursor.execute.call_args[0][0].startswith("EXECUTE ocr_finish_run_0")
+    mock_connect.return_value.commit.assert_called_once()
+
+    repo.mark_step(8, "recover_refresh", "started")
+    repo.rollback()
+    repo.commit()
+    assert len(copied) == 1  # rolled back steps are dropped
+
+def test_reads_use_separate_autocommit_pool(mock_db_config, mock_connect):
+    from unittest.mock import MagicMock
+
+    conns = []
+
+    def _new_conn(*_a, **_kw):
+        c = MagicMock()
+        c.closed = 0
+        conns.append(c)
+        return c
+
+    mock_connect.side_effect = _new_conn
+    repo = OcrRepo(mock_db_config)
+
+    repo.get_done_source_paths("pipe")
+    repo.get_done_source_paths("pipe")
+    assert len(conns) == 1  # read connection returned to the pool and reused
+    assert conns[0].autocommit is True
+
+    repo.start_run(1, "pipe")
+    assert len(conns) == 2
+    assert repo.conn is conns[1]
+    assert conns[1].autocommit is False
+    conns[1].commit.assert_called_once()
+    conns[0].commit.assert_not_called()
+
+    repo.close()
+    assert repo.conn is None
+    assert all(c.close.called for c in conns)
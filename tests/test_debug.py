@@ -4,7 +4,7 @@ from unittest.mock import MagicMock
 
 import pytest
 
-from ocr_gemini.debug import save_debug_artifacts
+from ocr_gemini.debug import _safe_label, save_debug_artifacts
 
 
 @pytest.fixture
@@ -49,10 +49,24 @@ def test_save_debug_artifacts_success(temp_debug_dir):
     page.content.assert_called_once()
     page.screenshot.assert_called_once()
 
-    # Verify screenshot path argument
+    # Verify screenshot path argument (viewport JPEG by default)
     args, kwargs = page.screenshot.call_args
     assert "test_label" in str(kwargs['path'])
-    assert ".png" in str(kwargs['path'])
+    assert str(kwargs['path']).endswith(".jpg")
+    assert kwargs['full_page'] is False
+    assert kwargs['type'] == "jpeg" and kwargs['quality'] == 60
+
+
+def test_save_debug_artifacts_full_page_opt_in(temp_debug_dir, monkeypatch):
+    monkeypatch.setenv("OCR_GEMINI_DEBUG_FULL", "1")
+    page = MagicMock()
+    page.content.return_value = ""
+
+    save_debug_artifacts(page, temp_debug_dir, "full")
+
+    kwargs = page.screenshot.call_args.kwargs
+    assert str(kwargs['path']).endswith(".png")
+    assert kwargs == {"path": kwargs['path'], "full_page": True}
 
 
 def test_save_debug_artifacts_sanitization(temp_debug_dir):
@@ -88,3 +102,21 @@ def test_save_debug_artifacts_duck_typing(temp_debug_dir):
     files = list(temp_debug_dir.iterdir())
     assert len(files) == 1
     assert files[0].suffix == ".txt"
+
+
+@pytest.mark.parametrize("label", ["send_click_failed_1", "bad/label with spaces & stuff" * 5, "", "&&", "żółw-ok.1"])
+def test_safe_label_matches_isalnum_rule(label):
+    expected = "".join(c for c in label if c.isalnum() or c in "._-")[:50] or "unknown"
+    assert _safe_label(label) == expected
+
+
+def test_save_debug_artifacts_write_errors_are_reported(temp_debug_dir, capsys):
+    page = MagicMock()
+    page.content.return_value = 123  # write_text on the writer thread fails
+    page.url = "http://example.com"
+
+    save_debug_artifacts(page, temp_debug_dir, "bad_html")
+
+    assert "Failed to save debug HTML" in capsys.readouterr().out
+    assert [f.suffix for f in temp_debug_dir.iterdir()] == [".txt"]
+    page.screenshot.assert_called_once()
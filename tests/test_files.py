@@ -1,7 +1,7 @@
 from pathlib import Path
 import pytest
 
-from ocr_gemini.files import iter_files, sha256_file
+from ocr_gemini.files import is_image_file, iter_files, sha256_file, with_sha256
 
 
 def _touch(p: Path, content: bytes = b"x") -> None:
@@ -21,6 +21,21 @@ def test_sha256_file_is_deterministic(tmp_path: Path):
     assert len(h1) == 64
 
 
+def test_sha256_file_matches_hashlib_and_tracks_changes(tmp_path: Path):
+    import hashlib
+    import os
+
+    f = tmp_path / "a.bin"
+    _touch(f, b"hello")
+    assert sha256_file(f) == hashlib.sha256(b"hello").hexdigest()
+
+    # inna treść + inny mtime -> nowy klucz memo, nowy hash
+    _touch(f, b"hello world")
+    st = f.stat()
+    os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert sha256_file(f) == hashlib.sha256(b"hello world").hexdigest()
+
+
 def _paths(files):
     # iter_files zwraca Path albo DiscoveredFile(path=...)
     return [getattr(x, "path", x) for x in files]
@@ -66,3 +81,72 @@ def test_iter_files_skips_non_files(tmp_path: Path, recursive: bool):
     files = _paths(iter_files(tmp_path, recursive=recursive))
 
     assert all(p.is_file() for p in files)
+
+
+def test_sha256_file_uses_persistent_hash_cache(tmp_path: Path, monkeypatch):
+    from ocr_gemini import _hashcache, files
+
+    f = tmp_path / "a.bin"
+    _touch(f, b"hello")
+    st = f.stat()
+
+    _hashcache.open_cache(tmp_path / "cache.sqlite")
+    try:
+        digest = sha256_file(f)
+        assert _hashcache.get(str(f), st.st_size, st.st_mtime_ns) == digest
+        # inny rozmiar/mtime -> brak trafienia
+        assert _hashcache.get(str(f), st.st_size + 1, st.st_mtime_ns) is None
+
+        # nowy proces: pusty memo, trafienie z sqlite bez czytania pliku
+        monkeypatch.setattr(files, "_SHA_MEMO", {})
+        _hashcache.put(str(f), st.st_size, st.st_mtime_ns, "cached")
+        assert sha256_file(f) == "cached"
+    finally:
+        _hashcache.close()
+
+    assert not _hashcache.is_open()
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_with_sha256_keeps_input_order(tmp_path: Path, workers: int):
+    import hashlib
+
+    for n in range(10):
+        _touch(tmp_path / f"{n:02d}.jpg", bytes([n]) * (n + 1))
+
+    items = list(iter_files(tmp_path, recursive=False))
+    hashed = list(with_sha256(iter(items), workers=workers))
+
+    assert [h.path for h in hashed] == [i.path for i in items]
+    assert [h.sha256 for h in hashed] == [hashlib.sha256(h.path.read_bytes()).hexdigest() for h in hashed]
+
+    # early stop (e.g. limit) must not hang on pending work
+    gen = with_sha256(iter(items), workers=workers)
+    assert next(gen).path == items[0].path
+    gen.close()
+
+
+def test_is_image_file_extension_rules(tmp_path: Path):
+    _touch(tmp_path / "a.JPG")
+    _touch(tmp_path / "b.txt")
+    _touch(tmp_path / ".png")
+
+    assert is_image_file(tmp_path / "a.JPG")
+    assert not is_image_file(tmp_path / "b.txt")
+    assert not is_image_file(tmp_path / ".png")
+    assert is_image_file(tmp_path / "b.txt", exts=(".TXT",))
+    assert [p.name for p in _paths(iter_files(tmp_path, recursive=False))] == ["a.JPG"]
+
+
+def test_iter_files_recursive_order_and_rel_paths(tmp_path: Path):
+    for rel in ("b.jpg", "A/z.jpg", "A/deep/x.png", "a.png", "c/y.jpg"):
+        _touch(tmp_path / rel)
+
+    files = list(iter_files(tmp_path, recursive=True))
+
+    # per-directory name.lower() order, subdirectories entered where they sort
+    assert [str(f.rel_path) for f in files] == [
+        str(Path(r)) for r in ("A/deep/x.png", "A/z.jpg", "a.png", "b.jpg", "c/y.jpg")
+    ]
+    assert all(f.path == tmp_path.resolve() / f.rel_path for f in files)
+    assert [f.file_name for f in iter_files(tmp_path, recursive=True, limit=2)] == ["x.png", "z.jpg"]
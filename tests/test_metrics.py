@@ -71,3 +71,14 @@ def test_str_contains_key_fields(monkeypatch):
     assert "attempts=3" in s
     assert "duration=" in s
     assert "reason=bad_ui_state" in s
+
+
+def test_as_dict_matches_dataclass_fields():
+    from dataclasses import asdict
+
+    m = DocumentMetrics(file_name="e.jpg", start_ts=1.0)
+    m.attempts = 1
+    m.finish(outcome="success")
+
+    assert m.as_dict() == asdict(m)
+    assert list(m.as_dict()) == list(asdict(m))
@@ -70,3 +70,21 @@ def test_write_outputs_creates_expected_files(tmp_path: Path):
     assert result_txt.read_text(encoding="utf-8") == text
     assert json.loads(result_json.read_text(encoding="utf-8")) == data_json
     assert json.loads(meta_json.read_text(encoding="utf-8")) == meta
+
+
+def test_write_json_is_atomic_and_matches_stdlib_layout(tmp_path: Path, monkeypatch):
+    from ocr_gemini import output
+
+    data = {"text": "Zażółć gęślą jaźń", "n": 1, "nested": {"a": [1, 2]}}
+    p = tmp_path / "x.json"
+
+    output.write_json(p, data)
+    fast = p.read_text(encoding="utf-8")
+
+    # fallback bez orjson daje ten sam układ pliku
+    monkeypatch.setattr(output, "orjson", None)
+    output.write_json(p, data)
+
+    assert p.read_text(encoding="utf-8") == fast
+    assert json.loads(fast) == data
+    assert [x.name for x in tmp_path.iterdir()] == ["x.json"]
@@ -95,8 +95,9 @@ def test_pipeline_smoke(monkeypatch, tmp_path: Path):
     assert processed == 2
 
     # dla każdego pliku:
-    # - 2x upsert_document (processing + done)
-    assert len(fake_db.documents) == 4
+    # - 1x upsert_document (od razu 'done'; 'processing' w tej samej transakcji nic nie dawał)
+    assert len(fake_db.documents) == 2
+    assert all(d["status"] == "done" for d in fake_db.documents)
 
     # - 1x entry
     assert len(fake_db.entries) == 2
@@ -128,3 +129,80 @@ def test_pipeline_smoke(monkeypatch, tmp_path: Path):
     if "stage" in ocr:
         assert isinstance(ocr["stage"], str)
 
+
+
+class SavepointDbWriter(FakeDbWriter):
+    def __init__(self):
+        super().__init__()
+        self.savepoints = 0
+        self.releases = 0
+        self.rollbacks_to_savepoint = 0
+
+    def savepoint(self):
+        self.savepoints += 1
+
+    def release_savepoint(self):
+        self.releases += 1
+
+    def rollback_to_savepoint(self):
+        self.rollbacks_to_savepoint += 1
+
+
+def test_pipeline_commit_every_batches_and_keeps_earlier_files_on_error(monkeypatch, tmp_path: Path):
+    monkeypatch.setattr("ocr_gemini.pipeline.iter_files", fake_iter_files)
+    monkeypatch.setattr("ocr_gemini.pipeline.with_sha256", fake_with_sha256)
+
+    written = []
+
+    def write_outputs_fail_on_b(**kwargs):
+        written.append(kwargs["file_name"])
+        if kwargs["file_name"] == "b.jpg" and kwargs["text"] is not None:
+            raise RuntimeError("disk full (simulated)")
+        return fake_write_outputs(**kwargs)
+
+    monkeypatch.setattr("ocr_gemini.pipeline.write_outputs", write_outputs_fail_on_b)
+
+    fake_db = SavepointDbWriter()
+    cfg = PipelineConfig(
+        ocr_root=tmp_path / "in",
+        out_root=tmp_path / "out",
+        prompt_id="test-prompt",
+        commit_every=50,
+    )
+
+    with pytest.raises(RuntimeError, match="disk full"):
+        Pipeline(cfg, db_writer=fake_db).run()
+
+    # a.jpg jest w paczce; błąd b.jpg cofa tylko do jego savepointu, a run() commituje paczkę
+    assert fake_db.savepoints == 2
+    assert fake_db.releases == 1  # jeden udany plik (a.jpg)
+    assert fake_db.rollbacks_to_savepoint == 1
+    assert fake_db.rollbacks == 0
+    assert fake_db.commits == 1
+    assert len(fake_db.entries) == 1
+
+
+def test_pipeline_failed_pending_commit_does_not_hide_original_error(monkeypatch, tmp_path: Path):
+    monkeypatch.setattr("ocr_gemini.pipeline.iter_files", fake_iter_files)
+    monkeypatch.setattr("ocr_gemini.pipeline.with_sha256", fake_with_sha256)
+
+    def write_outputs_fail_on_b(**kwargs):
+        if kwargs["file_name"] == "b.jpg" and kwargs["text"] is not None:
+            raise RuntimeError("disk full (simulated)")
+        return fake_write_outputs(**kwargs)
+
+    monkeypatch.setattr("ocr_gemini.pipeline.write_outputs", write_outputs_fail_on_b)
+
+    class DeadConnectionDbWriter(SavepointDbWriter):
+        def commit(self):
+            raise ConnectionError("server closed the connection unexpectedly")
+
+    cfg = PipelineConfig(
+        ocr_root=tmp_path / "in",
+        out_root=tmp_path / "out",
+        prompt_id="test-prompt",
+        commit_every=50,
+    )
+
+    with pytest.raises(RuntimeError, match="disk full"):
+        Pipeline(cfg, db_writer=DeadConnectionDbWriter()).run()
@@ -29,6 +29,22 @@ class TestPlaywrightEngine:
         engine.stop()
         engine.session.stop.assert_called_once()
 
+    def test_start_warms_up_gemini(self, mock_session):
+        engine = PlaywrightEngine(profile_dir=Path("/tmp"))
+        page = engine.session.page
+        page.url = "about:blank"
+
+        engine.start()
+        page.goto.assert_called_once_with(
+            "https://gemini.google.com/app", timeout=60000, wait_until="domcontentloaded"
+        )
+
+        # warm-up failure must not abort start(); ocr() navigates again later
+        page.goto.reset_mock()
+        page.goto.side_effect = RuntimeError("net::ERR_NAME_NOT_RESOLVED")
+        engine.start()
+        page.goto.assert_called_once()
+
     def test_ocr_flow(self, mock_session, mock_actions):
         engine = PlaywrightEngine(profile_dir=Path("/tmp"))
         # Mock page
@@ -2,7 +2,7 @@ import pytest
 from pathlib import Path
 
 from ocr_gemini.engine.errors import classify_error, ErrorKind
-from ocr_gemini.engine.retry_logic import decide_retry_action
+from ocr_gemini.engine.retry_logic import backoff_delay, decide_retry_action
 from ocr_gemini.config import PipelineConfig
 
 
@@ -160,3 +160,25 @@ def test_decide_skipped_no_flags(base_cfg):
     last_run = {"status": "skipped", "attempt_no": 1, "error_kind": None, "run_id": 10}
     action = decide_retry_action(last_run, base_cfg)
     assert action["should_process"] is False
+
+
+def test_parse_error_kinds_into_frozenset():
+    from ocr_gemini.engine.errors import parse_error_kinds
+
+    kinds = parse_error_kinds(" Transient, unknown ,bogus,")
+    assert kinds == frozenset({ErrorKind.TRANSIENT, ErrorKind.UNKNOWN})
+    # str Enum: plain DB strings still match
+    assert "transient" in kinds
+    assert "permanent" not in kinds
+
+
+def test_config_normalizes_retry_error_kinds(base_cfg):
+    assert base_cfg.retry_error_kinds == frozenset({ErrorKind.TRANSIENT, ErrorKind.UNKNOWN})
+
+
+def test_backoff_delay_exponential_with_jitter_and_cap():
+    no_jitter = dict(max_delay=30.0, jitter=0.5, rand=lambda: 0.0)
+    assert [backoff_delay(1.0, n, **no_jitter) for n in range(4)] == [1.0, 2.0, 4.0, 8.0]
+    assert backoff_delay(1.0, 10, **no_jitter) == 30.0
+    assert backoff_delay(2.0, 1, max_delay=30.0, jitter=0.5, rand=lambda: 1.0) == 6.0
+    assert backoff_delay(0, 3, **no_jitter) == 0.0